@@ -0,0 +1,235 @@
+# analytics.py
+#
+# Whole-chain balance and supply analytics on columnar NumPy arrays. The confirmed transactions
+# are loaded once into parallel arrays (sender id, recipient id, amount, block position); every
+# address's balance, supply over height and per-block volume are then vectorized passes over
+# those arrays instead of a lookup or scan per address. Later blocks are appended incrementally.
+#
+# NumPy is only needed here: the rest of the simulator runs without it, and ChainAnalytics raises
+# RuntimeError if it is missing (ANALYTICS_AVAILABLE tells callers up front).
+
+from array import array
+
+try:
+    import numpy as np
+except ImportError: # Optional dependency
+    np = None
+
+from utils.addresses import address_of
+from utils.amounts import to_units
+from utils.tx_columns import TransactionColumns
+
+ANALYTICS_AVAILABLE = np is not None
+# Senders that create coins (mining rewards, faucet grants, initial allocations) rather than move them.
+ISSUING_SENDERS = ("network", "welcome_faucet", "GENESIS_ALLOCATION")
+
+def _transfer_columns(transactions) -> tuple:
+    """(senders, recipients, amounts, fees or None) of a block's transactions, straight from the columns when possible."""
+    if isinstance(transactions, TransactionColumns):
+        return transactions.transfer_columns()
+    fees = [tx.get('fee', 0) for tx in transactions]
+    return ([tx['sender_public_key'] for tx in transactions], [tx['recipient_public_key'] for tx in transactions],
+            [tx['amount'] for tx in transactions], fees if any(fees) else None)
+
+
+class ChainAnalytics:
+    """
+    Columnar snapshot of a chain's confirmed transactions. Amounts are int64 base units and every
+    party is an integer id into self.addresses (PEM keys are folded into their address, as in the
+    balance ledger). Senders pay amount + fee; a block's fees reach its miner inside the mining reward,
+    so they are not counted as newly issued coins. Pending transactions are not included.
+    """
+    def __init__(self):
+        if np is None:
+            raise RuntimeError("Chain analytics need NumPy; install it with 'pip install numpy'.")
+        self._reset()
+
+    def _reset(self):
+        self.addresses: list[str] = []
+        self._address_ids: dict[str, int] = {}
+        self._party_ids: dict[str, int] = {} # Raw party text (PEM or address) -> address id
+        self.height: int = 0 # Number of blocks loaded
+        self.tip_hash: str | None = None
+        self.senders = np.empty(0, dtype=np.int64)
+        self.recipients = np.empty(0, dtype=np.int64)
+        self.amounts = np.empty(0, dtype=np.int64)
+        self.fees = np.empty(0, dtype=np.int64)
+        self.positions = np.empty(0, dtype=np.int64) # Chain position of each transaction's block
+        self._balances = None # Memoized until the next update
+
+    @classmethod
+    def from_blockchain(cls, blockchain) -> 'ChainAnalytics':
+        analytics = cls()
+        analytics.update(blockchain)
+        return analytics
+
+    def _party_id(self, party: str) -> int:
+        party_id = self._party_ids.get(party)
+        if party_id is None:
+            address = address_of(party)
+            party_id = self._address_ids.get(address)
+            if party_id is None:
+                party_id = self._address_ids[address] = len(self.addresses)
+                self.addresses.append(address)
+            self._party_ids[party] = party_id
+        return party_id
+
+    def update(self, blockchain) -> int:
+        """
+        Brings the arrays up to date with blockchain.chain: blocks added since the last update are
+        appended; if the chain no longer extends the loaded one (e.g. it was replaced) everything is
+        reloaded. Returns the number of blocks loaded.
+        """
+        chain = blockchain.chain
+        if self.height and (self.height > len(chain) or chain[self.height - 1].hash != self.tip_hash):
+            self._reset()
+        if self.height == len(chain):
+            return 0
+
+        senders, recipients, amounts, fees, positions = array('q'), array('q'), array('q'), array('q'), array('q')
+        for position in range(self.height, len(chain)):
+            block_senders, block_recipients, block_amounts, block_fees = _transfer_columns(chain[position].transactions)
+            senders.extend(self._party_id(party) for party in block_senders)
+            recipients.extend(self._party_id(party) for party in block_recipients)
+            if isinstance(block_amounts, array):
+                amounts.extend(block_amounts)
+            else:
+                amounts.extend(to_units(amount) for amount in block_amounts) # Legacy float amounts
+            fees.extend(block_fees if block_fees is not None else [0] * len(block_senders))
+            positions.extend([position] * len(block_senders))
+
+        loaded = len(chain) - self.height
+        self.senders = np.concatenate((self.senders, np.frombuffer(senders, dtype=np.int64)))
+        self.recipients = np.concatenate((self.recipients, np.frombuffer(recipients, dtype=np.int64)))
+        self.amounts = np.concatenate((self.amounts, np.frombuffer(amounts, dtype=np.int64)))
+        self.fees = np.concatenate((self.fees, np.frombuffer(fees, dtype=np.int64)))
+        self.positions = np.concatenate((self.positions, np.frombuffer(positions, dtype=np.int64)))
+        self.height, self.tip_hash = len(chain), chain[-1].hash
+        self._balances = None
+        return loaded
+
+    def _issuer_ids(self):
+        return np.array([self._address_ids[sender] for sender in ISSUING_SENDERS if sender in self._address_ids], dtype=np.int64)
+
+    def _issuance_mask(self):
+        """True for transactions that create coins (sent by one of ISSUING_SENDERS)."""
+        return np.isin(self.senders, self._issuer_ids())
+
+    def balances(self):
+        """Confirmed balance of every address id (int64 base units, indexed like self.addresses)."""
+        if self._balances is None:
+            balances = np.zeros(len(self.addresses), dtype=np.int64)
+            np.add.at(balances, self.recipients, self.amounts)
+            np.subtract.at(balances, self.senders, self.amounts + self.fees)
+            self._balances = balances
+        return self._balances
+
+    def holder_ranking(self):
+        """Ids of every holder address (issuers excluded), largest balance first; ties keep address order."""
+        balances = self.balances()
+        order = np.argsort(-balances, kind='stable')
+        return order[~np.isin(order, self._issuer_ids())]
+
+    def ranked_balances(self, start: int = 0, limit: int | None = None) -> tuple[list[dict], int]:
+        """Returns ([{'rank', 'address', 'balance'}, ...], number of holders) for a slice of holder_ranking()."""
+        ranking = self.holder_ranking()
+        selected = ranking[start:] if limit is None else ranking[start:start + limit]
+        balances = self.balances()[selected].tolist()
+        return ([{'rank': start + offset + 1, 'address': self.addresses[address_id], 'balance': balance}
+                 for offset, (address_id, balance) in enumerate(zip(selected.tolist(), balances))], len(ranking))
+
+    def fees_per_block(self):
+        """Fees paid in each block (int64 base units, indexed by chain position)."""
+        fees = np.zeros(self.height, dtype=np.int64)
+        np.add.at(fees, self.positions, self.fees)
+        return fees
+
+    def issued_per_block(self):
+        """Coins created in each block (int64 base units, indexed by chain position): issuing transactions minus the fees paid back out in the reward."""
+        issuance = self._issuance_mask()
+        issued = np.zeros(self.height, dtype=np.int64)
+        np.add.at(issued, self.positions[issuance], self.amounts[issuance])
+        return issued - self.fees_per_block()
+
+    def supply_by_height(self):
+        """Total supply after each block: the running sum of issued_per_block()."""
+        return np.cumsum(self.issued_per_block())
+
+    def volume_per_block(self) -> tuple:
+        """Returns (transaction count, transferred amount) per block; transfers exclude coin issuance."""
+        transfers = ~self._issuance_mask()
+        volume = np.zeros(self.height, dtype=np.int64)
+        np.add.at(volume, self.positions[transfers], self.amounts[transfers])
+        return np.bincount(self.positions, minlength=self.height), volume
+
+    def summary(self) -> dict:
+        issuance = self._issuance_mask()
+        return {
+            'height': self.height,
+            'tip_hash': self.tip_hash,
+            'transactions': int(self.amounts.size),
+            'holders': int(self.holder_ranking().size),
+            'total_supply': int(self.amounts[issuance].sum() - self.fees.sum()),
+            'transfer_volume': int(self.amounts[~issuance].sum()),
+            'fees': int(self.fees.sum())
+        }
+
+    def block_series(self, start: int = 0, limit: int | None = None) -> list[dict]:
+        """Per-block rows for positions start .. start + limit - 1: transaction count, volume, fees, coins issued and supply."""
+        end = self.height if limit is None else min(self.height, start + limit)
+        if start >= end:
+            return []
+        issued = self.issued_per_block()
+        supply = np.cumsum(issued)
+        counts, volume = self.volume_per_block()
+        fees = self.fees_per_block()
+        return [{'block_index': position, 'transactions': count, 'volume': moved, 'fees': paid, 'issued': created, 'supply': total}
+                for position, count, moved, paid, created, total in zip(range(start, end), counts[start:end].tolist(),
+                                                                        volume[start:end].tolist(), fees[start:end].tolist(),
+                                                                        issued[start:end].tolist(), supply[start:end].tolist())]
+
+    def __repr__(self) -> str:
+        return f"ChainAnalytics(height={self.height}, transactions={self.amounts.size}, addresses={len(self.addresses)})"
+
+
+if __name__ == '__main__':
+    from blockchain import Blockchain
+    from transaction import Transaction, new_nonce
+    from utils.amounts import COIN
+    from utils.crypto_utils import generate_key_pair, get_data_to_sign, sign_data
+
+    print("--- Testing ChainAnalytics ---")
+    keys = [generate_key_pair() for _ in range(3)]
+    bc = Blockchain(difficulty=1)
+    bc.create_genesis_block()
+    for private_key, public_key in keys:
+        bc.add_transaction(Transaction("welcome_faucet", public_key, 50 * COIN))
+    bc.mine_pending_transactions(keys[0][1])
+
+    analytics = ChainAnalytics.from_blockchain(bc)
+    (sender_priv, sender_pub), (_priv, recipient_pub) = keys[0], keys[1]
+    amount, fee, nonce = 12_345_678, 1_000, new_nonce()
+    bc.add_transaction(Transaction(sender_pub, recipient_pub, amount, sign_data(sender_priv, get_data_to_sign(sender_pub, recipient_pub, amount, fee, nonce)),
+                                   fee, nonce))
+    bc.mine_pending_transactions(keys[2][1])
+    assert analytics.update(bc) == 1, "Only the new block should be loaded."
+
+    balances = analytics.balances()
+    for _private_key, public_key in keys:
+        address = address_of(public_key)
+        assert balances[analytics.addresses.index(address)] == bc.get_balance(address, include_pending=False)
+    ranked, holders = analytics.ranked_balances()
+    assert holders == 3 and ranked[0]['balance'] >= ranked[1]['balance'] >= ranked[2]['balance']
+    summary = analytics.summary()
+    assert summary['total_supply'] == sum(entry['balance'] for entry in ranked) == 3 * 50 * COIN + 2 * bc.mining_reward
+    assert summary['transfer_volume'] == amount and summary['fees'] == fee and summary['transactions'] == 6
+    series = analytics.block_series()
+    assert [row['supply'] for row in series] == [0, 150 * COIN + bc.mining_reward, summary['total_supply']]
+    assert series[2]['volume'] == amount and series[2]['fees'] == fee and series[2]['transactions'] == 2
+    print(f"Summary: {summary}")
+
+    replaced = Blockchain(difficulty=1)
+    replaced.create_genesis_block()
+    analytics.update(replaced)
+    assert analytics.height == 1 and analytics.summary()['transactions'] == 0, "A replaced chain must be reloaded."
+    print("\nAll ChainAnalytics self-tests passed!")
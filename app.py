@@ -2,20 +2,63 @@
 
 from flask import Flask, render_template, jsonify, request
 from flask_socketio import SocketIO, emit
+from analytics import ANALYTICS_AVAILABLE, ChainAnalytics
+from block import BLOCK_VERSION_LEGACY, BLOCK_VERSIONS
 from blockchain import Blockchain
-from transaction import Transaction
+from miner import create_miner
+from mining_jobs import MiningJobManager
+from persistence import DURABILITY_MODES, PersistenceError, PersistenceScheduler
+from storage import BlockLogStorage
+from transaction import MAX_NONCE, Transaction, new_nonce
+from utils.addresses import address_of
+from utils.amounts import COIN, format_amount, tx_dict_in_units
 from utils.crypto_utils import generate_key_pair, sign_data
 from predefined_users import get_public_user_info, PREDEFINED_USERS_DATA # For initial allocations
+import atexit
+import base64
+import hashlib
 import json
+import multiprocessing
+import os
+import threading
 import traceback
+from werkzeug.routing import PathConverter
+
+class PublicKeyConverter(PathConverter):
+    """Like <path:...>, but also matches newlines so a URL-encoded PEM public key fits in a route."""
+    regex = r'[^/][\s\S]*?'
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'a_very_secure_and_random_secret_key_!@#' # Changed for best practice
+app.url_map.converters['pubkey'] = PublicKeyConverter
 socketio = SocketIO(app, cors_allowed_origins="*")
 
 blockchain = None
-FAUCET_GRANT_AMOUNT = 500.0
-INITIAL_USER_ALLOCATION = 1000.0 # Amount for each predefined user
+chain_analytics = None # ChainAnalytics of the current chain, brought up to date on each /api/stats request
+# All API amounts (request fields, balances, transactions) are integer base units, COIN per coin.
+FAUCET_GRANT_AMOUNT = 500 * COIN
+INITIAL_USER_ALLOCATION = 1000 * COIN # Amount for each predefined user
+DEFAULT_MINING_REWARD = 100 * COIN
+MINING_WORKERS = None # Processes used for Proof-of-Work; None = all CPU cores, 1 = sequential
+MINING_ENGINE = create_miner(MINING_WORKERS) # Shared by every Blockchain instance the app creates
+VALIDATION_WORKERS = os.cpu_count() or 1 # Processes used to verify signatures during chain validation
+# Append-only block log; fsync_policy is "always", "interval" or "never" (see storage.py)
+STORAGE = BlockLogStorage("blockchain_log", fsync_policy="always")
+# When changes reach the block log (see persistence.py): "sync" writes each change before replying,
+# "batched" groups concurrent changes into one write that each reply waits for, "async" replies at once.
+# A group is written after PERSIST_MAX_DELAY_MS or once PERSIST_MAX_PENDING changes are waiting.
+PERSISTENCE_MODE = "batched"
+PERSIST_MAX_DELAY_MS = 10
+PERSIST_MAX_PENDING = 100
+DEFAULT_PAGE_SIZE = 20 # Blocks per page of /api/blocks when no 'limit' is given
+MAX_PAGE_SIZE = 100
+MAX_BATCH_TRANSACTIONS = 1000 # Transactions per /api/blockchain/add-transactions request
+MAX_STATS_PAGE_SIZE = 1000 # Rows per page of the /api/stats/* series (balances, per-block supply and volume)
+# Held while a block is being mined (background mining jobs, faucet grants) or the chain is replaced,
+# so only one block is ever built on the current tip at a time.
+mining_lock = threading.Lock()
+persist_lock = threading.Lock() # Request threads and the mining job thread both persist
+analytics_lock = threading.Lock() # Concurrent /api/stats requests would otherwise extend the same arrays twice
 
 def perform_initial_setup_on_new_chain(bc_instance: Blockchain):
     """
@@ -37,15 +80,11 @@ def perform_initial_setup_on_new_chain(bc_instance: Blockchain):
             signature=None # System transactions don't require signatures from this sender
         )
         allocation_transactions.append(allocation_tx)
-        print(f"  + Staged allocation: {INITIAL_USER_ALLOCATION} coins to {user_data['name']}")
+        print(f"  + Staged allocation: {format_amount(INITIAL_USER_ALLOCATION)} coins to {user_data['name']}")
 
     if not allocation_transactions:
         return
 
-    # Temporarily set these as the only pending transactions for focused mining
-    original_pending_transactions = list(bc_instance.pending_transactions) # Save any existing (should be none for new chain)
-    bc_instance.pending_transactions = allocation_transactions
-
     # Mine these allocation transactions.
     # The miner for these initial setup blocks could be a designated system address,
     # or for simplicity, the first predefined user can "mine" these setup blocks.
@@ -54,70 +93,207 @@ def perform_initial_setup_on_new_chain(bc_instance: Blockchain):
         _, initial_miner_pk = generate_key_pair() # Fallback dummy miner
         print(f"Warning: No predefined user to act as initial miner. Using dummy: {initial_miner_pk[:20]}...")
 
+    # Allocations are mined directly (they never enter the pending pool), in chunks that fit a block
+    # alongside its reward transaction (see max_block_transactions).
     mined_block_count = 0
-    # Assuming mine_pending_transactions creates one block with all pending transactions.
-    # If you had a max_tx_per_block, you'd loop here.
-    if bc_instance.pending_transactions: # Make sure there's something to mine
-        print(f"Mining initial allocation block(s) for {len(bc_instance.pending_transactions)} allocations...")
-        block, _, _ = bc_instance.mine_pending_transactions(initial_miner_pk)
-        if block:
-            mined_block_count += 1
-            print(f"  Mined allocation block #{block.index}")
-        else:
-            print("  ERROR: Failed to mine initial allocation block.")
-    
-    # Restore original pending transactions (should be empty if this is a truly new chain setup)
-    bc_instance.pending_transactions = original_pending_transactions
+    chunk_size = max(1, bc_instance.max_block_transactions - 1)
+    print(f"Mining initial allocation block(s) for {len(allocation_transactions)} allocations...")
+    for start in range(0, len(allocation_transactions), chunk_size):
+        mined_block, _, mine_msg = bc_instance.mine_transactions(allocation_transactions[start:start + chunk_size], initial_miner_pk)
+        if mined_block is None:
+            print(f"  ERROR: Failed to mine every initial allocation: {mine_msg}")
+            break
+        mined_block_count += 1
+        print(f"  Mined allocation block #{mined_block.index}")
     print(f"Initial setup complete. {mined_block_count} allocation block(s) mined.")
 
 
+def write_blockchain():
+    """Appends the current blockchain state to the block log (only new blocks are written); raises IOError if it could not."""
+    with persist_lock:
+        saved, msg = STORAGE.save(blockchain)
+    if not saved:
+        raise IOError(msg)
+
+persistence = PersistenceScheduler(write_blockchain, mode=PERSISTENCE_MODE, max_delay=PERSIST_MAX_DELAY_MS / 1000,
+                                   max_pending=PERSIST_MAX_PENDING)
+atexit.register(persistence.close) # Writes changes still waiting in "async" mode
+
+def persist_blockchain(wait: bool = False):
+    """
+    Records that the chain changed; it is written according to PERSISTENCE_MODE, or before returning if
+    `wait`. Raises PersistenceError if that write failed (the change stays in memory and is retried).
+    """
+    persistence.request_save()
+    if wait:
+        persistence.flush()
+
+@app.errorhandler(PersistenceError)
+def persistence_error(e):
+    # Reaches the client unless the route catches it first (most answer any exception with a 500 too).
+    return jsonify({'success': False, 'error': str(e)}), 500
+
 def init_blockchain():
     global blockchain
     try:
-        blockchain = Blockchain.load_from_file()
+        blockchain = STORAGE.load_or_import_json("blockchain_data.json", miner=MINING_ENGINE)
         if blockchain is None: 
             print("No existing blockchain data found. Creating a new blockchain...")
-            blockchain = Blockchain(difficulty=4) 
+            blockchain = Blockchain(difficulty=4, miner=MINING_ENGINE) 
             blockchain.create_genesis_block()
             perform_initial_setup_on_new_chain(blockchain) # Allocate funds to predefined users
-            blockchain.save_to_file() # Save the newly created chain with allocations
+            persist_blockchain(wait=True) # Save the newly created chain with allocations
         print(f"Blockchain initialized: {blockchain}")
         if blockchain and blockchain.chain:
             print(f"Current chain length: {len(blockchain.chain)} blocks.")
     except Exception as e:
         print(f"CRITICAL ERROR during init_blockchain: {e}. Re-initializing a fresh blockchain.")
         traceback.print_exc()
-        blockchain = Blockchain(difficulty=4)
+        blockchain = Blockchain(difficulty=4, miner=MINING_ENGINE)
         blockchain.create_genesis_block()
         perform_initial_setup_on_new_chain(blockchain) # Also allocate here on fresh creation due to error
-        blockchain.save_to_file()
+        persist_blockchain(wait=True)
         print(f"Fresh blockchain created after error: {blockchain}")
 
-init_blockchain()
+# Signature verification and mining workers (see utils/crypto_utils.py and miner.py) are spawned
+# processes, which import the main module again, and with it this one. They only verify signatures or
+# search nonces and must not load (let alone repair) the block log the server is appending to, so the
+# chain is only set up in the server process.
+SERVER_PROCESS = multiprocessing.parent_process() is None
+if SERVER_PROCESS:
+    init_blockchain()
+
+# --- Socket.IO chain sync protocol ---
+# Clients track the height and tip hash of the chain they hold. Broadcasts carry only the blocks
+# mined since the previous broadcast plus pending-pool changes ("delta"); a client that cannot apply
+# a delta (or has just connected) sends 'sync_request' with its height and tip hash and gets a delta
+# from that height, or a full "snapshot" if its chain does not match ours.
+SYNC_PROTOCOL_VERSION = 2
+last_broadcast_state = {'height': 0, 'tip_hash': None, 'pending_count': 0, 'pending_removals': 0}
+broadcast_lock = threading.Lock() # Keeps last_broadcast_state in step with what was actually sent
+# Sends an event to every connected client: Flask-SocketIO's emit here, the asyncio server's when
+# serving through asgi_server.py (which replaces it). May be called from any thread.
+broadcast = socketio.emit
+
+def is_base_units(value) -> bool:
+    """True for a positive integer amount of base units, the only form API requests may give amounts in."""
+    return isinstance(value, int) and not isinstance(value, bool) and value > 0
+
+def is_fee_units(value) -> bool:
+    """True for a non-negative integer fee in base units."""
+    return isinstance(value, int) and not isinstance(value, bool) and value >= 0
+
+def is_nonce(value) -> bool:
+    """True for a transaction nonce: None (system transactions get one from the node) or an integer from 0 to MAX_NONCE."""
+    return value is None or (isinstance(value, int) and not isinstance(value, bool) and 0 <= value <= MAX_NONCE)
+
+def block_to_payload(b) -> dict:
+    # Blocks stored before amounts became integers keep float coin amounts; clients always get base units.
+    return {'index': b.index, 'timestamp': b.timestamp, 'transactions': [tx_dict_in_units(tx) for tx in b.transactions],
+            'previous_hash': b.previous_hash, 'hash': b.hash, 'nonce': b.nonce,
+            'version': b.version, 'merkle_root': b.merkle_root}
+
+def chain_status(message="", snap=None) -> dict:
+    snap = snap or blockchain.snapshot()
+    return {'blocks': snap.height, 'pending_transactions': len(snap.pending_transactions),
+            'difficulty': blockchain.difficulty, 'mining_reward': blockchain.mining_reward, 'message': message}
+
+def chain_extends(height, tip_hash, snap=None) -> bool:
+    """True if our chain (as of `snap`, default now) contains the client's chain of `height` blocks ending in `tip_hash`."""
+    snap = snap or blockchain.snapshot()
+    if not isinstance(height, int) or height < 0 or height > snap.height: return False
+    return height == 0 or snap.get_block(height - 1).hash == tip_hash
+
+# Payloads are built from one ChainSnapshot so their blocks, pool and status agree even while writers run.
+def build_snapshot_payload(message="", snap=None) -> dict:
+    snap = snap or blockchain.snapshot()
+    return {'protocol': SYNC_PROTOCOL_VERSION, 'type': 'snapshot', 'status': chain_status(message, snap),
+            'height': snap.height, 'tip_hash': snap.tip_hash,
+            'blocks': [block_to_payload(b) for b in snap.get_blocks()],
+            'pending': {'reset': True, 'added': [tx.to_dict() for tx in snap.pending_transactions]}}
+
+def build_delta_payload(from_height, message="", pending_from=None, snap=None) -> dict:
+    """Blocks after `from_height`, and pending transactions after position `pending_from` (None = resend the whole pool)."""
+    snap = snap or blockchain.snapshot()
+    pending = snap.pending_transactions
+    reset_pending = pending_from is None or pending_from > len(pending)
+    added = pending if reset_pending else pending[pending_from:]
+    return {'protocol': SYNC_PROTOCOL_VERSION, 'type': 'delta', 'status': chain_status(message, snap),
+            'from_height': from_height, 'base_hash': snap.get_block(from_height - 1).hash if from_height else None,
+            'height': snap.height, 'tip_hash': snap.tip_hash,
+            'blocks': [block_to_payload(b) for b in snap.get_blocks(from_height)],
+            'pending': {'reset': reset_pending, 'added': [tx.to_dict() for tx in added]}}
+
+def remember_broadcast_state(snap=None):
+    snap = snap or blockchain.snapshot()
+    last_broadcast_state.update(height=snap.height, tip_hash=snap.tip_hash,
+                                pending_count=len(snap.pending_transactions), pending_removals=snap.pending_removals)
 
 def emit_blockchain_update(event_name="blockchain_updated", message=""):
     if blockchain is None: print("Error: Blockchain not initialized for emit."); return
-    status = {'blocks': len(blockchain.chain), 'pending_transactions': len(blockchain.pending_transactions),
-               'difficulty': blockchain.difficulty, 'mining_reward': blockchain.mining_reward, 'message': message}
-    blocks_data = [{'index': b.index, 'timestamp': b.timestamp, 'transactions': b.transactions,
-                    'previous_hash': b.previous_hash, 'hash': b.hash, 'nonce': b.nonce} for b in blockchain.chain]
-    socketio.emit(event_name, {'status': status, 'blocks': blocks_data})
-    print(f"Emitted {event_name}: Blk={status['blocks']}, PendTX={status['pending_transactions']}, Msg='{message}'")
+    with broadcast_lock:
+        snap, prev = blockchain.snapshot(), last_broadcast_state
+        if chain_extends(prev['height'], prev['tip_hash'], snap):
+            # If the pool only grew (nothing mined, evicted or swapped out) just the new tail is sent; otherwise all of it.
+            only_added = snap.height == prev['height'] and snap.pending_removals == prev['pending_removals']
+            pending_from = prev['pending_count'] if only_added else None
+            payload = build_delta_payload(prev['height'], message, pending_from, snap)
+        else:
+            payload = build_snapshot_payload(message, snap) # Chain was replaced (e.g. new chain created)
+        broadcast(event_name, payload)
+        remember_broadcast_state(snap)
+    print(f"Emitted {event_name} ({payload['type']}): Blk={payload['height']}, NewBlk={len(payload['blocks'])}, "
+          f"PendTX={payload['status']['pending_transactions']}, Msg='{message}'")
+
+if SERVER_PROCESS:
+    remember_broadcast_state()
+
+# --- Background mining jobs (see mining_jobs.py) ---
+# /api/blockchain/mine queues a job and returns its id at once. While it runs, 'mining_progress'
+# events carry nonce/hash-rate reports and 'mining_job_updated' events every status change; each
+# mined block is persisted and broadcast as usual. Faucet grants are jobs too (see
+# request_welcome_bonus_api), so no request thread waits for Proof-of-Work.
+def run_mining_job(job):
+    with mining_lock:
+        chain = blockchain # The chain the job mines on, even if it is replaced meanwhile
+        def block_mined(report):
+            mining_jobs.block_mined(job, report)
+            if chain is blockchain:
+                persist_blockchain()
+                emit_blockchain_update(message=f"Block #{report['index']} mined by mining job {job.id[:8]}; "
+                                               f"{report['pending_after']} transaction(s) still pending.")
+        if job.transactions is not None: # A block of its own, e.g. a faucet grant
+            mined_block, duration, message = chain.mine_transactions(job.transactions, job.miner_public_key, job.control)
+            if mined_block is None:
+                return [], message
+            block_mined(chain.block_report(mined_block, duration))
+            return job.blocks[-1:], message
+        return chain.mine_backlog(job.miner_public_key, job.max_blocks, job.control, on_block=block_mined)
+
+def emit_mining_progress(job, report):
+    broadcast('mining_progress', {'job_id': job.id, 'blocks_mined': len(job.blocks), 'difficulty': blockchain.difficulty, **report})
+
+def emit_mining_job_update(job):
+    broadcast('mining_job_updated', job.to_dict())
+    print(f"Mining job {job.id[:8]} {job.status}. {job.message}")
+
+mining_jobs = MiningJobManager(run_mining_job, on_progress=emit_mining_progress, on_update=emit_mining_job_update)
 
 @app.route('/')
 def index_route(): return render_template('index.html')
 
 @app.route('/api/keys/generate', methods=['POST'])
 def api_generate_key_pair():
-    priv, pub = generate_key_pair(); return jsonify({'success': True, 'private_key_pem': priv, 'public_key_pem': pub})
+    priv, pub = generate_key_pair(); return jsonify({'success': True, 'private_key_pem': priv, 'public_key_pem': pub, 'address': address_of(pub)})
 
 @app.route('/api/users/directory')
 def get_user_directory_api():
     users_pub_info = get_public_user_info()
     users_with_balances = []
     if blockchain:
+        snap = blockchain.snapshot() # Every balance as of the same moment
         for info in users_pub_info:
-            try: users_with_balances.append({**info, "balance": blockchain.get_balance(info["public_key_pem"])})
+            try: users_with_balances.append({**info, "balance": snap.get_balance(info["public_key_pem"])})
             except Exception as e: print(f"Bal err for {info['name']}: {e}"); users_with_balances.append({**info, "balance": "Error"})
     else: users_with_balances = users_pub_info
     return jsonify(users_with_balances)
@@ -127,16 +303,21 @@ def create_blockchain_api():
     global blockchain
     data = request.json
     try:
-        diff = int(data.get('difficulty', 2)); reward = float(data.get('mining_reward', 100.0))
+        diff = int(data.get('difficulty', 2)); reward = data.get('mining_reward', DEFAULT_MINING_REWARD)
+        block_version = int(data.get('block_version', BLOCK_VERSION_LEGACY))
         if not 1 <= diff <= 6: return jsonify({'success': False, 'error': 'Difficulty 1-6'}), 400
-        if reward <= 0: return jsonify({'success': False, 'error': 'Mining reward > 0'}), 400
+        if block_version not in BLOCK_VERSIONS: return jsonify({'success': False, 'error': 'Block version 1 (legacy), 2 (Merkle) or 3 (binary)'}), 400
+        if not is_base_units(reward): return jsonify({'success': False, 'error': f'Mining reward must be a positive integer of base units ({COIN} per coin)'}), 400
         
         print("API request to create NEW blockchain. Wiping existing state and re-allocating.")
-        blockchain = Blockchain(difficulty=diff, mining_reward=reward)
-        blockchain.create_genesis_block()
-        perform_initial_setup_on_new_chain(blockchain) # Allocate funds to predefined users
-        blockchain.save_to_file()
-        msg = f'New blockchain (diff {diff}, reward {reward}) created with initial user funds.'
+        cancelled = mining_jobs.cancel_all() # Their blocks would extend the old chain
+        if cancelled: print(f"Cancelled {cancelled} mining job(s) of the old chain.")
+        with mining_lock:
+            blockchain = Blockchain(difficulty=diff, mining_reward=reward, miner=MINING_ENGINE, block_version=block_version)
+            blockchain.create_genesis_block()
+            perform_initial_setup_on_new_chain(blockchain) # Allocate funds to predefined users
+            persist_blockchain(wait=True) # Replaces the stored chain, whatever the mode
+        msg = f'New blockchain (diff {diff}, reward {format_amount(reward)}) created with initial user funds.'
         emit_blockchain_update(message=msg)
         return jsonify({'success': True, 'message': msg})
     except Exception as e: traceback.print_exc(); return jsonify({'success': False, 'error': str(e)}), 500
@@ -148,24 +329,78 @@ def get_address_balance_api():
     if not pk: return jsonify({'success': False, 'error': "Missing 'key' query param"}), 400
     try:
         if blockchain is None: return jsonify({'success': False, 'error': 'Blockchain not init'}), 500
-        bal = blockchain.get_balance(pk)
-        return jsonify({'success': True, 'public_key': pk, 'balance': bal})
+        bal = blockchain.get_balance(pk) # PEM public key or address
+        return jsonify({'success': True, 'public_key': pk, 'address': address_of(pk), 'balance': bal,
+                        'last_nonce': blockchain.get_last_nonce(pk)})
     except Exception as e: traceback.print_exc(); return jsonify({'success': False, 'error': f"Bal err: {str(e)}"}), 500
     
 @app.route('/api/blockchain/add-transaction', methods=['POST'])
 def add_transaction_api():
     data = request.json
     try:
-        tx = Transaction(data['sender_public_key'], data['recipient_public_key'], float(data['amount']), data['signature'])
+        if not is_base_units(data.get('amount')):
+            return jsonify({'success': False, 'error': f"'amount' must be a positive integer of base units ({COIN} per coin)"}), 400
+        fee = data.get('fee', 0)
+        if not is_fee_units(fee):
+            return jsonify({'success': False, 'error': "'fee' must be a non-negative integer of base units"}), 400
+        if not is_nonce(data.get('nonce')):
+            return jsonify({'success': False, 'error': f"'nonce' must be an integer from 0 to {MAX_NONCE}"}), 400
+        tx = Transaction(data['sender_public_key'], data['recipient_public_key'], data['amount'], data['signature'], fee,
+                         data.get('nonce'))
         ok, msg, _ = blockchain.add_transaction(tx)
         if ok:
-            blockchain.save_to_file(); emit_blockchain_update(message=msg)
-            return jsonify({'success': True, 'message': msg})
+            persist_blockchain(); emit_blockchain_update(message=msg)
+            return jsonify({'success': True, 'message': msg, 'txid': tx.txid})
         else: return jsonify({'success': False, 'error': msg}), 400
     except Exception as e: traceback.print_exc(); return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/blockchain/add-transactions', methods=['POST'])
+def add_transactions_api():
+    """
+    Stages a batch of transactions ({'transactions': [...]}, each shaped like an add-transaction request).
+    Each is accepted or rejected on its own, in order; signatures are verified on the shared process
+    pool (inline for small batches) and the chain is persisted and broadcast once for the whole batch.
+    """
+    items = (request.get_json(silent=True) or {}).get('transactions')
+    if not isinstance(items, list) or not items:
+        return jsonify({'success': False, 'error': "'transactions' must be a non-empty list"}), 400
+    if len(items) > MAX_BATCH_TRANSACTIONS:
+        return jsonify({'success': False, 'error': f"At most {MAX_BATCH_TRANSACTIONS} transactions per batch"}), 400
+    try:
+        results, staged = [None] * len(items), []
+        for position, data in enumerate(items):
+            if not isinstance(data, dict):
+                results[position] = {'index': position, 'success': False, 'error': 'Transaction must be an object'}
+            elif not is_base_units(data.get('amount')):
+                results[position] = {'index': position, 'success': False, 'error': f"'amount' must be a positive integer of base units ({COIN} per coin)"}
+            elif not is_fee_units(data.get('fee', 0)):
+                results[position] = {'index': position, 'success': False, 'error': "'fee' must be a non-negative integer of base units"}
+            elif not is_nonce(data.get('nonce')):
+                results[position] = {'index': position, 'success': False, 'error': f"'nonce' must be an integer from 0 to {MAX_NONCE}"}
+            elif not (isinstance(data.get('sender_public_key'), str) and isinstance(data.get('recipient_public_key'), str)
+                      and isinstance(data.get('signature', ""), (str, type(None)))):
+                results[position] = {'index': position, 'success': False, 'error': "'sender_public_key', 'recipient_public_key' and 'signature' are required"}
+            else:
+                staged.append((position, Transaction(data['sender_public_key'], data['recipient_public_key'], data['amount'],
+                                                     data.get('signature'), data.get('fee', 0), data.get('nonce'))))
+        outcomes = blockchain.add_transactions([tx for _position, tx in staged], workers=VALIDATION_WORKERS)
+        for (position, tx), (ok, msg, _next_block) in zip(staged, outcomes):
+            results[position] = ({'index': position, 'success': True, 'txid': tx.txid} if ok
+                                 else {'index': position, 'success': False, 'error': msg})
+        accepted = sum(1 for result in results if result['success'])
+        msg = f"{accepted} of {len(items)} transaction(s) added to pending pool."
+        if accepted:
+            persist_blockchain(); emit_blockchain_update(message=msg)
+        return jsonify({'success': True, 'message': msg, 'accepted': accepted, 'rejected': len(items) - accepted, 'results': results})
+    except Exception as e: traceback.print_exc(); return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/api/blockchain/mine', methods=['POST'])
 def mine_block_api():
+    """
+    Queues a background mining job and returns it at once (202). By default the job mines one block;
+    with "drain": true it mines until the pending pool is empty, or at most "max_blocks" blocks.
+    Follow it with /api/mining/jobs/<job_id> or the 'mining_progress' / 'mining_job_updated' events.
+    """
     data = request.json
     try:
         # This miner_address_public_key is from the UI, representing the active browser user
@@ -174,29 +409,19 @@ def mine_block_api():
         if not miner_pk_from_request:
              return jsonify({'success': False, 'error': 'Miner reward address (public key) is required from client.'}), 400
 
-        # The mine_pending_transactions function will create the reward tx for this miner
-        block, duration, message_from_mine_logic = blockchain.mine_pending_transactions(miner_pk_from_request)
-        
-        if block:
-            blockchain.save_to_file() # Save the new state
-            # The emit_blockchain_update will send the new chain, status (incl. pending tx count = 0)
-            # and the message will reflect the successful mining.
-            # Balances (including miner's new reward and directory users) will be re-fetched by client
-            # due to the 'blockchain_updated' event handled in uiUpdater.js.
-            emit_blockchain_update(message=f"Block #{block.index} successfully mined by user.")
-            return jsonify({
-                'success': True, 
-                'message': message_from_mine_logic, # Detailed message from the blockchain logic
-                'block': { 
-                    'index': block.index, 'hash': block.hash, 
-                    'nonce': block.nonce, 'timestamp': block.timestamp 
-                },
-                'mining_duration': duration
-            })
-        else:
-            # message_from_mine_logic contains the reason why no block was mined (e.g., "No user transactions")
-            return jsonify({'success': False, 'error': message_from_mine_logic}) 
-            
+        max_blocks = 1
+        if data.get('drain'): # Mine successive blocks until the pending pool is empty
+            max_blocks = data.get('max_blocks')
+            if max_blocks is not None and (not isinstance(max_blocks, int) or isinstance(max_blocks, bool) or max_blocks < 1):
+                return jsonify({'success': False, 'error': "'max_blocks' must be a positive integer"}), 400
+        if not blockchain.snapshot().pending_transactions:
+            return jsonify({'success': False, 'error': "No transactions (user or system) currently pending to be mined."})
+
+        # The job's mine_backlog run creates the reward tx for this miner; transactions staged
+        # while it mines stay pending for the next block.
+        job, message = mining_jobs.submit(miner_pk_from_request, max_blocks)
+        if job is None: return jsonify({'success': False, 'error': message}), 429
+        return jsonify({'success': True, 'message': message, 'job': job.to_dict()}), 202
     except KeyError:
         return jsonify({'success': False, 'error': 'Missing miner_address_public_key field'}), 400
     except Exception as e:
@@ -204,6 +429,24 @@ def mine_block_api():
         traceback.print_exc()
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/mining/jobs')
+def list_mining_jobs_api():
+    """Recent mining jobs, most recent first."""
+    return jsonify({'success': True, 'jobs': [job.to_dict() for job in mining_jobs.jobs()]})
+
+@app.route('/api/mining/jobs/<job_id>')
+def get_mining_job_api(job_id):
+    job = mining_jobs.get(job_id)
+    if job is None: return jsonify({'success': False, 'error': 'Unknown mining job'}), 404
+    return jsonify({'success': True, 'job': job.to_dict()})
+
+@app.route('/api/mining/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_mining_job_api(job_id):
+    if mining_jobs.get(job_id) is None: return jsonify({'success': False, 'error': 'Unknown mining job'}), 404
+    ok, msg = mining_jobs.cancel(job_id)
+    if not ok: return jsonify({'success': False, 'error': msg}), 409
+    return jsonify({'success': True, 'message': msg, 'job': mining_jobs.get(job_id).to_dict()})
+
 
 @app.route('/api/faucet/request-welcome-bonus', methods=['POST'])
 def request_welcome_bonus_api():
@@ -219,26 +462,17 @@ def request_welcome_bonus_api():
         # The perform_initial_setup_on_new_chain should handle predefined users.
         # This faucet is more for the *browser user* who generates keys.
 
-        grant_tx = Transaction("welcome_faucet", rcpt_pk, FAUCET_GRANT_AMOUNT, None)
+        grant_tx = Transaction("welcome_faucet", rcpt_pk, FAUCET_GRANT_AMOUNT, None, nonce=new_nonce())
         if not blockchain or not blockchain.get_latest_block(): return jsonify({'success': False, 'error': 'Blockchain not ready'}), 500
         
-        original_pending = list(blockchain.pending_transactions)
-        blockchain.pending_transactions = [grant_tx] # Focus on this grant
-        
-        # Reward for this faucet-triggered block also goes to the recipient
-        mined_block, _, mine_msg = blockchain.mine_pending_transactions(rcpt_pk) 
-        
-        blockchain.pending_transactions.extend(original_pending) # Restore other pending TXs
-        # A better way to restore if order matters or to avoid duplicates:
-        # blockchain.pending_transactions = original_pending
-
-        if mined_block:
-            success_msg = f"{FAUCET_GRANT_AMOUNT} coins (plus mining reward) granted & mined for new user."
-            blockchain.save_to_file(); emit_blockchain_update(message=success_msg)
-            return jsonify({'success': True, 'message': success_msg})
-        else: 
-            blockchain.pending_transactions = original_pending # Ensure restoration on failure
-            return jsonify({'success': False, 'error': f"Faucet auto-mine failed: {mine_msg}"}), 500
+        # The grant is mined on its own, without going through the pending pool, by a mining job: jobs
+        # run one at a time, so it never races another job for the same tip, and this request returns
+        # at once with the job to follow (like /api/blockchain/mine). The block's reward also goes to
+        # the recipient.
+        job, message = mining_jobs.submit(rcpt_pk, transactions=[grant_tx])
+        if job is None: return jsonify({'success': False, 'error': message}), 429
+        success_msg = f"{format_amount(FAUCET_GRANT_AMOUNT)} coins (plus mining reward) will be granted to the new user once mined. {message}"
+        return jsonify({'success': True, 'message': success_msg, 'txid': grant_tx.txid, 'job': job.to_dict()}), 202
     except Exception as e: traceback.print_exc(); return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/utils/sign-data-for-client', methods=['POST'])
@@ -247,23 +481,242 @@ def client_sign_data_insecure_api(): # INSECURE: For demo only
     try: sig = sign_data(data['private_key_pem'], data['data_to_sign']); return jsonify({'success': True, 'signature': sig})
     except Exception as e: return jsonify({'success': False, 'error': f"Signing err: {str(e)}"}), 400
 
+@app.route('/api/blocks/<int:block_index>/proof/<int:position>')
+def transaction_proof_api(block_index, position):
+    try:
+        if blockchain is None: return jsonify({'success': False, 'error': 'Blockchain not init'}), 500
+        proof = blockchain.get_transaction_proof(block_index, position)
+        if proof is None: return jsonify({'success': False, 'error': 'Block not found or not a Merkle-format block'}), 404
+        return jsonify({'success': True, **proof})
+    except IndexError as e: return jsonify({'success': False, 'error': str(e)}), 404
+    except Exception as e: traceback.print_exc(); return jsonify({'success': False, 'error': str(e)}), 500
+
+# --- Block and transaction query API ---
+# Pages are addressed by an opaque cursor naming the next block position and the hash of the block
+# before it, so a cursor taken from a chain that has since been replaced is rejected instead of
+# silently continuing on different blocks. Responses carry an ETag; blocks are immutable, so a client
+# that sends it back in If-None-Match gets an empty 304 unless the content changed.
+def encode_block_cursor(position, prev_hash) -> str:
+    return base64.urlsafe_b64encode(f"{position}:{prev_hash}".encode('utf-8')).decode('ascii')
+
+def decode_block_cursor(cursor) -> tuple[int, str] | None:
+    try:
+        position, prev_hash = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').split(':', 1)
+        return int(position), prev_hash
+    except (ValueError, UnicodeError): return None
+
+def conditional_json(etag, build_body):
+    """304 if the client already holds `etag`, otherwise the JSON body from build_body() tagged with it."""
+    if etag in request.if_none_match:
+        response = app.response_class(status=304)
+    else:
+        response = jsonify(build_body())
+    response.set_etag(etag)
+    return response
+
+@app.route('/api/blocks')
+def list_blocks_api():
+    if blockchain is None: return jsonify({'success': False, 'error': 'Blockchain not init'}), 500
+    try: limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError: return jsonify({'success': False, 'error': "'limit' must be an integer"}), 400
+    if not 1 <= limit <= MAX_PAGE_SIZE: return jsonify({'success': False, 'error': f"'limit' must be 1-{MAX_PAGE_SIZE}"}), 400
+    snap = blockchain.snapshot() # The page and has_more describe the same chain
+    cursor = request.args.get('cursor')
+    if cursor:
+        decoded = decode_block_cursor(cursor)
+        if decoded is None: return jsonify({'success': False, 'error': 'Malformed cursor'}), 400
+        start, prev_hash = decoded
+        if not chain_extends(start, prev_hash, snap): return jsonify({'success': False, 'error': 'Cursor no longer matches the chain; restart from a block index'}), 409
+    else:
+        try: start = int(request.args.get('from', 0))
+        except ValueError: return jsonify({'success': False, 'error': "'from' must be an integer"}), 400
+        if start < 0: return jsonify({'success': False, 'error': "'from' must be >= 0"}), 400
+
+    blocks = snap.get_blocks(start, limit)
+    end = start + len(blocks)
+    next_cursor = encode_block_cursor(end, blocks[-1].hash) if blocks else cursor
+    has_more = end < snap.height
+    etag = hashlib.sha256(json.dumps([start, [b.hash for b in blocks], has_more]).encode('utf-8')).hexdigest()
+    return conditional_json(etag, lambda: {'success': True, 'from': start, 'limit': limit,
+                                           'blocks': [block_to_payload(b) for b in blocks],
+                                           'next_cursor': next_cursor, 'has_more': has_more})
+
+@app.route('/api/blocks/<int:block_index>')
+def get_block_api(block_index):
+    if blockchain is None: return jsonify({'success': False, 'error': 'Blockchain not init'}), 500
+    b = blockchain.get_block(block_index)
+    if b is None: return jsonify({'success': False, 'error': f'No block at index {block_index}'}), 404
+    return conditional_json(b.hash, lambda: {'success': True, 'block': block_to_payload(b)})
+
+@app.route('/api/blocks/by-hash/<block_hash>')
+def get_block_by_hash_api(block_hash):
+    if blockchain is None: return jsonify({'success': False, 'error': 'Blockchain not init'}), 500
+    b = blockchain.get_block_by_hash(block_hash.lower())
+    if b is None: return jsonify({'success': False, 'error': 'Block not found'}), 404
+    return conditional_json(b.hash, lambda: {'success': True, 'block': block_to_payload(b)})
+
+@app.route('/api/tx/<txid>')
+def get_transaction_api(txid):
+    if blockchain is None: return jsonify({'success': False, 'error': 'Blockchain not init'}), 500
+    found = blockchain.get_transaction(txid.lower())
+    if found is None: return jsonify({'success': False, 'error': 'Transaction not found'}), 404
+    if found['status'] == 'pending': return jsonify({'success': True, **found}) # Not final yet: no ETag
+    return conditional_json(f"{found['block_hash']}:{found['position']}", lambda: {'success': True, **found})
+
+@app.route('/api/address/<pubkey:key>/history')
+def address_history_api(key):
+    """Confirmed transactions touching `key` (PEM public key or address), oldest first, paged like /api/blocks, plus its pending transactions."""
+    if blockchain is None: return jsonify({'success': False, 'error': 'Blockchain not init'}), 500
+    try: limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError: return jsonify({'success': False, 'error': "'limit' must be an integer"}), 400
+    if not 1 <= limit <= MAX_PAGE_SIZE: return jsonify({'success': False, 'error': f"'limit' must be 1-{MAX_PAGE_SIZE}"}), 400
+    cursor = request.args.get('cursor')
+    if cursor:
+        decoded = decode_block_cursor(cursor) # Offset into the history + hash of the block holding the entry before it
+        if decoded is None: return jsonify({'success': False, 'error': 'Malformed cursor'}), 400
+        start, prev_hash = decoded
+        previous, _total = blockchain.get_address_history(key, start - 1, 1) if start > 0 else ([], 0)
+        if start > 0 and (not previous or previous[0]['block_hash'] != prev_hash):
+            return jsonify({'success': False, 'error': 'Cursor no longer matches the chain; restart from an offset'}), 409
+    else:
+        try: start = int(request.args.get('from', 0))
+        except ValueError: return jsonify({'success': False, 'error': "'from' must be an integer"}), 400
+        if start < 0: return jsonify({'success': False, 'error': "'from' must be >= 0"}), 400
+
+    entries, total = blockchain.get_address_history(key, start, limit)
+    end = start + len(entries)
+    return jsonify({'success': True, 'public_key': key, 'address': address_of(key), 'from': start, 'limit': limit, 'total': total,
+                    'transactions': entries, 'pending': blockchain.get_pending_for_address(key),
+                    'next_cursor': encode_block_cursor(end, entries[-1]['block_hash']) if entries else cursor,
+                    'has_more': end < total})
+
+# Whole-chain statistics computed with NumPy over columnar copies of the confirmed transactions (see
+# analytics.py). The columns are only extended with blocks mined since the previous request, and the
+# ETag names the chain tip, so an unchanged chain is answered with a 304.
+def current_analytics():
+    global chain_analytics
+    with analytics_lock:
+        if chain_analytics is None: chain_analytics = ChainAnalytics()
+        chain_analytics.update(blockchain)
+        return chain_analytics
+
+def stats_unavailable():
+    if blockchain is None: return jsonify({'success': False, 'error': 'Blockchain not init'}), 500
+    if not ANALYTICS_AVAILABLE: return jsonify({'success': False, 'error': 'Chain statistics need NumPy on the server'}), 501
+    return None
+
+def stats_page_args(default_limit):
+    """Returns ('from', 'limit', None) from the query string, or (None, None, error response)."""
+    try: start, limit = int(request.args.get('from', 0)), int(request.args.get('limit', default_limit))
+    except ValueError: return None, None, (jsonify({'success': False, 'error': "'from' and 'limit' must be integers"}), 400)
+    if start < 0: return None, None, (jsonify({'success': False, 'error': "'from' must be >= 0"}), 400)
+    if not 1 <= limit <= MAX_STATS_PAGE_SIZE: return None, None, (jsonify({'success': False, 'error': f"'limit' must be 1-{MAX_STATS_PAGE_SIZE}"}), 400)
+    return start, limit, None
+
+@app.route('/api/stats/summary')
+def stats_summary_api():
+    """Chain height, transaction count, holders, total supply and transfer volume (confirmed blocks only)."""
+    if (error := stats_unavailable()): return error
+    analytics = current_analytics()
+    return conditional_json(f"summary:{analytics.tip_hash}", lambda: {'success': True, **analytics.summary()})
+
+@app.route('/api/stats/balances')
+def stats_balances_api():
+    """Confirmed balances of every holder, largest first, paged with 'from' (rank offset) and 'limit'."""
+    if (error := stats_unavailable()): return error
+    start, limit, error = stats_page_args(MAX_STATS_PAGE_SIZE)
+    if error: return error
+    analytics = current_analytics()
+    def build_body():
+        balances, holders = analytics.ranked_balances(start, limit)
+        return {'success': True, 'height': analytics.height, 'from': start, 'limit': limit, 'holders': holders,
+                'balances': balances, 'has_more': start + len(balances) < holders}
+    return conditional_json(f"balances:{analytics.tip_hash}:{start}:{limit}", build_body)
+
+@app.route('/api/stats/top-holders')
+def stats_top_holders_api():
+    if (error := stats_unavailable()): return error
+    _start, limit, error = stats_page_args(10)
+    if error: return error
+    analytics = current_analytics()
+    return conditional_json(f"top:{analytics.tip_hash}:{limit}", lambda: {'success': True, 'height': analytics.height,
+                                                                          'holders': analytics.ranked_balances(0, limit)[0]})
+
+@app.route('/api/stats/blocks')
+def stats_blocks_api():
+    """Per-block transaction count, transfer volume, coins issued and total supply, paged by block position."""
+    if (error := stats_unavailable()): return error
+    start, limit, error = stats_page_args(MAX_STATS_PAGE_SIZE)
+    if error: return error
+    analytics = current_analytics()
+    def build_body():
+        series = analytics.block_series(start, limit)
+        return {'success': True, 'height': analytics.height, 'from': start, 'limit': limit, 'blocks': series,
+                'has_more': start + len(series) < analytics.height}
+    return conditional_json(f"blocks:{analytics.tip_hash}:{start}:{limit}", build_body)
+
+@app.route('/api/mempool')
+def mempool_api():
+    """Pool limits and usage, plus the first 'limit' pending transactions in the order a block takes them (highest fee first)."""
+    if blockchain is None: return jsonify({'success': False, 'error': 'Blockchain not init'}), 500
+    try: limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError: return jsonify({'success': False, 'error': "'limit' must be an integer"}), 400
+    if not 1 <= limit <= MAX_PAGE_SIZE: return jsonify({'success': False, 'error': f"'limit' must be 1-{MAX_PAGE_SIZE}"}), 400
+    pool = blockchain.mempool
+    return jsonify({'success': True, 'count': len(pool), 'bytes': pool.total_bytes, 'max_transactions': pool.max_transactions,
+                    'max_bytes': pool.max_bytes, 'max_per_sender': pool.max_per_sender,
+                    'transactions': [{'txid': entry.txid, 'fee': entry.fee, 'size': entry.size, 'transaction': entry.tx.to_dict()}
+                                     for entry in pool.entries_by_priority()[:limit]]})
+
 @app.route('/api/blockchain/validate')
-def validate_chain_api(): return jsonify({'valid': blockchain.is_chain_valid() if blockchain else False})
+def validate_chain_api():
+    if not blockchain: return jsonify({'valid': False})
+    full = request.args.get('full', '').lower() in ('1', 'true', 'yes') # Full audit from genesis
+    valid = blockchain.is_chain_valid(workers=VALIDATION_WORKERS, full=full)
+    return jsonify({'valid': valid, 'failure': blockchain.last_validation_failure,
+                    'validated_checkpoint': blockchain.validated_checkpoint})
 
 @app.route('/api/blockchain/save')
 def save_blockchain_api():
     try: 
-        if blockchain: blockchain.save_to_file(); return jsonify({'success': True, 'message': 'Blockchain saved.'})
+        if blockchain: persist_blockchain(wait=True); return jsonify({'success': True, 'message': 'Blockchain saved.'})
         else: return jsonify({'success': False, 'error': 'No blockchain to save.'}), 500
     except Exception as e: traceback.print_exc(); return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/persistence', methods=['GET', 'POST'])
+def persistence_api():
+    """Durability mode and write counters; POST {'mode': ...} switches the mode (see persistence.py)."""
+    if request.method == 'POST':
+        mode = (request.get_json(silent=True) or {}).get('mode')
+        if mode not in DURABILITY_MODES:
+            return jsonify({'success': False, 'error': f"'mode' must be one of {', '.join(DURABILITY_MODES)}"}), 400
+        persistence.mode = mode
+        persistence.flush() # Changes accepted under the old mode are not left waiting
+    return jsonify({'success': True, **persistence.stats()})
+
 @socketio.on('connect')
-def handle_connect(): print('Client connected'); emit_blockchain_update('initial_state', "Initial state sent.")
+def handle_connect(): print('Client connected') # The client follows up with 'sync_request'
 @socketio.on('disconnect')
 def handle_disconnect(): print('Client disconnected')
+def sync_response(data) -> dict:
+    """Answer to a client's 'sync_request': a delta from its height if it holds a prefix of our chain, else a snapshot."""
+    data = data or {}
+    height, tip_hash = data.get('height'), data.get('tip_hash')
+    snap = blockchain.snapshot()
+    if height and chain_extends(height, tip_hash, snap): payload = build_delta_payload(height, "Caught up with server.", snap=snap)
+    else: payload = build_snapshot_payload("Initial state sent.", snap)
+    print(f"Sync req (height={height}, reason={data.get('reason')}): sending {payload['type']}")
+    return payload
+
+@socketio.on('sync_request')
+def handle_sync_request(data):
+    emit('blockchain_updated', sync_response(data)) # Only to the requesting client
 @socketio.on('request_update')
-def handle_request_update(data): print(f"Update req: {data.get('reason')}"); emit_blockchain_update("Update on request.")
+def handle_request_update(data):
+    print(f"Update req: {(data or {}).get('reason')}")
+    emit('initial_state', build_snapshot_payload("Update on request.")) # Only to the requesting client
 
 if __name__ == '__main__':
+    # Threaded server; `python asgi_server.py` serves the same app with the asyncio server instead.
     print("Starting Flask-SocketIO server...")
     socketio.run(app, debug=True, host='0.0.0.0', port=5000, use_reloader=True) # use_reloader can be helpful
\ No newline at end of file
@@ -0,0 +1,173 @@
+# asgi_server.py
+#
+# Asyncio serving mode for many simultaneous browser connections. Socket.IO runs on the event loop
+# (python-socketio's AsyncServer in ASGI mode), so an idle connection costs a coroutine instead of a
+# thread. HTTP requests are served by the same Flask app as `python app.py`, called on executor
+# threads so the loop never waits for them:
+#   - reads (GET/HEAD) have a pool of their own; they answer from ChainSnapshots, which never wait
+#     for the write lock, a mining job or the disk;
+#   - everything else (signature checks, the write lock, persisting) runs on a small writer pool,
+#     including the GETs that take the write lock (WRITER_GET_PATHS): saving, validating the chain,
+#     and the transaction and block-hash lookups, whose indexes are built under it on first use.
+#     A save holds that lock across its fsync, so on the reader pool these would hold up reads.
+# Proof-of-Work stays on the mining job thread and its process pool, and chain validation on its
+# own process pool (see app.py). Broadcasts made from any of those threads are handed to the loop,
+# which sends them in order. Needs an ASGI server such as uvicorn:
+#
+#     python asgi_server.py [--host 0.0.0.0] [--port 5000]
+#     uvicorn asgi_server:asgi_app --port 5000       # or any other ASGI server
+
+import argparse
+import asyncio
+import io
+import re
+import sys
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+import socketio
+
+import app as node
+
+try:
+    import uvicorn
+    UVICORN_AVAILABLE = True
+except ImportError: # Optional dependency: asgi_app can still be served by another ASGI server
+    UVICORN_AVAILABLE = False
+
+READ_WORKERS = 32 # Threads answering GET/HEAD requests
+WRITE_WORKERS = 4 # Threads for all other requests; writers mostly queue on the chain's write lock anyway
+# GET routes that persist or take the chain's write lock, served by the writer pool
+WRITER_GET_PATHS = re.compile(r"/api/(blockchain/(save|validate)|tx/[^/]+|address/.+/history|blocks/by-hash/[^/]+)")
+
+read_executor = ThreadPoolExecutor(max_workers=READ_WORKERS, thread_name_prefix="asgi-read")
+write_executor = ThreadPoolExecutor(max_workers=WRITE_WORKERS, thread_name_prefix="asgi-write")
+sio = socketio.AsyncServer(async_mode='asgi', cors_allowed_origins="*")
+_loop: asyncio.AbstractEventLoop | None = None
+_broadcasts: asyncio.Queue | None = None
+_broadcast_task: asyncio.Task | None = None
+
+
+# --- Broadcasts ---
+def broadcast_threadsafe(event_name: str, payload: dict):
+    """Replaces app.broadcast: queues an event for every client; the loop sends queued events in order."""
+    if _loop is None:
+        return # Not serving yet, so no client to send to
+    _loop.call_soon_threadsafe(_broadcasts.put_nowait, (event_name, payload))
+
+async def send_broadcasts():
+    while True:
+        event_name, payload = await _broadcasts.get()
+        try:
+            await sio.emit(event_name, payload)
+        except Exception:
+            traceback.print_exc()
+
+async def on_startup():
+    global _loop, _broadcasts, _broadcast_task
+    _loop, _broadcasts = asyncio.get_running_loop(), asyncio.Queue()
+    _broadcast_task = asyncio.create_task(send_broadcasts())
+    node.broadcast = broadcast_threadsafe
+    print(f"Asyncio server ready ({READ_WORKERS} reader / {WRITE_WORKERS} writer threads).")
+
+async def on_shutdown():
+    _broadcast_task.cancel()
+    await asyncio.get_running_loop().run_in_executor(None, node.mining_jobs.shutdown)
+    read_executor.shutdown(wait=False)
+    write_executor.shutdown(wait=True) # Let accepted writes finish persisting
+    await asyncio.get_running_loop().run_in_executor(None, node.persistence.close) # Write what is still unsaved
+
+
+# --- Socket.IO events (same protocol as app.py's handlers) ---
+@sio.event
+async def connect(sid, environ):
+    print('Client connected') # The client follows up with 'sync_request'
+
+@sio.event
+async def disconnect(sid, *_reason):
+    print('Client disconnected')
+
+@sio.on('sync_request')
+async def handle_sync_request(sid, data=None):
+    # Building a payload serializes blocks, so it runs on a reader thread rather than the loop.
+    payload = await asyncio.get_running_loop().run_in_executor(read_executor, node.sync_response, data)
+    await sio.emit('blockchain_updated', payload, to=sid)
+
+@sio.on('request_update')
+async def handle_request_update(sid, data=None):
+    print(f"Update req: {(data or {}).get('reason')}")
+    payload = await asyncio.get_running_loop().run_in_executor(read_executor, node.build_snapshot_payload, "Update on request.")
+    await sio.emit('initial_state', payload, to=sid)
+
+
+# --- HTTP: the Flask app, called on executor threads ---
+def wsgi_environ(scope: dict, body: bytes) -> dict:
+    """WSGI environ for an ASGI HTTP request whose body has been read in full."""
+    server = scope.get('server') or ("localhost", 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', "").encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'), # WSGI carries paths as latin-1 decoded bytes
+        'QUERY_STRING': scope.get('query_string', b"").decode('latin-1'),
+        'SERVER_NAME': server[0], 'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': scope['client'][0] if scope.get('client') else "",
+        'wsgi.version': (1, 0), 'wsgi.url_scheme': scope.get('scheme', "http"),
+        'wsgi.input': io.BytesIO(body), 'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True, 'wsgi.multiprocess': False, 'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        key = name.decode('latin-1').upper().replace("-", "_")
+        if key not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            key = f"HTTP_{key}"
+        value = value.decode('latin-1')
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    environ['CONTENT_LENGTH'] = str(len(body)) # The body was read in full, even if it came chunked
+    return environ
+
+def call_flask(environ: dict) -> tuple[int, list[tuple[bytes, bytes]], bytes]:
+    """Runs one request through the Flask app; returns (status code, headers, body)."""
+    response = {}
+    def start_response(status, headers, exc_info=None):
+        response['status'], response['headers'] = int(status.split(" ", 1)[0]), headers
+    chunks = node.app(environ, start_response)
+    try:
+        body = b"".join(chunks)
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+    headers = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in response['headers']]
+    return response['status'], headers, body
+
+async def flask_asgi_app(scope, receive, send):
+    if scope['type'] != 'http':
+        if scope['type'] == 'websocket': # Only Socket.IO (handled before this app) speaks websocket
+            await send({'type': 'websocket.close'})
+        return
+    body = bytearray()
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+        body += message.get('body', b"")
+        if not message.get('more_body'):
+            break
+    reader = scope['method'] in ("GET", "HEAD") and not WRITER_GET_PATHS.fullmatch(scope['path'])
+    executor = read_executor if reader else write_executor
+    status, headers, payload = await asyncio.get_running_loop().run_in_executor(executor, call_flask, wsgi_environ(scope, bytes(body)))
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': payload})
+
+asgi_app = socketio.ASGIApp(sio, other_asgi_app=flask_asgi_app, on_startup=on_startup, on_shutdown=on_shutdown)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve the simulator with the asyncio (ASGI) Socket.IO server.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5000)
+    args = parser.parse_args()
+    if not UVICORN_AVAILABLE:
+        print("The asyncio server needs uvicorn (pip install uvicorn); asgi_server:asgi_app also runs under any other ASGI server.")
+        sys.exit(1)
+    print("Starting asyncio (ASGI) server...")
+    uvicorn.run(asgi_app, host=args.host, port=args.port)
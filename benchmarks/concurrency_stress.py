@@ -0,0 +1,175 @@
+# benchmarks/concurrency_stress.py
+#
+# Concurrency stress test of the web API. --threads sender threads post signed transfers between a
+# handful of funded keys (including overspends and resubmitted duplicates), as many reader threads
+# poll balances, the user directory, block pages, the mempool and chain validation, and one thread
+# keeps queueing mining jobs and faucet grants, all through Flask test clients for --seconds
+# seconds. Reader threads also check every ChainSnapshot they take: its confirmed balances must sum
+# to minus the fees of its blocks (fees move from senders to the next block's reward).
+# Afterwards the chain must validate in full, its balance ledger must match a rebuild, every
+# accepted transaction must be on the chain or pending exactly once, and no user balance may be
+# negative. Runs in a temporary directory, so the project's own chain is left alone. Run from the
+# project root:
+#
+#     python -m benchmarks.concurrency_stress [--threads 8] [--seconds 10] [--difficulty 2]
+
+import argparse
+import collections
+import contextlib
+import io
+import itertools
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent senders, readers and miners against the web API.")
+    parser.add_argument("--threads", type=int, default=8, help="Sender threads (and as many reader threads).")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--difficulty", type=int, default=2)
+    parser.add_argument("--keys", type=int, default=6, help="Funded keys the senders transfer between.")
+    parser.add_argument("--verbose", action="store_true", help="Keep the server's log output.")
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix="chain-stress-")) # app.py stores its chain in the working directory
+    log = sys.stdout if args.verbose else io.StringIO()
+    with contextlib.redirect_stdout(log):
+        import app
+        from miner import SequentialMiner
+        from mempool import SYSTEM_SENDERS
+        from transaction import Transaction, new_nonce
+        from utils.addresses import address_of
+        from utils.crypto_utils import generate_key_pair, get_data_to_sign, sign_data
+
+        app.MINING_ENGINE = SequentialMiner()
+        app.init_blockchain()
+        app.blockchain.miner, app.blockchain.difficulty = app.MINING_ENGINE, args.difficulty
+        app.broadcast = lambda *_args, **_kwargs: None # No clients; payloads are still built
+        keys = [generate_key_pair() for _ in range(args.keys)]
+        client = app.app.test_client()
+        for _priv, pub in keys: # Grants are mined by mining jobs; wait for each before sending
+            response = client.post('/api/faucet/request-welcome-bonus', json={'recipient_public_key': pub})
+            assert response.status_code == 202 and app.mining_jobs.get(response.json['job']['job_id']).wait(60)
+
+    system_addresses = {address_of(sender) for sender in SYSTEM_SENDERS}
+    deadline = time.time() + args.seconds
+    lock = threading.Lock()
+    counts = collections.Counter() # "<kind> <status code>" -> requests
+    server_errors, snapshot_errors = [], []
+    accepted_txids = []
+
+    def record(kind, response):
+        with lock:
+            counts[f"{kind} {response.status_code}"] += 1
+            if response.status_code >= 500:
+                server_errors.append(f"{kind}: {response.status_code} {response.get_data(as_text=True)[:200]}")
+        return response
+
+    def sender(seed):
+        rng, client = random.Random(seed), app.app.test_client()
+        while time.time() < deadline:
+            priv, pub = rng.choice(keys)
+            recipient = rng.choice([other for _priv, other in keys if other != pub])
+            balance = app.blockchain.get_balance(pub)
+            overspend = rng.random() < 0.1
+            amount = balance + 1 if overspend or balance < 2 else rng.randint(1, max(1, balance // 20))
+            fee, nonce = rng.choice((0, 0, 1, 10)), new_nonce()
+            payload = {'sender_public_key': pub, 'recipient_public_key': recipient, 'amount': amount, 'fee': fee, 'nonce': nonce,
+                       'signature': sign_data(priv, get_data_to_sign(pub, recipient, amount, fee, nonce))}
+            for _attempt in range(2 if rng.random() < 0.2 else 1): # Resubmitted duplicates must be refused
+                response = record("add-transaction", client.post('/api/blockchain/add-transaction', json=payload))
+                if response.status_code == 200:
+                    with lock:
+                        accepted_txids.append(response.json['txid'])
+
+    def reader(seed):
+        rng, client = random.Random(seed), app.app.test_client()
+        fees_by_height = [0] # Fees in the first n blocks; blocks never change once on the chain
+        while time.time() < deadline:
+            kind = rng.choice(("balance", "directory", "blocks", "mempool", "validate"))
+            if kind == "balance":
+                record(kind, client.get('/api/blockchain/balance', query_string={'key': rng.choice(keys)[1]}))
+            elif kind == "directory":
+                record(kind, client.get('/api/users/directory'))
+            elif kind == "blocks":
+                record(kind, client.get('/api/blocks', query_string={'from': rng.randint(0, 5), 'limit': 20}))
+            elif kind == "mempool":
+                record(kind, client.get('/api/mempool'))
+            else:
+                record(kind, client.get('/api/blockchain/validate'))
+
+            snap = app.blockchain.snapshot()
+            for block in snap.get_blocks(len(fees_by_height) - 1):
+                fees_by_height.append(fees_by_height[-1] + sum(Transaction.from_dict(tx).fee for tx in block.transactions))
+            with lock:
+                counts["snapshot checks"] += 1
+                if sum(snap.confirmed_balances.values()) != -fees_by_height[snap.height]:
+                    snapshot_errors.append(f"Snapshot at height {snap.height}: balances do not sum to minus its fees.")
+
+    def miner():
+        client, miner_pub = app.app.test_client(), keys[0][1]
+        for round_number in itertools.count():
+            if time.time() >= deadline:
+                break
+            if round_number % 5 == 4: # Grants are mined in blocks of their own, outside the pending pool
+                recipient = keys[round_number % len(keys)][1]
+                response = record("faucet", client.post('/api/faucet/request-welcome-bonus', json={'recipient_public_key': recipient}))
+                if response.status_code == 202:
+                    job = app.mining_jobs.get(response.json['job']['job_id'])
+                    if job.wait(max(0.0, deadline - time.time())) and job.status == "completed":
+                        with lock:
+                            accepted_txids.append(response.json['txid'])
+                continue
+            response = record("mine", client.post('/api/blockchain/mine', json={'miner_address_public_key': miner_pub,
+                                                                                'drain': True, 'max_blocks': 3}))
+            if response.status_code == 202:
+                app.mining_jobs.get(response.json['job']['job_id']).wait(max(0.0, deadline - time.time()))
+            else:
+                time.sleep(0.05) # Nothing pending yet
+
+    threads = [threading.Thread(target=sender, args=(i,)) for i in range(args.threads)]
+    threads += [threading.Thread(target=reader, args=(1000 + i,)) for i in range(args.threads)]
+    threads.append(threading.Thread(target=miner))
+    start_height = len(app.blockchain.chain)
+    with contextlib.redirect_stdout(log):
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        app.mining_jobs.shutdown(wait=True)
+
+        bc = app.blockchain
+        chain_valid = bc.is_chain_valid(full=True)
+        ledger_ok = bc.verify_balance_index()
+    on_chain = collections.Counter(Transaction.from_dict(tx).txid for block in bc.chain for tx in block.transactions)
+    pending = collections.Counter(tx.txid for tx in bc.pending_transactions)
+    misplaced = [txid for txid in accepted_txids if on_chain[txid] + pending[txid] != 1]
+    negative = {address: balance for address, balance in bc.export_balance_index().items()
+                if balance < 0 and address not in system_addresses}
+
+    requests = sum(count for kind, count in counts.items() if kind != "snapshot checks")
+    print(f"{args.threads} sender + {args.threads} reader threads + 1 miner for {elapsed:.1f}s: "
+          f"{requests} requests ({requests / elapsed:.0f}/s), {counts['snapshot checks']} snapshot checks")
+    for kind, count in sorted(counts.items()):
+        print(f"  {kind:<24} {count:7d}")
+    print(f"  accepted transactions    {len(accepted_txids):7d} ({sum(on_chain[txid] for txid in accepted_txids)} mined, "
+          f"{len(bc.pending_transactions)} pending)")
+    print(f"  blocks mined             {len(bc.chain) - start_height:7d}")
+
+    failures = server_errors[:5] + snapshot_errors[:5]
+    if not chain_valid: failures.append(f"Chain invalid: {bc.last_validation_failure}")
+    if not ledger_ok: failures.append("Balance ledger does not match a rebuild from the chain.")
+    if misplaced: failures.append(f"{len(misplaced)} accepted transaction(s) not on the chain or pending exactly once.")
+    if negative: failures.append(f"Negative confirmed balances: {negative}")
+    if failures:
+        print("FAILED:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+    print("All invariants held.")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+# benchmarks/memory.py
+#
+# Resident memory of an in-memory chain. A chain of --transactions address-form transactions
+# (blocks of --per-block) is decoded from its stored JSON form, as a loaded chain would be, and
+# kept either as plain dicts (the representation before Block used __slots__ and columnar
+# transactions) or as Block objects. Each representation is measured in a fresh process, and
+# both must produce the same block hashes. Linux only (reads /proc/self/statm). Run from the
+# project root:
+#
+#     python -m benchmarks.memory [--transactions 100000] [--per-block 100]
+
+import argparse
+import gc
+import hashlib
+import json
+import os
+import random
+import subprocess
+import sys
+
+from block import Block
+from utils.amounts import COIN
+
+def resident_bytes() -> int:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+def make_stored_blocks(tx_count: int, per_block: int) -> list[str]:
+    """Stored (JSON) form of a deterministic chain: a mining reward plus signed transfers per block."""
+    rng = random.Random(17)
+    addresses = [rng.randbytes(20).hex() for _ in range(200)]
+    stored, previous_hash = [], "0" * 64
+    for index in range(1, tx_count // per_block + 1):
+        transactions = [{'sender_public_key': 'network', 'recipient_public_key': rng.choice(addresses),
+                         'amount': 100 * COIN, 'signature': None}]
+        transactions += [{'sender_public_key': rng.choice(addresses), 'recipient_public_key': rng.choice(addresses),
+                          'amount': rng.randint(1, 1000 * COIN), 'signature': rng.randbytes(rng.choice((70, 71, 72))).hex()}
+                         for _ in range(per_block - 1)]
+        block = Block(index, transactions, 1_700_000_000.0 + index, previous_hash)
+        previous_hash = block.hash
+        stored.append(json.dumps(block.to_dict(), sort_keys=True))
+    return stored
+
+def legacy_block_hash(block_dict: dict) -> str:
+    """Block hash computed straight from a plain dict, as Block did before it stored transactions in columns."""
+    content = {key: block_dict[key] for key in ('index', 'transactions', 'timestamp', 'previous_hash', 'nonce')}
+    return hashlib.sha256(json.dumps(content, sort_keys=True).encode('utf-8')).hexdigest()
+
+def measure(representation: str, tx_count: int, per_block: int) -> dict:
+    stored = make_stored_blocks(tx_count, per_block)
+    gc.collect()
+    before = resident_bytes()
+    if representation == "dicts":
+        chain = [json.loads(record) for record in stored]
+    else:
+        chain = [Block.from_dict(json.loads(record)) for record in stored]
+    gc.collect()
+    used = resident_bytes() - before
+    hashes = [legacy_block_hash(b) if representation == "dicts" else b.calculate_hash() for b in chain]
+    return {'bytes': used, 'chain_digest': hashlib.sha256("".join(hashes).encode('utf-8')).hexdigest()}
+
+def main():
+    parser = argparse.ArgumentParser(description="Resident memory of plain-dict vs. Block (columnar) chains.")
+    parser.add_argument("--transactions", type=int, default=100_000)
+    parser.add_argument("--per-block", type=int, default=100)
+    parser.add_argument("--measure", choices=("dicts", "blocks"), help=argparse.SUPPRESS) # Child process mode
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(args.measure, args.transactions, args.per_block)))
+        return
+
+    results = {}
+    for representation in ("dicts", "blocks"):
+        child = subprocess.run([sys.executable, "-m", "benchmarks.memory", "--measure", representation,
+                                "--transactions", str(args.transactions), "--per-block", str(args.per_block)],
+                               capture_output=True, text=True, check=True)
+        results[representation] = json.loads(child.stdout)
+    assert results["dicts"]["chain_digest"] == results["blocks"]["chain_digest"], "Block hashes changed."
+
+    tx_total = args.transactions // args.per_block * args.per_block
+    print(f"{tx_total} transactions in blocks of {args.per_block} (block hashes identical)")
+    for representation, label in (("dicts", "plain dicts"), ("blocks", "Block objects")):
+        used = results[representation]["bytes"]
+        print(f"  {label:<14} {used / 1e6:8.1f} MB RSS  {used / tx_total:7.0f} B/tx")
+    print(f"  reduction      {results['dicts']['bytes'] / max(1, results['blocks']['bytes']):8.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+# benchmarks/persistence_modes.py
+#
+# What each durability mode of the persistence scheduler (persistence.py) costs the web API.
+# --threads sender threads each post --requests signed transfers through Flask test clients, once
+# per mode, against the app's real block log (fsync_policy "always") in a temporary directory.
+# Reported per mode: request throughput, p50/p99 latency of add-transaction, and how many writes of
+# the block log the requests took. Run from the project root:
+#
+#     python -m benchmarks.persistence_modes [--threads 8] [--requests 50] [--max-delay-ms 10]
+
+import argparse
+import contextlib
+import io
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+def percentile(values: list[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def main():
+    parser = argparse.ArgumentParser(description="add-transaction latency and block log writes per durability mode.")
+    parser.add_argument("--threads", type=int, default=8, help="Concurrent sender threads.")
+    parser.add_argument("--requests", type=int, default=50, help="Transfers posted by each thread, per mode.")
+    parser.add_argument("--max-delay-ms", type=float, default=10.0, help="Group commit delay (PERSIST_MAX_DELAY_MS).")
+    parser.add_argument("--modes", default="sync,batched,async")
+    parser.add_argument("--verbose", action="store_true", help="Keep the server's log output.")
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix="chain-persistence-")) # app.py stores its chain in the working directory
+    log = sys.stdout if args.verbose else io.StringIO()
+    with contextlib.redirect_stdout(log):
+        import app
+        from miner import SequentialMiner
+        from transaction import new_nonce
+        from utils.crypto_utils import generate_key_pair, get_data_to_sign, sign_data
+
+        app.MINING_ENGINE = SequentialMiner()
+        app.init_blockchain()
+        app.blockchain.miner, app.blockchain.difficulty = app.MINING_ENGINE, 1
+        app.blockchain.mempool.max_transactions = app.blockchain.mempool.max_per_sender = 10**6 # Nothing is mined here
+        app.broadcast = lambda *_args, **_kwargs: None # No clients; payloads are still built
+        app.persistence.max_delay = args.max_delay_ms / 1000
+        keys = [generate_key_pair() for _ in range(args.threads + 1)]
+        client = app.app.test_client()
+        for _priv, pub in keys: # Grants are mined by mining jobs; wait for each before sending
+            response = client.post('/api/faucet/request-welcome-bonus', json={'recipient_public_key': pub})
+            assert response.status_code == 202 and app.mining_jobs.get(response.json['job']['job_id']).wait(60)
+
+    rows = []
+    for mode in args.modes.split(","):
+        assert client.post('/api/persistence', json={'mode': mode}).json['success'], mode
+        saves_before = app.persistence.saves
+        latencies, failures, lock = [], [], threading.Lock()
+
+        def sender(position):
+            thread_client, (priv, pub) = app.app.test_client(), keys[position]
+            recipient = keys[position + 1][1]
+            for _ in range(args.requests):
+                nonce = new_nonce() # Keeps every transfer unique
+                payload = {'sender_public_key': pub, 'recipient_public_key': recipient, 'amount': 1, 'fee': 0, 'nonce': nonce,
+                           'signature': sign_data(priv, get_data_to_sign(pub, recipient, 1, 0, nonce))}
+                started = time.perf_counter()
+                response = thread_client.post('/api/blockchain/add-transaction', json=payload)
+                elapsed = time.perf_counter() - started
+                with lock:
+                    if response.status_code == 200:
+                        latencies.append(elapsed)
+                    else:
+                        failures.append(response.get_data(as_text=True)[:200])
+
+        threads = [threading.Thread(target=sender, args=(i,)) for i in range(args.threads)]
+        with contextlib.redirect_stdout(log):
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+            app.persistence.flush() # Count "async" writes still waiting too
+        if failures:
+            print(f"{mode}: {len(failures)} request(s) failed, first: {failures[0]}")
+            sys.exit(1)
+        writes = app.persistence.saves - saves_before
+        rows.append((mode, len(latencies) / elapsed, statistics.median(latencies) * 1000,
+                     percentile(latencies, 0.99) * 1000, writes, len(latencies) / max(1, writes)))
+
+    print(f"{args.threads} threads x {args.requests} add-transaction requests per mode, "
+          f"group delay {args.max_delay_ms:g} ms, fsync_policy={app.STORAGE.fsync_policy}")
+    print(f"{'mode':<10}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'writes':>10}{'tx/write':>10}")
+    for mode, rate, p50, p99, writes, per_write in rows:
+        print(f"{mode:<10}{rate:>10.0f}{p50:>10.1f}{p99:>10.1f}{writes:>10}{per_write:>10.1f}")
+    with contextlib.redirect_stdout(log):
+        app.persistence.close()
+
+if __name__ == '__main__':
+    main()
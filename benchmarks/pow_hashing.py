@@ -0,0 +1,56 @@
+# benchmarks/pow_hashing.py
+#
+# Compares Proof-of-Work hashing throughput of Block.calculate_hash() (re-serializes the
+# whole block per nonce) against the mining-mode BlockMiningHasher (serialize once,
+# reuse the SHA-256 midstate). Run from the project root:
+#
+#     python -m benchmarks.pow_hashing [--attempts N]
+
+import argparse
+import time
+
+from block import Block
+from predefined_users import PREDEFINED_USERS_DATA
+
+def make_block(tx_count: int) -> Block:
+    """Builds a block with tx_count realistic (full PEM key) transactions."""
+    keys = [user["public_key_pem"] for user in PREDEFINED_USERS_DATA]
+    transactions = [{
+        'sender_public_key': keys[i % len(keys)],
+        'recipient_public_key': keys[(i + 1) % len(keys)],
+        'amount': 10.0 + i,
+        'signature': 'ab' * 64
+    } for i in range(tx_count)]
+    return Block(1, transactions, time.time(), "0" * 64)
+
+def hashes_per_second_legacy(block: Block, attempts: int) -> float:
+    start_time = time.perf_counter()
+    for nonce in range(attempts):
+        block.nonce = nonce
+        block.calculate_hash()
+    return attempts / (time.perf_counter() - start_time)
+
+def hashes_per_second_midstate(block: Block, attempts: int) -> float:
+    start_time = time.perf_counter()
+    hash_for_nonce = block.mining_hasher().hash_for_nonce # Setup cost is included
+    for nonce in range(attempts):
+        hash_for_nonce(nonce)
+    return attempts / (time.perf_counter() - start_time)
+
+def main():
+    parser = argparse.ArgumentParser(description="PoW hashing throughput: calculate_hash vs. midstate hasher.")
+    parser.add_argument("--attempts", type=int, default=20000, help="Nonces tried per measurement.")
+    args = parser.parse_args()
+
+    print(f"{'txs':>6} {'calculate_hash H/s':>20} {'midstate H/s':>15} {'speedup':>8}")
+    for tx_count in (1, 10, 100, 1000):
+        block = make_block(tx_count)
+        attempts = max(200, args.attempts // max(1, tx_count // 10))
+        expected = block.mining_hasher().hash_for_nonce(attempts - 1)
+        legacy_rate = hashes_per_second_legacy(block, attempts)
+        assert block.calculate_hash() == expected, "Midstate hash differs from consensus hash."
+        midstate_rate = hashes_per_second_midstate(block, attempts)
+        print(f"{tx_count:>6} {legacy_rate:>20.0f} {midstate_rate:>15.0f} {midstate_rate / legacy_rate:>7.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+# benchmarks/serialization.py
+#
+# Compares the JSON block form (json.dumps with sort_keys=True, as used for legacy hashing and
+# JSON storage records) with the binary encoding of utils/binary_codec.py: encoded size, encode
+# and decode throughput, and block hashing (legacy JSON hash vs. binary-format header hash).
+# Every block is round-tripped through both forms first. Run from the project root:
+#
+#     python -m benchmarks.serialization [--repeat N]
+
+import argparse
+import json
+import time
+
+from block import Block, BLOCK_VERSION_BINARY
+from predefined_users import PREDEFINED_USERS_DATA
+from utils.addresses import address_of
+from utils.amounts import COIN
+from utils.binary_codec import decode_block
+
+def make_block(tx_count: int, version: int) -> Block:
+    """Builds a block with tx_count address-form transactions carrying realistic signatures."""
+    addresses = [address_of(user["public_key_pem"]) for user in PREDEFINED_USERS_DATA]
+    transactions = [{
+        'sender_public_key': addresses[i % len(addresses)],
+        'recipient_public_key': addresses[(i + 1) % len(addresses)],
+        'amount': (1000 + i) * COIN // 100,
+        'signature': 'ab' * 64
+    } for i in range(tx_count)]
+    return Block(1, transactions, time.time(), "0" * 64, version=version)
+
+def rate(func, repeat: int) -> float:
+    """Calls func() `repeat` times and returns calls per second."""
+    start_time = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return repeat / (time.perf_counter() - start_time)
+
+def main():
+    parser = argparse.ArgumentParser(description="Block serialization: JSON vs. binary encoding.")
+    parser.add_argument("--repeat", type=int, default=2000, help="Operations per measurement (scaled down for large blocks).")
+    args = parser.parse_args()
+
+    print(f"{'txs':>6} {'JSON B':>9} {'bin B':>9} {'enc JSON/s':>11} {'enc bin/s':>10} "
+          f"{'dec JSON/s':>11} {'dec bin/s':>10} {'hash v1/s':>10} {'hash v3/s':>10}")
+    for tx_count in (1, 10, 100, 1000):
+        legacy_block = make_block(tx_count, 1)
+        binary_block = make_block(tx_count, BLOCK_VERSION_BINARY)
+        repeat = max(20, args.repeat // max(1, tx_count // 10))
+
+        json_bytes = json.dumps(legacy_block.to_dict(), sort_keys=True).encode('utf-8')
+        binary_bytes = legacy_block.to_bytes()
+        assert Block.from_dict(json.loads(json_bytes)).to_dict() == legacy_block.to_dict()
+        assert Block.from_bytes(binary_bytes).to_dict() == legacy_block.to_dict(), "Binary round trip changed the block."
+
+        results = [
+            rate(lambda: json.dumps(legacy_block.to_dict(), sort_keys=True).encode('utf-8'), repeat),
+            rate(legacy_block.to_bytes, repeat),
+            rate(lambda: json.loads(json_bytes), repeat),
+            rate(lambda: decode_block(binary_bytes), repeat),
+            rate(legacy_block.calculate_hash, repeat),
+            rate(binary_block.calculate_hash, repeat),
+        ]
+        print(f"{tx_count:>6} {len(json_bytes):>9} {len(binary_bytes):>9} " +
+              " ".join(f"{value:>{width}.0f}" for value, width in zip(results, (11, 10, 11, 10, 10, 10))))
+
+if __name__ == '__main__':
+    main()
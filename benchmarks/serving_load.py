@@ -0,0 +1,306 @@
+# benchmarks/serving_load.py
+#
+# Load test of the two serving modes: the threaded Flask-SocketIO server of `python app.py` and the
+# asyncio server of asgi_server.py. Each server is started in a fresh temporary directory. The test
+# then opens --connections Socket.IO connections over websockets, each syncing the chain the way a
+# browser does on connect, and keeps them open (answering pings). While they are held, --concurrency
+# keep-alive HTTP clients send read requests (block pages, balances, the mempool, the user
+# directory) for --seconds seconds, and --writers clients keep requesting faucet grants, each of which
+# queues a mining job that mines a block, persists it and broadcasts it to every held connection (the
+# writer follows the job until it finishes). Reported: connections
+# established and still open at the end, read requests/sec with p50/p99 latency, and writes
+# completed. The client needs only the standard library. The asyncio server needs uvicorn and is
+# skipped without it. Run from the project root:
+#
+#     python -m benchmarks.serving_load [--server threading|asgi|both] [--connections 500] [--seconds 10]
+#     python -m benchmarks.serving_load --url http://127.0.0.1:5000   # an already running server
+
+import argparse
+import asyncio
+import base64
+import importlib.util
+import json
+import os
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import quote, urlsplit
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVER_COMMANDS = {
+    'threading': [sys.executable, "-c", "import app; app.socketio.run(app.app, host='127.0.0.1', port={port}, allow_unsafe_werkzeug=True)"],
+    'asgi': [sys.executable, os.path.join(PROJECT_ROOT, "asgi_server.py"), "--host", "127.0.0.1", "--port", "{port}"],
+}
+
+
+# --- Minimal HTTP/1.1 and websocket clients on asyncio streams ---
+async def read_http_response(reader: asyncio.StreamReader) -> tuple[int, dict, bytes]:
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode('latin-1').split("\r\n")
+    status = int(lines[0].split(" ")[1])
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+    if 'content-length' in headers:
+        body = await reader.readexactly(int(headers['content-length']))
+    elif headers.get('transfer-encoding', "").lower() == "chunked":
+        body = b""
+        while True:
+            size = int((await reader.readuntil(b"\r\n")).split(b";")[0], 16)
+            body += await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    elif status in (101, 204, 304):
+        body = b""
+    else:
+        body, headers['connection'] = await reader.read(), "close"
+    return status, headers, body
+
+class HttpClient:
+    """One keep-alive HTTP connection; reconnects whenever the server closes it."""
+    def __init__(self, host: str, port: int):
+        self.host, self.port = host, port
+        self.reader = self.writer = None
+
+    async def request(self, method: str, path: str, payload: dict | None = None) -> tuple[int, bytes]:
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        body = json.dumps(payload).encode('utf-8') if payload is not None else b""
+        head = f"{method} {path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\nContent-Length: {len(body)}\r\n"
+        if payload is not None:
+            head += "Content-Type: application/json\r\n"
+        self.writer.write(head.encode('latin-1') + b"\r\n" + body)
+        try:
+            status, headers, response_body = await read_http_response(self.reader)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            self.close()
+            raise
+        if headers.get('connection', "").lower() == "close":
+            self.close()
+        return status, response_body
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+async def read_ws_message(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> str | None:
+    """Next text message from the server (None once it closes); control frames are handled here."""
+    message = b""
+    while True:
+        first, second = await reader.readexactly(2)
+        length = second & 0x7F
+        if length == 126:
+            length = int.from_bytes(await reader.readexactly(2), 'big')
+        elif length == 127:
+            length = int.from_bytes(await reader.readexactly(8), 'big')
+        data = await reader.readexactly(length)
+        opcode = first & 0x0F
+        if opcode == 0x8:
+            return None
+        if opcode == 0x9:
+            send_ws_frame(writer, data, opcode=0xA)
+            continue
+        if opcode in (0x0, 0x1, 0x2):
+            message += data
+            if first & 0x80:
+                return message.decode('utf-8')
+
+def send_ws_frame(writer: asyncio.StreamWriter, data: bytes, opcode: int = 0x1):
+    mask = os.urandom(4) # Client frames must be masked
+    header = bytes([0x80 | opcode])
+    if len(data) < 126:
+        header += bytes([0x80 | len(data)])
+    elif len(data) < 1 << 16:
+        header += bytes([0x80 | 126]) + len(data).to_bytes(2, 'big')
+    else:
+        header += bytes([0x80 | 127]) + len(data).to_bytes(8, 'big')
+    writer.write(header + mask + bytes(b ^ mask[i % 4] for i, b in enumerate(data)))
+
+async def open_socketio(host: str, port: int) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    """Opens a Socket.IO connection over a websocket and syncs the chain, as the browser client does."""
+    reader, writer = await asyncio.open_connection(host, port)
+    key = base64.b64encode(os.urandom(16)).decode('ascii')
+    writer.write((f"GET /socket.io/?EIO=4&transport=websocket HTTP/1.1\r\nHost: {host}:{port}\r\n"
+                  f"Upgrade: websocket\r\nConnection: Upgrade\r\nSec-WebSocket-Key: {key}\r\n"
+                  f"Sec-WebSocket-Version: 13\r\n\r\n").encode('latin-1'))
+    status, _headers, _body = await read_http_response(reader)
+    if status != 101:
+        raise ConnectionError(f"Websocket upgrade refused ({status})")
+    expected = ("0", "40", '42["blockchain_updated"') # Engine.IO open, Socket.IO connect, sync reply
+    for step, prefix in enumerate(expected):
+        if step == 1:
+            send_ws_frame(writer, b"40")
+        elif step == 2:
+            send_ws_frame(writer, b'42["sync_request",{"height":0,"reason":"load test"}]')
+        while True:
+            message = await read_ws_message(reader, writer)
+            if message is None:
+                raise ConnectionError("Connection closed during the Socket.IO handshake")
+            if message == "2":
+                send_ws_frame(writer, b"3")
+            elif message.startswith(prefix):
+                break
+    return reader, writer
+
+async def hold_socketio(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, counts: dict):
+    """Keeps a connection open until the server closes it, answering pings and counting broadcasts."""
+    try:
+        while (message := await read_ws_message(reader, writer)) is not None:
+            if message == "2":
+                send_ws_frame(writer, b"3")
+            elif message.startswith("42"):
+                counts['events'] += 1
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+
+
+# --- The load test ---
+def percentile(values: list[float], fraction: float) -> float:
+    return sorted(values)[min(len(values) - 1, int(len(values) * fraction))] if values else 0.0
+
+async def run_load(host: str, port: int, args) -> dict:
+    setup = HttpClient(host, port)
+    _status, body = await setup.request("GET", "/api/users/directory")
+    keys = [user['public_key_pem'] for user in json.loads(body)]
+    setup.close()
+
+    counts = {'events': 0}
+    opened, failures, semaphore = [], [], asyncio.Semaphore(args.connect_concurrency)
+    async def connect():
+        async with semaphore:
+            try:
+                opened.append(await asyncio.wait_for(open_socketio(host, port), args.timeout))
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+                failures.append(type(e).__name__)
+    started = time.perf_counter()
+    await asyncio.gather(*(connect() for _ in range(args.connections)))
+    connect_seconds = time.perf_counter() - started
+    holders = [asyncio.create_task(hold_socketio(reader, writer, counts)) for reader, writer in opened]
+
+    latencies, errors, writes = [], [], []
+    deadline = time.perf_counter() + args.seconds
+    async def reader_client(seed: int):
+        rng, client = random.Random(seed), HttpClient(host, port)
+        while time.perf_counter() < deadline:
+            path = rng.choice(("/api/blocks?limit=20", "/api/mempool", "/api/users/directory",
+                               f"/api/blockchain/balance?key={quote(rng.choice(keys))}"))
+            sent = time.perf_counter()
+            try:
+                status, _body = await client.request("GET", path)
+            except (OSError, asyncio.IncompleteReadError) as e:
+                errors.append(type(e).__name__)
+                continue
+            latencies.append(time.perf_counter() - sent)
+            if status != 200:
+                errors.append(str(status))
+        client.close()
+    async def writer_client():
+        client = HttpClient(host, port)
+        while time.perf_counter() < deadline:
+            try:
+                status, body = await client.request("POST", "/api/faucet/request-welcome-bonus",
+                                                    {'recipient_public_key': random.choice(keys)})
+                if status != 202:
+                    writes.append(status)
+                    continue
+                job_path = f"/api/mining/jobs/{json.loads(body)['job']['job_id']}"
+                while True: # The grant is mined by a mining job; follow it until it finishes
+                    status, body = await client.request("GET", job_path)
+                    job_status = json.loads(body)['job']['status'] if status == 200 else "failed"
+                    if job_status not in ("queued", "running"):
+                        break
+                    await asyncio.sleep(0.05)
+                writes.append(200 if job_status == "completed" else job_status)
+            except (OSError, asyncio.IncompleteReadError) as e:
+                errors.append(type(e).__name__)
+        client.close()
+    load_started = time.perf_counter()
+    await asyncio.gather(*(writer_client() for _ in range(args.writers)), *(reader_client(i) for i in range(args.concurrency)))
+    load_seconds = time.perf_counter() - load_started
+
+    still_open = sum(1 for task in holders if not task.done())
+    for _reader, writer in opened:
+        writer.close()
+    await asyncio.gather(*holders)
+    return {'connected': len(opened), 'connect_failures': len(failures), 'connect_seconds': connect_seconds,
+            'still_open': still_open, 'broadcasts_received': counts['events'], 'reads': len(latencies),
+            'reads_per_second': len(latencies) / load_seconds, 'p50_ms': statistics.median(latencies) * 1000 if latencies else 0.0,
+            'p99_ms': percentile(latencies, 0.99) * 1000, 'errors': len(errors), 'writes': sum(1 for status in writes if status == 200)}
+
+async def wait_until_serving(host: str, port: int, process: subprocess.Popen, timeout: float):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}")
+        client = HttpClient(host, port)
+        try:
+            if (await client.request("GET", "/api/blocks?limit=1"))[0] == 200:
+                return
+        except (OSError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            client.close()
+        await asyncio.sleep(0.5)
+    raise RuntimeError("Server did not start in time")
+
+def run_server(mode: str, args) -> dict:
+    """Starts a server of the given mode in a temporary directory, load-tests it and stops it."""
+    workdir = tempfile.mkdtemp(prefix=f"serving-{mode}-")
+    command = [part.format(port=args.port) for part in SERVER_COMMANDS[mode]]
+    env = dict(os.environ, PYTHONPATH=PROJECT_ROOT, PYTHONUNBUFFERED="1")
+    with open(os.path.join(workdir, "server.log"), "w") as log:
+        process = subprocess.Popen(command, cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+        try:
+            asyncio.run(wait_until_serving("127.0.0.1", args.port, process, args.startup_timeout))
+            return asyncio.run(run_load("127.0.0.1", args.port, args))
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+
+def main():
+    parser = argparse.ArgumentParser(description="Connections held and requests/sec: threaded vs. asyncio server.")
+    parser.add_argument("--server", choices=("threading", "asgi", "both"), default="both")
+    parser.add_argument("--url", help="Load-test an already running server instead of starting one.")
+    parser.add_argument("--port", type=int, default=5077, help="Port for the servers this script starts.")
+    parser.add_argument("--connections", type=int, default=500, help="Socket.IO connections to open and hold.")
+    parser.add_argument("--connect-concurrency", type=int, default=50, help="Handshakes in flight at once.")
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent HTTP read clients.")
+    parser.add_argument("--writers", type=int, default=1, help="Clients requesting faucet grants (0 = reads only).")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--timeout", type=float, default=30.0, help="Seconds allowed per Socket.IO handshake.")
+    parser.add_argument("--startup-timeout", type=float, default=180.0)
+    args = parser.parse_args()
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE) # Every held connection is a file descriptor
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    if args.connections + args.concurrency + 64 > hard:
+        print(f"Warning: the open file limit ({hard}) is below the connections requested.")
+
+    results = {}
+    if args.url:
+        target = urlsplit(args.url)
+        results[args.url] = asyncio.run(run_load(target.hostname, target.port or 80, args))
+    else:
+        for mode in (("threading", "asgi") if args.server == "both" else (args.server,)):
+            if mode == "asgi" and importlib.util.find_spec("uvicorn") is None:
+                print("Skipping the asyncio server: uvicorn is not installed (pip install uvicorn).")
+                continue
+            results[mode] = run_server(mode, args)
+
+    print(f"{args.connections} Socket.IO connections requested, {args.concurrency} HTTP read clients and "
+          f"{args.writers} writer(s) for {args.seconds:.0f}s")
+    print(f"  {'server':<12} {'connected':>9} {'open at end':>11} {'connect s':>9} {'reads/s':>9} {'p50 ms':>8} "
+          f"{'p99 ms':>8} {'errors':>7} {'writes':>7} {'events':>8}")
+    for name, r in results.items():
+        print(f"  {name:<12} {r['connected']:>9} {r['still_open']:>11} {r['connect_seconds']:>9.1f} {r['reads_per_second']:>9.0f} "
+              f"{r['p50_ms']:>8.1f} {r['p99_ms']:>8.1f} {r['errors']:>7} {r['writes']:>7} {r['broadcasts_received']:>8}")
+
+if __name__ == '__main__':
+    main()
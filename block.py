@@ -3,6 +3,17 @@
 import hashlib 
 import json    
 import time    
+from utils.binary_codec import NONCE, decode_block, encode_block, encode_block_header
+from utils.merkle import build_merkle_proof, compute_merkle_root, hash_transaction, verify_merkle_proof
+from utils.tx_columns import TransactionColumns
+
+# Block format versions. Legacy blocks hash their full transaction list; Merkle blocks
+# hash a fixed-size header that commits to the transactions through a Merkle root; binary
+# blocks hash the same header in the binary encoding of utils/binary_codec.py instead of JSON.
+BLOCK_VERSION_LEGACY = 1
+BLOCK_VERSION_MERKLE = 2
+BLOCK_VERSION_BINARY = 3
+BLOCK_VERSIONS = (BLOCK_VERSION_LEGACY, BLOCK_VERSION_MERKLE, BLOCK_VERSION_BINARY)
 
 class Block:
     """
@@ -10,8 +21,13 @@ class Block:
     A block contains an index, a list of transactions (stored as dictionaries),
     a timestamp, the hash of the preceding block, a nonce (for Proof-of-Work),
     and its own calculated hash.
+    Attributes are fixed (__slots__) and the transactions are kept in a TransactionColumns store
+    where possible, which keeps long chains small in memory; to_dict() gives the stored form.
     """
-    def __init__(self, index: int, transactions: list[dict], timestamp: float, previous_hash: str, nonce: int = 0):
+    __slots__ = ('index', 'transactions', 'timestamp', 'previous_hash', 'nonce', 'version', 'merkle_root', 'hash')
+
+    def __init__(self, index: int, transactions: list[dict], timestamp: float, previous_hash: str, nonce: int = 0,
+                 version: int = BLOCK_VERSION_LEGACY):
         """
         Initializes a new block.
 
@@ -22,57 +38,209 @@ class Block:
             timestamp (float): The time the block was created (Unix timestamp).
             previous_hash (str): The hash of the preceding block in the chain.
             nonce (int, optional): The nonce value found during Proof-of-Work. Defaults to 0.
+            version (int, optional): Block format version (one of BLOCK_VERSIONS). Defaults to the legacy format.
         """
+        if version not in BLOCK_VERSIONS:
+            raise ValueError(f"Unsupported block version: {version}")
         self.index: int = index
         # Ensure transactions are stored as a list of dictionaries.
         # If Transaction objects were passed, they should be converted to dicts before Block init.
-        if not all(isinstance(tx, dict) for tx in transactions):
-            raise TypeError("Block transactions must be a list of dictionaries.")
-        self.transactions: list[dict] = transactions 
+        if not isinstance(transactions, TransactionColumns):
+            if not all(isinstance(tx, dict) for tx in transactions):
+                raise TypeError("Block transactions must be a list of dictionaries.")
+            # Dicts the columns cannot reproduce exactly (e.g. non-hex signatures) stay a plain list.
+            columns = TransactionColumns.from_dicts(transactions)
+            transactions = columns if columns is not None else list(transactions)
+        self.transactions: TransactionColumns | list[dict] = transactions
         self.timestamp: float = timestamp
         self.previous_hash: str = previous_hash
         self.nonce: int = nonce
+        self.version: int = version
+        # Merkle and binary blocks commit to their transactions through a root in the header.
+        self.merkle_root: str | None = (compute_merkle_root(self.transaction_hashes())
+                                        if version != BLOCK_VERSION_LEGACY else None)
         # The hash of the block is calculated based on its content, including the nonce.
         # It's calculated upon initialization and will be recalculated during mining if nonce changes.
         self.hash: str = self.calculate_hash()
 
-    def calculate_hash(self) -> str:
+    @classmethod
+    def from_dict(cls, block_data: dict) -> 'Block':
+        """
+        Creates a Block from its stored dictionary form (Block.to_dict()).
+        The stored hash is kept as-is rather than recalculated (unless missing), so
+        tampering is caught by validation instead of being silently repaired.
+        """
+        block = cls(
+            index=block_data['index'],
+            transactions=block_data['transactions'],
+            timestamp=block_data['timestamp'],
+            previous_hash=block_data['previous_hash'],
+            nonce=block_data['nonce'],
+            # Data written before versioned blocks has no 'version' key: legacy format.
+            version=block_data.get('version', BLOCK_VERSION_LEGACY)
+        )
+        block.hash = block_data.get('hash', block.hash)
+        return block
+
+    def to_dict(self) -> dict:
+        """Returns the stored dictionary form of the block, with the transactions as a list of dicts."""
+        return {
+            'index': self.index,
+            'transactions': list(self.transactions),
+            'timestamp': self.timestamp,
+            'previous_hash': self.previous_hash,
+            'nonce': self.nonce,
+            'version': self.version,
+            'merkle_root': self.merkle_root,
+            'hash': self.hash
+        }
+
+    def to_bytes(self) -> bytes:
+        """
+        Binary encoding of the whole block (see utils/binary_codec.py). Raises ValueError if the block
+        holds values the binary format cannot reproduce exactly; JSON remains available for those.
+        """
+        return encode_block(self.to_dict())
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'Block':
+        return cls.from_dict(decode_block(data))
+
+    def transaction_hashes(self) -> list[str]:
+        """Returns the hash of every transaction in the block, in block order (the Merkle leaves)."""
+        return [hash_transaction(tx) for tx in self.transactions]
+
+    def repeated_transaction_position(self) -> int | None:
+        """
+        Returns the position of the first transaction that repeats an earlier one (same hash), or None.
+        A Merkle tree pairs an odd last node with itself, so repeating the final transaction(s) of a
+        Merkle block leaves its root, and therefore its hash, unchanged (CVE-2012-2459). Merkle blocks
+        that repeat a transaction are rejected by the chain for that reason.
         """
-        Calculates the SHA-256 hash of the block's content.
-        The content includes index, transactions (as sorted JSON string),
-        timestamp, previous_hash, and nonce.
+        seen = set()
+        for position, tx_hash in enumerate(self.transaction_hashes()):
+            if tx_hash in seen:
+                return position
+            seen.add(tx_hash)
+        return None
+
+    def hash_content(self) -> dict:
         """
-        block_content = {
+        Returns the dictionary that is serialized and hashed to produce the block hash.
+        Legacy blocks hash index, transactions, timestamp, previous_hash and nonce;
+        Merkle blocks replace the transaction list with its Merkle root and add the version.
+        Binary blocks hash header_bytes() instead; this is their JSON-equivalent header.
+        """
+        if self.version != BLOCK_VERSION_LEGACY:
+            return {
+                'version': self.version,
+                'index': self.index,
+                'merkle_root': self.merkle_root,
+                'timestamp': self.timestamp,
+                'previous_hash': self.previous_hash,
+                'nonce': self.nonce
+            }
+        return {
             'index': self.index,
             # Transactions are already dicts. sort_keys=True in json.dumps
             # handles sorting keys *within* each transaction dictionary.
             # The order of transactions in the list self.transactions is preserved as is,
             # which is important for deterministic hashing.
-            'transactions': self.transactions,
+            'transactions': list(self.transactions),
             'timestamp': self.timestamp,
             'previous_hash': self.previous_hash,
             'nonce': self.nonce
         }
 
+    def header_bytes(self) -> bytes:
+        """Binary header hashed by binary-format blocks, without the trailing 8-byte nonce."""
+        return encode_block_header(self.version, self.index, self.timestamp, self.previous_hash, self.merkle_root)
+
+    def calculate_hash(self) -> str:
+        """
+        Calculates the SHA-256 hash of the block's content (see hash_content), or of its binary
+        header followed by the nonce for binary-format blocks.
+        """
+        if self.version == BLOCK_VERSION_BINARY:
+            return hashlib.sha256(self.header_bytes() + NONCE.pack(self.nonce)).hexdigest()
         # Serialize the entire block content dictionary to a JSON string.
         # `sort_keys=True` ensures dictionary keys are always in alphabetical order within the JSON structure.
         # `.encode('utf-8')` converts the string to bytes for hashlib.
-        block_string = json.dumps(block_content, sort_keys=True).encode('utf-8')
+        block_string = json.dumps(self.hash_content(), sort_keys=True).encode('utf-8')
         sha256_hasher = hashlib.sha256()
         sha256_hasher.update(block_string)
         return sha256_hasher.hexdigest()
 
+    def merkle_proof(self, position: int) -> list[tuple[str, str]]:
+        """
+        Returns a Merkle inclusion proof for the transaction at `position`.
+        Only available for blocks with a Merkle root (not the legacy format).
+        """
+        if self.merkle_root is None:
+            raise ValueError(f"Block #{self.index} uses the legacy format and has no Merkle root.")
+        return build_merkle_proof(self.transaction_hashes(), position)
+
+    def verify_transaction_proof(self, tx_dict: dict, proof: list[tuple[str, str]]) -> bool:
+        """Checks that a transaction is included in this block using a Merkle proof."""
+        if self.merkle_root is None:
+            return False
+        return verify_merkle_proof(hash_transaction(tx_dict), proof, self.merkle_root)
+
+    def mining_hasher(self) -> 'BlockMiningHasher':
+        """Returns a hasher that recomputes this block's hash for arbitrary nonces without re-serializing it."""
+        return BlockMiningHasher(self)
+
     def __repr__(self) -> str:
         # Truncate hash for display if it's too long
         hash_display = self.hash[:10] + "..." if len(self.hash) > 20 else self.hash
         prev_hash_display = self.previous_hash[:10] + "..." if self.previous_hash != "0" and len(self.previous_hash) > 20 else self.previous_hash
         
         return (f"Block(index={self.index}, "
+                f"version={self.version}, "
                 f"tx_count={len(self.transactions)}, "
                 f"prev_hash='{prev_hash_display}', "
                 f"nonce={self.nonce}, "
                 f"hash='{hash_display}')")
 
+class BlockMiningHasher:
+    """
+    Mining-mode hashing for a block whose content is fixed except for the nonce.
+
+    The canonical serialization (json.dumps with sort_keys=True) is produced once and
+    split around the nonce value. With sorted keys the legacy layout is
+    '{"index": N, "nonce": <nonce>, "previous_hash": ..., "timestamp": ..., "transactions": [...]}',
+    so the SHA-256 state after the prefix (the "midstate") is computed once and copied
+    for every attempt, and only the nonce digits plus the pre-encoded suffix are fed in.
+    The resulting hash is byte-for-byte identical to Block.calculate_hash().
+    Binary-format blocks already end their hashed bytes with the nonce, so the midstate
+    simply covers the whole header.
+    """
+    _NONCE_KEY = '"nonce": '
+
+    def __init__(self, block: Block):
+        self._binary: bool = block.version == BLOCK_VERSION_BINARY
+        if self._binary:
+            self._midstate = hashlib.sha256(block.header_bytes())
+            return
+        block_content = block.hash_content()
+        block_content['nonce'] = 0
+        block_string = json.dumps(block_content, sort_keys=True)
+        # Only "index" (an int) and, for Merkle blocks, "merkle_root" (a hex string) sort
+        # before "nonce", so the first match is always the top-level nonce.
+        nonce_pos = block_string.index(self._NONCE_KEY) + len(self._NONCE_KEY)
+        self._suffix: bytes = block_string[nonce_pos + len('0'):].encode('utf-8')
+        self._midstate = hashlib.sha256(block_string[:nonce_pos].encode('utf-8'))
+
+    def hash_for_nonce(self, nonce: int) -> str:
+        """Returns the block hash the block would have with the given nonce."""
+        sha256_hasher = self._midstate.copy()
+        if self._binary:
+            sha256_hasher.update(NONCE.pack(nonce))
+            return sha256_hasher.hexdigest()
+        sha256_hasher.update(str(nonce).encode('ascii') + self._suffix)
+        return sha256_hasher.hexdigest()
+
+
 if __name__ == '__main__':
     print("--- Testing Block Class ---")
     sample_tx_dicts = [
@@ -112,4 +280,43 @@ if __name__ == '__main__':
     block_two_data_B = Block(2, [{'tx':'B'}], block_two_data_A.timestamp, block_one.hash, 0) # Same timestamp and index for direct tx comparison
     assert block_two_data_A.hash != block_two_data_B.hash, "Changing transactions should change hash."
     
+    # Test that mining-mode hashing matches the consensus hash for any nonce
+    mining_hasher = block_one.mining_hasher()
+    for test_nonce in (0, 7, 102, 123456789):
+        block_one.nonce = test_nonce
+        assert mining_hasher.hash_for_nonce(test_nonce) == block_one.calculate_hash(), "Mining hasher diverged from calculate_hash."
+
+    # Test Merkle-format blocks: header hashing, inclusion proofs and mining-mode hashing
+    merkle_block = Block(3, sample_tx_dicts, time.time(), block_one.hash, 5, version=BLOCK_VERSION_MERKLE)
+    assert merkle_block.hash == merkle_block.calculate_hash()
+    assert merkle_block.hash != Block(3, sample_tx_dicts, merkle_block.timestamp, block_one.hash, 5).hash
+    for position, tx_dict in enumerate(sample_tx_dicts):
+        assert merkle_block.verify_transaction_proof(tx_dict, merkle_block.merkle_proof(position)), "Merkle proof rejected."
+    assert not merkle_block.verify_transaction_proof({'tx': 'forged'}, merkle_block.merkle_proof(0)), "Forged proof accepted."
+    tampered_block = Block(3, sample_tx_dicts[:1], merkle_block.timestamp, block_one.hash, 5, version=BLOCK_VERSION_MERKLE)
+    assert tampered_block.hash != merkle_block.hash, "Changing transactions should change the Merkle block hash."
+    assert merkle_block.mining_hasher().hash_for_nonce(5) == merkle_block.hash, "Mining hasher diverged for Merkle block."
+
+    # Test binary-format blocks: binary header hashing, proofs, mining-mode hashing and byte round trips
+    binary_block = Block(3, sample_tx_dicts, merkle_block.timestamp, block_one.hash, 5, version=BLOCK_VERSION_BINARY)
+    assert binary_block.hash == binary_block.calculate_hash() and binary_block.hash != merkle_block.hash
+    assert binary_block.merkle_root == merkle_block.merkle_root
+    assert binary_block.verify_transaction_proof(sample_tx_dicts[1], binary_block.merkle_proof(1))
+    for test_nonce in (0, 5, 2**40):
+        binary_block.nonce = test_nonce
+        assert binary_block.mining_hasher().hash_for_nonce(test_nonce) == binary_block.calculate_hash(), "Mining hasher diverged for binary block."
+    binary_block.nonce, binary_block.hash = 5, binary_block.calculate_hash()
+    # Columnar transaction storage (hex signatures) must not change what is hashed
+    hex_tx_dicts = [{**tx_dict, 'signature': 'ab' * 70} for tx_dict in sample_tx_dicts]
+    columnar_block = Block(4, hex_tx_dicts, merkle_block.timestamp, block_one.hash, 9)
+    assert isinstance(columnar_block.transactions, TransactionColumns) and isinstance(block_one.transactions, list)
+    expected_content = {'index': 4, 'transactions': hex_tx_dicts, 'timestamp': merkle_block.timestamp,
+                        'previous_hash': block_one.hash, 'nonce': 9}
+    assert columnar_block.hash == hashlib.sha256(json.dumps(expected_content, sort_keys=True).encode('utf-8')).hexdigest()
+    assert columnar_block.to_dict()['transactions'] == hex_tx_dicts
+    for original in (genesis_block, block_one, merkle_block, binary_block, columnar_block):
+        restored = Block.from_bytes(original.to_bytes())
+        assert restored.to_dict() == original.to_dict(), f"Block #{original.index} did not round-trip through bytes."
+        assert restored.calculate_hash() == original.calculate_hash()
+
     print("\nAll Block class self-tests passed!")
\ No newline at end of file
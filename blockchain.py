@@ -1,24 +1,226 @@
 # blockchain.py
 
+import threading
 import time
 import json
 import traceback # For more detailed error logging if needed
-from block import Block
-from transaction import Transaction
-from utils.crypto_utils import get_data_to_sign, verify_signature
+from block import Block, BLOCK_VERSION_LEGACY
+from mempool import SYSTEM_SENDERS, Mempool, stored_size
+from miner import MiningCancelled, MiningControl, MiningResult, SequentialMiner
+from transaction import MAX_NONCE, Transaction, new_nonce
+from utils.addresses import KeyRegistry, address_of, compact_tx_dict, is_address, is_public_key_pem
+from utils.amounts import COIN, format_amount, to_units, tx_dict_in_units
+from utils.crypto_utils import find_first_invalid_signature, get_data_to_sign, signature_digest, verify_signature, verify_signatures
+from utils.merkle import hash_transaction
+
+# Block template limits (node policy, not checked by validation). Bytes count the stored JSON form of
+# the transactions (see mempool.stored_size); both limits include the mining reward transaction.
+DEFAULT_MAX_BLOCK_TRANSACTIONS = 500
+DEFAULT_MAX_BLOCK_BYTES = 250_000
+# Stored size of the largest possible mining reward, reserved in every block's byte budget.
+_MAX_REWARD_AMOUNT = 2**63 - 1
+
+class ChainSnapshot:
+    """
+    Read-only view of a Blockchain as of its last completed write (see Blockchain.snapshot): the first
+    `height` blocks, the confirmed balances after them, and the pending pool at the same moment.
+    Writers publish a new snapshot instead of changing a published one, so readers use it without
+    locking and always see a chain, its balances and its pool that belong together.
+    """
+    __slots__ = ('height', 'tip_hash', '_chain', 'confirmed_balances', 'pending_transactions', 'pending_deltas', 'pending_removals')
+
+    def __init__(self, chain, confirmed_balances: dict[str, int], pending_transactions: tuple, pending_deltas: dict[str, int],
+                 pending_removals: int):
+        self._chain = chain # Append-only, so its first `height` blocks never change
+        self.height: int = len(chain)
+        self.tip_hash: str | None = chain[-1].hash if self.height else None
+        self.confirmed_balances: dict[str, int] = confirmed_balances # Address -> base units; never mutated
+        self.pending_transactions: tuple[Transaction, ...] = pending_transactions # Arrival order
+        self.pending_deltas: dict[str, int] = pending_deltas # See Mempool.pending_delta
+        self.pending_removals: int = pending_removals # Mempool.removal_count at the time
+
+    def get_block(self, position: int) -> Block | None:
+        return self._chain[position] if 0 <= position < self.height else None
+
+    def get_blocks(self, start: int = 0, limit: int | None = None) -> list[Block]:
+        """Blocks at chain positions start .. start + limit - 1 (up to the snapshot's height)."""
+        end = self.height if limit is None else min(self.height, start + limit)
+        return list(self._chain[start:end]) if 0 <= start < end else []
+
+    def get_balance(self, address_public_key: str, include_pending: bool = True) -> int:
+        """Like Blockchain.get_balance, as of this snapshot."""
+        address = address_of(address_public_key)
+        balance = self.confirmed_balances.get(address, 0)
+        return balance + self.pending_deltas.get(address, 0) if include_pending else balance
+
+    def __repr__(self) -> str:
+        return f"ChainSnapshot(height={self.height}, pending_tx={len(self.pending_transactions)})"
+
 
 class Blockchain:
     """
     Manages a chain of blocks, handles pending transactions with signature verification
     and balance checks, implements Proof-of-Work, and provides save/load functionality.
+
+    Concurrency: writers (add_transaction, mining, chain and ledger replacement) hold write_lock,
+    so they run one at a time; Proof-of-Work itself runs outside it. Each write ends by publishing a
+    ChainSnapshot, which readers (get_balance, snapshot()) use without taking the lock.
     """
-    def __init__(self, difficulty: int = 2, mining_reward: float = 100.0):
+    def __init__(self, difficulty: int = 2, mining_reward: int = 100 * COIN, miner=None,
+                 block_version: int = BLOCK_VERSION_LEGACY, max_block_transactions: int = DEFAULT_MAX_BLOCK_TRANSACTIONS,
+                 max_block_bytes: int = DEFAULT_MAX_BLOCK_BYTES):
+        # Balance ledger: confirmed balances are folded in block by block as the chain grows; the
+        # mempool keeps the pending side (net deltas and per-sender spend) as transactions come and go.
+        # Both are keyed by address (see utils/addresses.py), whether a block stores keys or addresses,
+        # and hold exact integer base units (see utils/amounts.py).
+        # Confirmed balances are copy-on-write: a new dict per block, so published snapshots never change.
+        self._confirmed_balances: dict[str, int] = {}
+        # Highest nonce of each address's confirmed signed transactions (see Transaction); a signed
+        # transaction must exceed it (and its sender's pending ones) to be staged, which rules out replays.
+        # Copy-on-write too.
+        self._confirmed_nonces: dict[str, int] = {}
         self.chain: list[Block] = []
-        self.pending_transactions: list[Transaction] = [] # Stores Transaction objects
+        self.write_lock = threading.RLock() # Held by every writer (see class docstring)
+        self.mempool: Mempool = Mempool() # Staged transactions, deduplicated and ranked by fee (see mempool.py)
         self.difficulty: int = int(difficulty)
-        self.mining_reward: float = float(mining_reward)
+        self.mining_reward: int = to_units(mining_reward) # Base units
+        # Format used for newly created blocks; loaded blocks keep the version they were stored with.
+        self.block_version: int = int(block_version)
+        # Pluggable Proof-of-Work engine (see miner.py); not persisted with the chain.
+        self.miner = miner or SequentialMiner()
+        self.last_mining_result: MiningResult | None = None
+        # Limits for the blocks this node mines (not persisted; see DEFAULT_MAX_BLOCK_TRANSACTIONS).
+        self.max_block_transactions: int = max_block_transactions
+        self.max_block_bytes: int = max_block_bytes
+        # Processes used for signature checks in is_chain_valid (1 = sequential).
+        self.validation_workers: int = 1
+        self.last_validation_failure: dict | None = None
+        # Content addresses (signature_digest) of signatures already verified, persisted with the
+        # chain so later validations only check signatures added since. Only transactions that were
+        # staged or are on the chain are remembered; those that leave the pool unmined are forgotten.
+        self.verified_signatures: set[str] = set()
+        # Highest block (index and hash) known to be fully valid; later validations start after it.
+        self.validated_checkpoint: dict | None = None
+        # Public keys behind the addresses stored in blocks, needed to verify their signatures.
+        self.key_registry: KeyRegistry = KeyRegistry()
+        # Lookup indexes for block-by-hash and transaction queries; built on first use, then kept
+        # current as blocks are added (None = not built yet).
+        self._block_positions: dict[str, int] | None = None
+        self._tx_locations: dict[str, tuple[int, int]] | None = None
+        self._address_history: dict[str, list[tuple[int, int]]] | None = None
+        # Optional callable returning (or yielding) stored per-block transaction index records in block
+        # order (see tx_index_record), set by a storage engine so the transaction indexes can be built
+        # without decoding every block.
+        self.tx_index_loader = None
+        self._tx_index_build_lock = threading.Lock()
+        self._snapshot: ChainSnapshot | None = None
+        self._publish_snapshot()
         # Genesis block handled by create_genesis_block or load_from_file
 
+    def snapshot(self) -> ChainSnapshot:
+        """The state as of the last completed write; safe to read from any thread without locking."""
+        return self._snapshot
+
+    def _publish_snapshot(self):
+        """Makes the current chain, balances and pool the state readers see (call at the end of each write)."""
+        pending, deltas, removals = self.mempool.snapshot()
+        self._snapshot = ChainSnapshot(self.chain, self._confirmed_balances, pending, deltas, removals)
+
+    @property
+    def pending_transactions(self) -> list[Transaction]:
+        """The staged (not yet mined) transactions in arrival order; a copy, so use add_transaction to stage more."""
+        return self.mempool.transactions()
+
+    @pending_transactions.setter
+    def pending_transactions(self, transactions: list[Transaction]):
+        # Replaces the whole pool (e.g. when loading a saved one); the mempool takes the list as given,
+        # without limits, and recomputes its pending totals.
+        with self.write_lock:
+            self.mempool.reset(transactions)
+            self._publish_snapshot()
+
+    @staticmethod
+    def _apply_tx_to_ledger(ledger: dict[str, int], sender: str, recipient: str, amount: int, fee: int = 0):
+        """Credits the recipient and debits the sender (amount plus fee) of a single transaction in the given ledger."""
+        ledger[recipient] = ledger.get(recipient, 0) + amount
+        ledger[sender] = ledger.get(sender, 0) - amount - fee
+
+    def _apply_block_to_ledger(self, block_obj: Block, ledger: dict[str, int], nonces: dict[str, int]) -> dict[str, int]:
+        """
+        Folds every transaction of a confirmed block into the given ledgers of confirmed balances and
+        sender nonces. Returns the block's signed senders with their highest nonce in it.
+        """
+        block_nonces = {}
+        for tx_dict in block_obj.transactions:
+            try:
+                tx = Transaction.from_dict(tx_dict)
+            except ValueError as e:
+                print(f"Warning: Skipping malformed transaction in block {block_obj.index} during balance indexing: {e}")
+                continue
+            sender = address_of(tx.sender_public_key)
+            self._apply_tx_to_ledger(ledger, sender, address_of(tx.recipient_public_key), tx.amount, tx.fee)
+            if tx.nonce is not None and tx.sender_public_key not in SYSTEM_SENDERS:
+                block_nonces[sender] = max(tx.nonce, block_nonces.get(sender, tx.nonce))
+        for sender, nonce in block_nonces.items():
+            nonces[sender] = max(nonce, nonces.get(sender, nonce))
+        return block_nonces
+
+    def rebuild_balance_index(self):
+        """Rebuilds the confirmed balance and nonce ledgers from scratch (full chain scan)."""
+        with self.write_lock:
+            balances, nonces = {}, {}
+            for block_obj in self.chain:
+                self._apply_block_to_ledger(block_obj, balances, nonces)
+            self._confirmed_balances, self._confirmed_nonces = balances, nonces
+            self._publish_snapshot()
+
+    def export_balance_index(self) -> dict[str, int]:
+        """Returns a copy of the confirmed balances, e.g. for storing next to the chain."""
+        return dict(self._confirmed_balances)
+
+    def export_nonce_index(self) -> dict[str, int]:
+        """Returns a copy of the confirmed sender nonces, stored next to the balances."""
+        return dict(self._confirmed_nonces)
+
+    def restore_balance_index(self, confirmed_balances: dict[str, int], confirmed_nonces: dict[str, int]):
+        """
+        Installs previously exported confirmed balances and nonces (which must match self.chain).
+        Older snapshots may be keyed by PEM or hold float coin balances; both are converted.
+        """
+        balances = {}
+        for identity, balance in confirmed_balances.items():
+            address = address_of(identity)
+            balances[address] = balances.get(address, 0) + to_units(balance)
+        with self.write_lock:
+            self._confirmed_balances, self._confirmed_nonces = balances, dict(confirmed_nonces)
+            self._publish_snapshot()
+
+    def verify_balance_index(self) -> bool:
+        """
+        Checks the incremental balance ledger against a full rescan of the chain and pending pool.
+        Returns True if every known address matches. Holds the write lock, so run it on a quiet chain.
+        """
+        with self.write_lock:
+            return self._verify_balance_index()
+
+    def _verify_balance_index(self) -> bool:
+        addresses = set(self._confirmed_balances)
+        for block_obj in self.chain:
+            for tx_dict in block_obj.transactions:
+                addresses.update((tx_dict.get('sender_public_key'), tx_dict.get('recipient_public_key')))
+        for tx in self.pending_transactions:
+            addresses.update((tx.sender_public_key, tx.recipient_public_key))
+        addresses = {address_of(address) if address else None for address in addresses}
+        addresses.discard(None)
+
+        for address in addresses:
+            indexed = self.get_balance(address)
+            scanned = self.scan_balance(address)
+            if indexed != scanned:
+                print(f"Balance index mismatch for {address[:15]}...: indexed {indexed}, scanned {scanned}")
+                return False
+        return True
+
     def create_genesis_block(self):
         """Creates the first block in the chain (the "genesis block")."""
         print("Creating Genesis Block...")
@@ -27,53 +229,312 @@ class Blockchain:
             transactions=[], # Genesis block has no user transactions
             timestamp=time.time(),
             previous_hash="0", # Conventional placeholder
-            nonce=0 # Genesis block typically doesn't require PoW
+            nonce=0, # Genesis block typically doesn't require PoW
+            version=self.block_version
         )
-        self.chain.append(genesis_block)
+        with self.write_lock:
+            self.chain.append(genesis_block) # No transactions, so the balances do not change
+            self._index_block_for_lookup(len(self.chain) - 1, genesis_block)
+            self._publish_snapshot()
         print(f"Genesis Block created: {genesis_block}")
 
     def get_latest_block(self) -> Block | None:
         """Returns the most recently added block in the chain."""
         return self.chain[-1] if self.chain else None
 
-    def get_balance(self, address_public_key: str) -> float:
+    @staticmethod
+    def tx_index_record(position: int, block_obj: Block) -> dict:
+        """Per-block entry of the transaction indexes: the txid, sender and recipient of every transaction."""
+        return {
+            'block': position,
+            'hash': block_obj.hash,
+            'txids': block_obj.transaction_hashes(),
+            'parties': [[address_of(tx.get('sender_public_key')), address_of(tx.get('recipient_public_key'))]
+                        for tx in block_obj.transactions]
+        }
+
+    @staticmethod
+    def _apply_tx_index_record(record: dict, tx_locations: dict, address_history: dict):
+        """Adds one block's transactions to the given txid and address-history indexes."""
+        position = record['block']
+        for tx_position, (txid, parties) in enumerate(zip(record['txids'], record['parties'])):
+            # Identical system transactions (equal rewards from before they carried a nonce) share a txid; keep the earliest.
+            tx_locations.setdefault(txid, (position, tx_position))
+            for address in {address_of(party) for party in parties if party}: # A transfer to oneself is listed once
+                address_history.setdefault(address, []).append((position, tx_position))
+
+    def _index_block_for_lookup(self, position: int, block_obj: Block):
+        """Adds a newly appended block to whichever lookup indexes have been built."""
+        if self._block_positions is not None:
+            self._block_positions[block_obj.hash] = position
+        if self._tx_locations is not None:
+            self._apply_tx_index_record(self.tx_index_record(position, block_obj), self._tx_locations, self._address_history)
+
+    def _ensure_tx_indexes(self):
+        """
+        Builds the txid -> (block index, position) and address -> [(block index, position), ...]
+        indexes if not built yet: from stored records where available (tx_index_loader), then by
+        scanning the blocks those records do not cover. The bulk of the work runs without the write
+        lock, so staging and mining carry on meanwhile; only the blocks added since are indexed under it.
+        """
+        if self._tx_locations is not None:
+            return
+        with self._tx_index_build_lock: # One builder at a time; the others wait for its result
+            while self._tx_locations is None:
+                chain = self.chain
+                height = len(chain) # Blocks are only appended, so the first `height` do not change
+                tx_locations, address_history = {}, {}
+                indexed_count = 0
+                for record in (self.tx_index_loader() if self.tx_index_loader else None) or []:
+                    if record.get('block') != indexed_count or indexed_count >= height:
+                        break
+                    self._apply_tx_index_record(record, tx_locations, address_history)
+                    indexed_count += 1
+                for position in range(indexed_count, height):
+                    self._apply_tx_index_record(self.tx_index_record(position, chain[position]), tx_locations, address_history)
+                with self.write_lock: # Catch up with blocks added meanwhile, then publish
+                    if self.chain is not chain: # Replaced meanwhile (e.g. migrate_to_addresses): start over
+                        continue
+                    for position in range(height, len(chain)):
+                        self._apply_tx_index_record(self.tx_index_record(position, chain[position]), tx_locations, address_history)
+                    self._address_history = address_history
+                    self._tx_locations = tx_locations
+
+    def get_block(self, block_index: int) -> Block | None:
+        """Returns the block at the given chain position, or None if out of range."""
+        if not 0 <= block_index < len(self.chain):
+            return None
+        return self.chain[block_index]
+
+    def get_blocks(self, start: int, limit: int) -> list[Block]:
+        """Returns up to `limit` consecutive blocks starting at chain position `start`."""
+        if start < 0 or limit <= 0:
+            return []
+        return list(self.chain[start:start + limit])
+
+    def get_block_by_hash(self, block_hash: str) -> Block | None:
+        """Returns the block with the given hash, or None."""
+        if hasattr(self.chain, 'index_of_hash'): # LazyChain: served from the on-disk block index
+            position = self.chain.index_of_hash(block_hash)
+        else:
+            if self._block_positions is None:
+                with self.write_lock:
+                    if self._block_positions is None:
+                        self._block_positions = {block_obj.hash: position for position, block_obj in enumerate(self.chain)}
+            position = self._block_positions.get(block_hash)
+        return self.chain[position] if position is not None else None
+
+    def get_transaction(self, txid: str) -> dict | None:
+        """
+        Looks up a transaction by txid (see Transaction.txid) among the confirmed blocks and then
+        the pending pool. The transaction's amount is reported in base units.
+
+        Returns:
+            dict | None: {'txid', 'status' ('confirmed' or 'pending'), 'block_index', 'block_hash',
+                          'position', 'transaction'}, with block fields None for pending transactions.
+        """
+        self._ensure_tx_indexes()
+        location = self._tx_locations.get(txid)
+        if location is not None:
+            block_obj = self.chain[location[0]]
+            return {'txid': txid, 'status': 'confirmed', 'block_index': block_obj.index, 'block_hash': block_obj.hash,
+                    'position': location[1], 'transaction': tx_dict_in_units(block_obj.transactions[location[1]])}
+        if txid not in self.mempool:
+            return None
+        for position, tx in enumerate(self.pending_transactions):
+            if tx.txid == txid:
+                return {'txid': txid, 'status': 'pending', 'block_index': None, 'block_hash': None,
+                        'position': position, 'transaction': tx.to_dict()}
+        return None
+
+    def get_address_history(self, address_public_key: str, start: int = 0, limit: int | None = None) -> tuple[list[dict], int]:
+        """
+        Returns confirmed transactions sending to or from an address, oldest first.
+
+        Args:
+            start (int): Offset into the address's history.
+            limit (int | None): Maximum number of entries returned (None = all from start).
+
+        Returns:
+            tuple: (entries shaped like get_transaction's result, total number of confirmed
+                    transactions touching the address).
+        """
+        self._ensure_tx_indexes()
+        history = self._address_history.get(address_of(address_public_key), [])
+        selected = history[start:] if limit is None else history[start:start + limit]
+        entries = []
+        for block_index, position in selected:
+            block_obj = self.chain[block_index]
+            tx_dict = block_obj.transactions[position]
+            entries.append({'txid': hash_transaction(tx_dict), 'status': 'confirmed', 'block_index': block_index,
+                            'block_hash': block_obj.hash, 'position': position, 'transaction': tx_dict_in_units(tx_dict)})
+        return entries, len(history)
+
+    def get_pending_for_address(self, address_public_key: str) -> list[dict]:
+        """Returns pending transactions sending to or from an address, in pool order."""
+        address = address_of(address_public_key)
+        return [{'txid': tx.txid, 'status': 'pending', 'block_index': None, 'block_hash': None,
+                 'position': position, 'transaction': tx.to_dict()}
+                for position, tx in enumerate(self.pending_transactions)
+                if address in (address_of(tx.sender_public_key), address_of(tx.recipient_public_key))]
+
+    def get_transaction_proof(self, block_index: int, position: int) -> dict | None:
+        """
+        Returns a Merkle inclusion proof for the transaction at `position` in block `block_index`,
+        or None if the block does not exist or uses the legacy (non-Merkle) format.
+        """
+        if not 0 <= block_index < len(self.chain):
+            return None
+        block_obj = self.chain[block_index]
+        if block_obj.merkle_root is None:
+            return None
+        return {
+            'block_index': block_obj.index,
+            'block_hash': block_obj.hash,
+            'merkle_root': block_obj.merkle_root,
+            'tx_hash': block_obj.transaction_hashes()[position],
+            'proof': block_obj.merkle_proof(position)
+        }
+
+    def get_balance(self, address_public_key: str, include_pending: bool = True) -> int:
+        """
+        Returns the balance (in base units) of a given address from the incremental balance ledger.
+        Confirmed balances and pending deltas (kept by the mempool) are separate; by default the
+        pending delta is included (balance once everything staged is mined). Accepts a PEM public key or its address.
+        Read from the current snapshot, without locking.
+        """
+        return self._snapshot.get_balance(address_public_key, include_pending)
+
+    def get_last_nonce(self, address_public_key: str) -> int | None:
+        """The highest nonce of the address's confirmed signed transactions (None if it has none); new ones must exceed it."""
+        return self._confirmed_nonces.get(address_of(address_public_key))
+
+    def get_spendable_balance(self, address_public_key: str) -> int:
+        """
+        Confirmed balance minus what the address already has staged to send (amounts plus fees).
+        Pending incoming funds do not count, so any subset of the pool can be mined without
+        overdrawing a sender, and evicting a transaction never invalidates another.
+        """
+        address = address_of(address_public_key)
+        return self._confirmed_balances.get(address, 0) - self.mempool.pending_spend(address)
+
+    def scan_balance(self, address_public_key: str) -> int:
         """
         Calculates the balance of a given address by iterating through all
         transactions in the blockchain and currently pending transactions.
+        Reference implementation used to check the balance index.
         """
-        balance = 0.0
+        address = address_of(address_public_key)
+        balance = 0
         # Calculate balance from confirmed transactions in the chain
         for block_obj in self.chain:
             for tx_dict in block_obj.transactions:
                 try:
                     tx = Transaction.from_dict(tx_dict)
-                    if tx.recipient_public_key == address_public_key:
+                    if address_of(tx.recipient_public_key) == address:
                         balance += tx.amount
-                    if tx.sender_public_key == address_public_key:
-                        balance -= tx.amount
+                    if address_of(tx.sender_public_key) == address:
+                        balance -= tx.amount + tx.fee
                 except ValueError as e:
                     print(f"Warning: Skipping malformed transaction in block {block_obj.index} during balance calculation: {e}")
         
         # Adjust balance based on pending transactions (for spendable balance estimate)
         for tx in self.pending_transactions:
-            if tx.recipient_public_key == address_public_key:
+            if address_of(tx.recipient_public_key) == address:
                 balance += tx.amount
-            if tx.sender_public_key == address_public_key:
-                balance -= tx.amount
+            if address_of(tx.sender_public_key) == address:
+                balance -= tx.amount + tx.fee
                 
         return balance
 
     def add_transaction(self, transaction: Transaction) -> tuple[bool, str, int | None]:
         """
-        Adds a new transaction to the pending pool after validation.
-        Validations: Signature verification and sender balance.
+        Adds a new transaction to the pending pool (the mempool) after validation.
+        Validations: a signed transaction needs a nonce above its sender's last one, confirmed or
+        pending (so replays, including re-signed or malleated copies, are refused);
+        signature verification, sender balance (see get_spendable_balance) and the mempool's limits,
+        which may evict lower-fee transactions. System transactions without a nonce get a fresh one.
+        Sender and recipient may be given as addresses if their public keys are registered.
         """
+        with self.write_lock:
+            result = self._add_transaction(transaction)
+            if result[0]:
+                self._publish_snapshot()
+            return result
+
+    def add_transactions(self, transactions: list[Transaction], workers: int | None = None) -> list[tuple[bool, str, int | None]]:
+        """
+        Adds a batch of transactions, accepting or rejecting each on its own with the same checks and
+        results as add_transaction, in order (so each sender's spendable balance runs down across the
+        batch). Signatures are verified first, without holding the write lock, on the shared process pool
+        when `workers` > 1 (defaults to self.validation_workers) and there are enough of them to pay for
+        it (see PARALLEL_MIN_SIGNATURES); the batch is then staged under the lock and a single snapshot
+        is published.
+        """
+        signature_results, jobs, job_positions = {}, [], []
+        for position, transaction in enumerate(transactions):
+            sender = self.key_registry.resolve(transaction.sender_public_key)
+            recipient = self.key_registry.resolve(transaction.recipient_public_key)
+            # Unregistered addresses may be registered by the time the transaction is staged, changing
+            # the signed text, so those (like unsigned and system transactions) are left to _add_transaction.
+            if sender in ["network", "welcome_faucet"] or is_address(sender) or is_address(recipient) or not transaction.signature:
+                continue
+            job = (sender, get_data_to_sign(sender, recipient, transaction.amount, transaction.fee, transaction.nonce),
+                   transaction.signature)
+            if signature_digest(*job) in self.verified_signatures: # E.g. a resubmission of a known transaction
+                signature_results[position] = True
+            else:
+                jobs.append(job)
+                job_positions.append(position)
+        signature_results.update(zip(job_positions, verify_signatures(
+            jobs, workers=self.validation_workers if workers is None else workers)))
+
+        with self.write_lock:
+            results = [self._add_transaction(transaction, signature_results.get(position))
+                       for position, transaction in enumerate(transactions)]
+            if any(accepted for accepted, _msg, _next_block in results):
+                self._publish_snapshot()
+        return results
+
+    def _add_transaction(self, transaction: Transaction, signature_valid: bool | None = None) -> tuple[bool, str, int | None]:
+        """signature_valid is the outcome of an earlier check of this transaction's signature (None = verify it here)."""
+        # 0. Resolve addresses to registered public keys (the signature covers the full keys)
+        transaction.sender_public_key = self.key_registry.resolve(transaction.sender_public_key)
+        transaction.recipient_public_key = self.key_registry.resolve(transaction.recipient_public_key)
+        for party in (transaction.sender_public_key, transaction.recipient_public_key):
+            if is_address(party):
+                return False, f"Unknown address {party}: its public key has not been registered.", None
+        is_system = transaction.sender_public_key in ["network", "welcome_faucet"]
+        if is_system and transaction.fee:
+            return False, "System transactions cannot carry a fee.", None
+
+        if is_system and transaction.nonce is None:
+            transaction.nonce = new_nonce() # Equal grants would otherwise share a txid
+        txid = transaction.txid
+        if txid in self.mempool:
+            return False, f"Transaction {txid[:16]}... is already pending.", None
+        # Replays are told apart by nonce, not txid: a signature can be re-made or malleated into a new txid.
+        # Each new nonce must also exceed the sender's pending ones, so a block never supersedes an accepted transaction.
+        if not is_system:
+            if transaction.nonce is None:
+                return False, "Signed transactions need a nonce (any integer above the sender's last one).", None
+            sender = address_of(transaction.sender_public_key)
+            last_nonce = max((nonce for nonce in (self._confirmed_nonces.get(sender), self.mempool.highest_nonce(sender))
+                              if nonce is not None), default=None)
+            if last_nonce is not None and transaction.nonce <= last_nonce:
+                return False, f"Nonce {transaction.nonce} is not above the sender's last nonce {last_nonce} (confirmed or pending): the transaction is a replay or was superseded.", None
+            # The signature covers the parties' PEM text, but blocks keep only their addresses: a key named in
+            # any other text than the one its address resolves to would verify now and fail validation once mined.
+            for party in (transaction.sender_public_key, transaction.recipient_public_key):
+                if is_public_key_pem(party) and self.key_registry.signing_form(party) != party:
+                    return False, "Public keys must be given in canonical PEM form (as exported by generate_key_pair), or by address.", None
+
         # 1. Validate signature (unless it's a system transaction)
         if transaction.sender_public_key not in ["network", "welcome_faucet"]:
             if not transaction.signature:
                 return False, "Transaction is missing a signature.", None
             
-            is_signature_valid = verify_signature(
+            is_signature_valid = signature_valid if signature_valid is not None else verify_signature(
                 public_key_pem=transaction.sender_public_key,
                 data=transaction.get_data_for_signing(),
                 signature_hex=transaction.signature
@@ -81,218 +542,516 @@ class Blockchain:
             if not is_signature_valid:
                 return False, "Invalid transaction signature.", None
         
-        # 2. Validate sender's balance (unless it's a system transaction)
+        # 2. Validate sender's balance (unless it's a system transaction): confirmed funds not already staged to send
         if transaction.sender_public_key not in ["network", "welcome_faucet"]:
-            # Get balance *excluding* this potential new pending transaction for the check
-            # This is tricky. For simplicity, current get_balance includes all pending.
-            # A more robust check might calculate balance *before* this tx.
-            # For now, the current get_balance should work if it subtracts pending.
-            sender_balance = self.get_balance(transaction.sender_public_key)
-            # If we subtract this pending tx from balance calculation:
-            # effective_spendable_balance = sender_balance - transaction.amount (if it were already pending)
-            # But it's not pending yet. So sender_balance as calculated is correct *before* this tx.
-            
-            if sender_balance < transaction.amount:
-                return False, f"Insufficient balance for sender. Has {sender_balance:.4f}, needs {transaction.amount:.4f}.", None
+            spendable = self.get_spendable_balance(transaction.sender_public_key)
+            if spendable < transaction.amount + transaction.fee:
+                return False, f"Insufficient balance for sender. Has {format_amount(spendable)} spendable, needs {format_amount(transaction.amount + transaction.fee)}.", None
+
+        if stored_size(transaction) > self._block_byte_budget(transaction.recipient_public_key):
+            return False, f"Transaction is too large to fit in a block of {self.max_block_bytes} bytes.", None
 
-        self.pending_transactions.append(transaction)
+        # 3. Stage it in the mempool (duplicates, per-sender limit, size caps and eviction)
+        accepted, pool_msg, evicted = self.mempool.add(transaction)
+        if not accepted:
+            return False, pool_msg, None
+        if transaction.signature: # Remembered only once staged, so rejected submissions leave nothing behind
+            self.verified_signatures.add(self._signature_digest(transaction))
+        self._forget_signatures(evicted)
+        self.key_registry.register(transaction.sender_public_key)
+        self.key_registry.register(transaction.recipient_public_key)
         
         latest_block = self.get_latest_block()
         next_block_idx = latest_block.index + 1 if latest_block else 0 # Should always have genesis
         
         if transaction.sender_public_key in ["network", "welcome_faucet"]:
-            msg = f"System transaction ({transaction.sender_public_key}) for {transaction.amount:.2f} to {transaction.recipient_public_key[:15]}... staged."
+            msg = f"System transaction ({transaction.sender_public_key}) for {format_amount(transaction.amount)} to {transaction.recipient_public_key[:15]}... staged."
         else:
-            msg = f"Transaction from {transaction.sender_public_key[:15]}... for {transaction.amount:.2f} to {transaction.recipient_public_key[:15]}... added to pending pool."
+            msg = f"Transaction from {transaction.sender_public_key[:15]}... for {format_amount(transaction.amount)} to {transaction.recipient_public_key[:15]}... added to pending pool."
+        if evicted:
+            msg += f" {len(evicted)} lower-fee transaction(s) evicted from the full pool."
         
         return True, msg, next_block_idx
 
-    def proof_of_work(self, block: Block) -> tuple[str, float]:
-        """Implements Proof-of-Work to find a valid nonce for the block."""
-        print(f"Mining block #{block.index} with difficulty {self.difficulty} (target prefix: '{'0'*self.difficulty}')...")
-        block.nonce = 0 # Reset nonce before starting
-        start_time = time.time()
-        computed_hash = block.calculate_hash() # Initial hash
-        target_prefix = '0' * self.difficulty
-
-        while not computed_hash.startswith(target_prefix):
-            block.nonce += 1
-            computed_hash = block.calculate_hash() # Recalculate with new nonce
-
-        end_time = time.time()
-        mining_duration = end_time - start_time
-        block.hash = computed_hash # CRITICAL: Update block's actual hash attribute
-        print(f"Block successfully mined! Nonce: {block.nonce}, Hash: {block.hash[:15]}..., Time: {mining_duration:.4f} seconds")
-        return computed_hash, mining_duration
-
-    def mine_pending_transactions(self, miner_reward_address_public_key: str) -> tuple[Block | None, float | None, str]:
-        """
-        Mines a new block with all current pending transactions.
-        The specified miner_reward_address_public_key receives the mining reward.
-        """
-        # Check if there are any actual user-submittable transactions or specific system transactions
-        # that warrant mining a block.
-        has_mineable_transactions = False
-        if self.pending_transactions:
-            # We consider it mineable if there's any transaction.
-            # System transactions like "welcome_faucet" or "GENESIS_ALLOCATION" are also mineable.
-            has_mineable_transactions = True
-        
-        if not has_mineable_transactions:
-            # If difficulty is 0, one might allow mining empty blocks for PoW testing,
-            # but for a typical simulation with PoW, we don't mine truly empty blocks.
-            if self.difficulty > 0:
+    @staticmethod
+    def _signature_digest(transaction: Transaction) -> str:
+        return signature_digest(transaction.sender_public_key, transaction.get_data_for_signing(), transaction.signature)
+
+    def _forget_signatures(self, transactions: list[Transaction]):
+        """Drops the verified-signature digests of transactions that left the pool without being mined (write lock held)."""
+        for transaction in transactions:
+            if transaction.signature:
+                self.verified_signatures.discard(self._signature_digest(transaction))
+
+    def proof_of_work(self, block: Block, control: MiningControl | None = None) -> tuple[str, float]:
+        """
+        Implements Proof-of-Work to find a valid nonce for the block, using the configured mining engine.
+        With a control (see miner.MiningControl) progress is reported and MiningCancelled is raised if it is cancelled.
+        """
+        print(f"Mining block #{block.index} with difficulty {self.difficulty} (target prefix: '{'0'*self.difficulty}') using {self.miner}...")
+        if control is not None:
+            control.checkpoint(block.index, 0, 0, 0.0) # Honours an earlier cancel and announces the new block
+        result = self.miner.mine(block, self.difficulty, control) if control is not None else self.miner.mine(block, self.difficulty)
+        self.last_mining_result = result
+        block.hash = result.hash # CRITICAL: Update block's actual hash attribute
+        print(f"Block successfully mined! Nonce: {block.nonce}, Hash: {block.hash[:15]}..., Time: {result.duration:.4f} seconds, Rate: {result.hash_rate:.0f} H/s")
+        return result.hash, result.duration
+
+    def _block_byte_budget(self, miner_reward_address_public_key: str) -> int:
+        """Bytes of a block left for pending transactions once the mining reward's worst-case size is reserved."""
+        reward_bound = Transaction("network", miner_reward_address_public_key, _MAX_REWARD_AMOUNT, nonce=MAX_NONCE)
+        return self.max_block_bytes - stored_size(reward_bound)
+
+    def mine_pending_transactions(self, miner_reward_address_public_key: str,
+                                  control: MiningControl | None = None) -> tuple[Block | None, float | None, str]:
+        """
+        Mines a new block from the pending pool. Transactions are taken greedily, highest priority first
+        (see Mempool.select), within max_block_transactions and max_block_bytes; the rest stay pending,
+        as do transactions staged while the block is being mined. The specified
+        miner_reward_address_public_key receives the mining reward plus the included fees.
+        If `control` is cancelled during Proof-of-Work nothing changes and no block is returned.
+        """
+        with self.write_lock:
+            # A block needs at least one pending transaction (user or system, e.g. "welcome_faucet");
+            # this simulation does not mine empty blocks.
+            if not len(self.mempool):
                 return None, None, "No transactions (user or system) currently pending to be mined."
-            # If difficulty is 0, we might allow it, but still issue a warning.
-            # For this simulation, let's stick to requiring some transaction.
-            # else:
-            #     print("Warning: Mining an empty block as difficulty is 0.")
-
-        print(f"\nAttempting to mine new block for {len(self.pending_transactions)} pending transactions. Miner: {miner_reward_address_public_key[:15]}...")
-
-        reward_tx = Transaction(
-            sender_public_key="network",
-            recipient_public_key=miner_reward_address_public_key,
-            amount=self.mining_reward,
-            signature=None 
-        )
-        
-        # If pending_transactions was empty but we decided to proceed (e.g. for difficulty 0),
-        # then transactions_to_include_in_block will only have the reward_tx.
-        transactions_to_include_in_block = [reward_tx] + self.pending_transactions
 
-        latest_block = self.get_latest_block()
-        if not latest_block:
-            return None, None, "CRITICAL ERROR: Cannot mine without a genesis block."
+            print(f"\nAttempting to mine new block for {len(self.mempool)} pending transactions. Miner: {miner_reward_address_public_key[:15]}...")
+            selected = self.mempool.select(self.max_block_transactions - 1, self._block_byte_budget(miner_reward_address_public_key))
+            if not selected:
+                return None, None, "No pending transaction fits within the block limits."
 
-        new_block = Block(
-            index=latest_block.index + 1,
-            transactions=[tx.to_dict() for tx in transactions_to_include_in_block],
-            timestamp=time.time(),
-            previous_hash=latest_block.hash
-        )
+        new_block, mining_duration, message = self._mine_block(
+            miner_reward_address_public_key, [entry.tx for entry in selected], sum(entry.fee for entry in selected),
+            [entry.txid for entry in selected], control)
+        if new_block is None:
+            return None, None, message
+        remaining = len(self.mempool)
+        remaining_msg = f" {remaining} transaction(s) remain pending." if remaining else ""
+        return new_block, mining_duration, f"Block #{new_block.index} successfully mined by {miner_reward_address_public_key[:15]}...{remaining_msg}"
+
+    def mine_transactions(self, transactions: list[Transaction], miner_reward_address_public_key: str,
+                          control: MiningControl | None = None) -> tuple[Block | None, float | None, str]:
+        """
+        Mines a block holding exactly `transactions` (plus the mining reward) without touching the pending
+        pool, e.g. a faucet grant or the initial allocations. Only unsigned system transactions (see
+        SYSTEM_SENDERS) can be mined this way, since nothing else about them is checked; those without
+        a nonce get a fresh one.
+        """
+        if not transactions:
+            return None, None, "No transactions given to mine."
+        if any(tx.sender_public_key not in SYSTEM_SENDERS or tx.signature is not None or tx.fee for tx in transactions):
+            return None, None, "Only unsigned, fee-less system transactions can be mined directly; stage others with add_transaction."
+        for tx in transactions:
+            if tx.nonce is None:
+                tx.nonce = new_nonce()
+        new_block, mining_duration, message = self._mine_block(miner_reward_address_public_key, list(transactions), 0, [], control)
+        if new_block is None:
+            return None, None, message
+        return new_block, mining_duration, f"Block #{new_block.index} successfully mined by {miner_reward_address_public_key[:15]}..."
+
+    def _mine_block(self, miner_reward_address_public_key: str, transactions: list[Transaction], fees: int,
+                    pool_txids: list[str], control: MiningControl | None) -> tuple[Block | None, float | None, str]:
+        """
+        Builds a block of the mining reward (mining_reward + fees) followed by `transactions` on the current
+        tip, runs Proof-of-Work on it without holding the write lock, then commits it (see _commit_block).
+        pool_txids are the mempool entries the block takes; they leave the pool when it is committed.
+        """
+        with self.write_lock:
+            latest_block = self.get_latest_block()
+            if not latest_block:
+                return None, None, "CRITICAL ERROR: Cannot mine without a genesis block."
+            reward_tx = Transaction(
+                sender_public_key="network",
+                recipient_public_key=miner_reward_address_public_key,
+                amount=self.mining_reward + fees,
+                signature=None,
+                nonce=new_nonce()
+            )
+            transactions_to_include_in_block = [reward_tx] + transactions
+
+            # Blocks store addresses; keep every party's key so signatures stay verifiable.
+            for tx in transactions_to_include_in_block:
+                self.key_registry.register(tx.sender_public_key)
+                self.key_registry.register(tx.recipient_public_key)
+
+            new_block = Block(
+                index=latest_block.index + 1,
+                transactions=[tx.to_dict(compact=True) for tx in transactions_to_include_in_block],
+                timestamp=time.time(),
+                previous_hash=latest_block.hash,
+                version=self.block_version
+            )
+
+        try:
+            _actual_hash, mining_duration = self.proof_of_work(new_block, control)
+        except MiningCancelled as e:
+            print(str(e))
+            return None, None, str(e)
 
-        _actual_hash, mining_duration = self.proof_of_work(new_block)
+        with self.write_lock:
+            failure = self._commit_block(new_block, latest_block, pool_txids)
+        if failure:
+            print(failure)
+            return None, None, failure
+        return new_block, mining_duration, ""
 
+    def _commit_block(self, new_block: Block, parent: Block, pool_txids: list[str]) -> str | None:
+        """
+        Appends a mined block (write lock held): folds it into the balances and lookup indexes, removes
+        pool_txids from the pool and publishes a new snapshot. The block is discarded, and the reason
+        returned, if another block was added on `parent` meanwhile, one of its pool transactions left
+        the pool (e.g. was evicted) while it was being mined, or it is a Merkle block that repeats a
+        transaction (see Block.repeated_transaction_position). Pending transactions whose nonce the
+        block used up leave the pool too.
+        """
+        if self.get_latest_block() is not parent:
+            return f"The chain advanced while block #{new_block.index} was being mined; the block was discarded."
+        if any(txid not in self.mempool for txid in pool_txids):
+            return f"A transaction of block #{new_block.index} left the pending pool while it was being mined; the block was discarded."
+        if new_block.merkle_root is not None and new_block.repeated_transaction_position() is not None:
+            return f"Block #{new_block.index} repeats a transaction, which its Merkle root cannot tell apart; the block was discarded."
+        balances = dict(self._confirmed_balances) # Copy-on-write: published snapshots keep the old balances
+        nonces = dict(self._confirmed_nonces)
+        block_nonces = self._apply_block_to_ledger(new_block, balances, nonces)
         self.chain.append(new_block)
+        self._confirmed_balances, self._confirmed_nonces = balances, nonces
+        self._index_block_for_lookup(len(self.chain) - 1, new_block)
+        self.mempool.remove(pool_txids) # Anything staged meanwhile stays pending, unless the block used its nonce
+        self._forget_signatures(self.mempool.remove_used_nonces(block_nonces)) # Superseded, never to be mined
+        self._publish_snapshot()
         print(f"Block #{new_block.index} added to chain. Contains {len(new_block.transactions)} transactions (incl. reward).")
-        
-        self.pending_transactions = [] # Clear after successful mining
+        return None
 
-        return new_block, mining_duration, f"Block #{new_block.index} successfully mined by {miner_reward_address_public_key[:15]}..."
+    def block_report(self, block_obj: Block, duration: float | None) -> dict:
+        """The report of a block just mined in `duration` seconds (see mine_backlog)."""
+        return {
+            'index': block_obj.index,
+            'hash': block_obj.hash,
+            'transactions': len(block_obj.transactions),
+            'bytes': sum(len(json.dumps(tx_dict, sort_keys=True).encode('utf-8')) for tx_dict in block_obj.transactions),
+            'fees': sum(tx_dict.get('fee', 0) for tx_dict in block_obj.transactions),
+            'duration': duration,
+            'hash_rate': self.last_mining_result.hash_rate if self.last_mining_result else None,
+            'pending_after': len(self.mempool)
+        }
 
-    def is_chain_valid(self) -> bool:
-        """Validates the integrity of the entire blockchain."""
-        print("\nValidating blockchain integrity...")
-        if not self.chain:
-            print("Blockchain is empty. Considered valid by default.")
-            return True
+    def mine_backlog(self, miner_reward_address_public_key: str, max_blocks: int | None = None,
+                     control: MiningControl | None = None, on_block=None) -> tuple[list[dict], str]:
+        """
+        "Drain" mode: mines successive blocks until the pending pool is empty (or max_blocks were mined,
+        or `control` was cancelled; blocks mined before that are kept). on_block, if given, is called with
+        each block's report as soon as the block is on the chain.
+
+        Returns:
+            tuple: (one report per mined block: {'index', 'hash', 'transactions' (incl. reward), 'bytes'
+                    (stored JSON size of its transactions), 'fees', 'duration', 'hash_rate', 'pending_after'},
+                    summary message).
+        """
+        reports = []
+        message = "No transactions (user or system) currently pending to be mined."
+        while len(self.mempool) and (max_blocks is None or len(reports) < max_blocks):
+            if control is not None and control.cancelled:
+                break
+            block_obj, duration, message = self.mine_pending_transactions(miner_reward_address_public_key, control)
+            if block_obj is None:
+                break
+            reports.append(self.block_report(block_obj, duration))
+            if on_block is not None:
+                on_block(reports[-1])
+        if reports:
+            total_time = sum(report['duration'] for report in reports)
+            cancelled = " before mining was cancelled" if control is not None and control.cancelled else ""
+            mined = f"#{reports[0]['index']}" if len(reports) == 1 else f"#{reports[0]['index']}-#{reports[-1]['index']}"
+            message = (f"Mined {len(reports)} block(s) ({mined}) in {total_time:.4f} seconds{cancelled}; "
+                       f"{len(self.mempool)} transaction(s) remain pending.")
+        return reports, message
+
+    @staticmethod
+    def _validation_failure(block_index: int, tx_position: int | None, reason: str) -> dict:
+        """Describes where validation failed; tx_position is None for block-level failures."""
+        return {'block_index': block_index, 'tx_position': tx_position, 'reason': reason}
+
+    def _check_chain_structure(self, start_index: int = 0, end_index: int | None = None) -> tuple[dict | None, list[tuple[int, int, Transaction]]]:
+        """
+        Walks the chain in order from start_index up to (not including) end_index, by default the
+        chain's length, checking everything except signature cryptography:
+        genesis shape, block hashes, hash links, Proof-of-Work and transaction shape.
+        Blocks after start_index are still linked against the block just before it.
+
+        Returns:
+            tuple: (first structural failure or None,
+                    (block_index, tx_position, Transaction) for every user transaction located before
+                    that failure whose signature still has to be verified).
+        """
+        signature_checks = []
+        end_index = len(self.chain) if end_index is None else end_index
+
+        if start_index > 0:
+            return self._check_blocks_structure(start_index, signature_checks, end_index)
 
         # Validate Genesis Block
         genesis_block = self.chain[0]
         if not (genesis_block.index == 0 and genesis_block.previous_hash == "0"):
-            print(f"Genesis block (Index {genesis_block.index}) is malformed.")
-            return False
+            return self._validation_failure(genesis_block.index, None, f"Genesis block (Index {genesis_block.index}) is malformed."), signature_checks
         # Re-calculate genesis block hash to check for tampering (it has no PoW in this sim).
         temp_genesis = Block(genesis_block.index, genesis_block.transactions, genesis_block.timestamp, 
-                             genesis_block.previous_hash, genesis_block.nonce)
+                             genesis_block.previous_hash, genesis_block.nonce, genesis_block.version)
         if genesis_block.hash != temp_genesis.calculate_hash():
-            print(f"Genesis Block data integrity compromised!")
-            return False
+            return self._validation_failure(genesis_block.index, None, "Genesis Block data integrity compromised!"), signature_checks
 
         # Validate the rest of the chain
-        for i in range(1, len(self.chain)):
+        return self._check_blocks_structure(1, signature_checks, end_index)
+
+    def _check_blocks_structure(self, start_index: int, signature_checks: list, end_index: int) -> tuple[dict | None, list[tuple[int, int, Transaction]]]:
+        """Structural checks for the non-genesis blocks from start_index to end_index (see _check_chain_structure)."""
+        for i in range(start_index, end_index):
             current_block = self.chain[i]
             previous_block = self.chain[i-1]
 
             # Check current block's hash integrity
+            # For Merkle blocks this also recomputes the Merkle root from the transactions.
             temp_current = Block(current_block.index, current_block.transactions, current_block.timestamp,
-                                 current_block.previous_hash, current_block.nonce)
+                                 current_block.previous_hash, current_block.nonce, current_block.version)
             if current_block.hash != temp_current.calculate_hash():
-                print(f"Data integrity compromised at Block #{current_block.index}.")
-                return False
+                return self._validation_failure(current_block.index, None, f"Data integrity compromised at Block #{current_block.index}."), signature_checks
+            # A Merkle root cannot tell a repeated trailing transaction from none (see Block.repeated_transaction_position).
+            repeated_position = current_block.repeated_transaction_position() if current_block.merkle_root is not None else None
+            if repeated_position is not None:
+                return self._validation_failure(current_block.index, repeated_position, f"Block #{current_block.index} repeats a transaction."), signature_checks
 
             # Check the chain link integrity
             if current_block.previous_hash != previous_block.hash:
-                print(f"Chain broken: Previous hash mismatch at Block #{current_block.index}.")
-                return False
+                return self._validation_failure(current_block.index, None, f"Chain broken: Previous hash mismatch at Block #{current_block.index}."), signature_checks
 
             # Check Proof-of-Work
             if self.difficulty > 0: 
                 target_prefix = '0' * self.difficulty
                 if not current_block.hash.startswith(target_prefix):
-                    print(f"Proof of Work invalid for Block #{current_block.index}.")
-                    return False
+                    return self._validation_failure(current_block.index, None, f"Proof of Work invalid for Block #{current_block.index}."), signature_checks
             
-            # Check transaction validity within the block (signatures)
-            for tx_dict in current_block.transactions:
+            # Check transaction validity within the block (signatures are queued for batch verification)
+            for tx_position, tx_dict in enumerate(current_block.transactions):
                 try:
-                    tx = Transaction.from_dict(tx_dict)
+                    tx = Transaction.from_dict(tx_dict, key_registry=self.key_registry)
                     # MODIFIED: Define a list of system senders that don't require signatures
                     system_senders = ["network", "welcome_faucet", "GENESIS_ALLOCATION"]
                     if tx.sender_public_key not in system_senders: 
                         if not tx.signature:
-                            print(f"User transaction in Block #{current_block.index} is missing signature: {tx}")
-                            return False
-                        if not verify_signature(tx.sender_public_key, tx.get_data_for_signing(), tx.signature):
-                            print(f"Invalid signature for user transaction in Block #{current_block.index}: {tx}")
-                            return False
+                            return self._validation_failure(current_block.index, tx_position, f"User transaction in Block #{current_block.index} is missing signature: {tx}"), signature_checks
+                        unknown = [party for party in (tx.sender_public_key, tx.recipient_public_key) if is_address(party)]
+                        if unknown:
+                            return self._validation_failure(current_block.index, tx_position, f"No registered public key for address {unknown[0]} in Block #{current_block.index}; its signature cannot be verified."), signature_checks
+                        signature_checks.append((current_block.index, tx_position, tx))
                     elif tx.signature is not None: # System transactions should NOT have signatures
-                        print(f"System transaction in Block #{current_block.index} unexpectedly has a signature: {tx}")
-                        return False
+                        return self._validation_failure(current_block.index, tx_position, f"System transaction in Block #{current_block.index} unexpectedly has a signature: {tx}"), signature_checks
+                    elif tx.fee:
+                        return self._validation_failure(current_block.index, tx_position, f"System transaction in Block #{current_block.index} unexpectedly has a fee: {tx}"), signature_checks
                 except ValueError as e: 
-                    print(f"Malformed transaction in Block #{current_block.index} during validation: {e}")
-                    return False
-        
+                    return self._validation_failure(current_block.index, tx_position, f"Malformed transaction in Block #{current_block.index} during validation: {e}"), signature_checks
+
+        return None, signature_checks
+
+    def _validation_start_index(self) -> int:
+        """
+        Returns the first block index that still needs validation: the block after the checkpoint
+        if the checkpointed block is still in the chain unchanged, otherwise 0 (full validation).
+        """
+        checkpoint = self.validated_checkpoint
+        if not checkpoint:
+            return 0
+        index = checkpoint.get('index')
+        if not isinstance(index, int) or not 0 <= index < len(self.chain) or self.chain[index].hash != checkpoint.get('hash'):
+            print("Validation checkpoint does not match the current chain. Falling back to full validation.")
+            self.validated_checkpoint = None
+            return 0
+        return index + 1
+
+    def _set_validated_checkpoint(self, index: int):
+        self.validated_checkpoint = {'index': index, 'hash': self.chain[index].hash} if index >= 0 else None
+
+    def is_chain_valid(self, workers: int | None = None, full: bool = False) -> bool:
+        """
+        Validates the integrity of the blockchain.
+
+        Only blocks after the validated checkpoint (the highest block already fully validated)
+        are checked; pass full=True to re-walk the whole chain from genesis, e.g. for audits.
+
+        Structure (hashes, links, PoW, transaction shape) is checked in one pass, then user
+        signatures are verified in batches, on a process pool when `workers` > 1 (defaults to
+        self.validation_workers; 1 verifies sequentially). Either way the first failure in chain
+        order is reported and kept in self.last_validation_failure.
+
+        The blocks present when validation starts are checked without holding the write lock (blocks
+        mined meanwhile are left for the next validation); the lock is only taken to record the results.
+        """
+        print("\nValidating blockchain integrity...")
+        self.last_validation_failure = None
+        with self.write_lock:
+            chain, height = self.chain, len(self.chain) # Blocks below height never change, even as more are mined
+            start_index = 0 if full else self._validation_start_index()
+        if not height:
+            print("Blockchain is empty. Considered valid by default.")
+            return True
+
+        if start_index >= height:
+            print(f"Blockchain is valid (no new blocks since checkpoint at Block #{start_index - 1}).")
+            return True
+        if start_index > 0:
+            print(f"Validating Blocks #{start_index}..#{height - 1} (checkpoint at Block #{start_index - 1}).")
+
+        failure, signature_checks = self._check_chain_structure(start_index, height)
+
+        # Signatures verified before (on add_transaction or a previous validation) are skipped.
+        unverified_checks, signature_jobs, digests = [], [], []
+        for check in signature_checks:
+            tx = check[2]
+            job = (tx.sender_public_key, tx.get_data_for_signing(), tx.signature)
+            digest = signature_digest(*job)
+            if digest not in self.verified_signatures:
+                unverified_checks.append(check)
+                signature_jobs.append(job)
+                digests.append(digest)
+
+        # Every queued signature lies before any structural failure, so a bad signature takes precedence.
+        first_invalid = find_first_invalid_signature(
+            signature_jobs, workers=self.validation_workers if workers is None else workers
+        )
+        if first_invalid is not None:
+            block_index, tx_position, tx = unverified_checks[first_invalid]
+            failure = self._validation_failure(block_index, tx_position, f"Invalid signature for user transaction in Block #{block_index}: {tx}")
+        # Every block before the failing one (or all of them) is valid, so the checkpoint moves to just before it.
+        checkpoint_position = height - 1
+        if failure:
+            checkpoint_position = next((i for i in range(start_index, height)
+                                        if chain[i].index == failure['block_index']), start_index) - 1
+
+        with self.write_lock:
+            # Everything before the first invalid signature (or all of them) checked out.
+            self.verified_signatures.update(digests[:first_invalid])
+            if self.chain is chain: # Not replaced (e.g. migrated) meanwhile
+                self._set_validated_checkpoint(checkpoint_position)
+        if failure:
+            print(failure['reason'])
+            self.last_validation_failure = failure
+            return False
         print("Blockchain is valid.")
         return True
 
     def to_json_serializable(self) -> dict:
         """Converts blockchain state to a JSON-serializable dictionary."""
+        with self.write_lock:
+            return self._to_json_serializable()
+
+    def _to_json_serializable(self) -> dict:
         return {
-            "chain": [block_obj.__dict__ for block_obj in self.chain],
+            "chain": [block_obj.to_dict() for block_obj in self.chain],
             "pending_transactions": [tx.to_dict() for tx in self.pending_transactions],
             "difficulty": self.difficulty,
-            "mining_reward": self.mining_reward
+            "mining_reward": self.mining_reward,
+            "block_version": self.block_version,
+            "verified_signatures": sorted(self.verified_signatures),
+            "validated_checkpoint": self.validated_checkpoint,
+            "key_registry": self.key_registry.to_dict()
         }
 
     @classmethod
-    def from_json_serializable(cls, data: dict) -> 'Blockchain':
-        """Creates a Blockchain instance from a JSON-serializable dictionary."""
+    def from_json_serializable(cls, data: dict, miner=None, chain=None, confirmed_balances: dict | None = None,
+                               confirmed_nonces: dict | None = None) -> 'Blockchain':
+        """
+        Creates a Blockchain instance from a JSON-serializable dictionary.
+
+        A storage engine may pass `chain` pre-built (e.g. a LazyChain from storage.py) instead of
+        data['chain'], together with `confirmed_balances` and `confirmed_nonces`, a stored ledger
+        snapshot for that chain which saves rebuilding the ledger by scanning every block.
+        """
         blockchain_instance = cls(
             difficulty=data.get('difficulty', 2),
-            mining_reward=data.get('mining_reward', 100.0)
+            mining_reward=data.get('mining_reward', 100 * COIN), # Legacy files store a float coin amount
+            miner=miner,
+            block_version=data.get('block_version', BLOCK_VERSION_LEGACY)
         )
         
+        blockchain_instance.verified_signatures = set(data.get('verified_signatures', []))
+        # Checked against the loaded chain on the next validation (see _validation_start_index).
+        blockchain_instance.validated_checkpoint = data.get('validated_checkpoint')
+        blockchain_instance.key_registry = KeyRegistry(data.get('key_registry'))
+
+        pending = []
         for tx_data in data.get('pending_transactions', []):
             try:
-                blockchain_instance.pending_transactions.append(Transaction.from_dict(tx_data))
+                pending.append(Transaction.from_dict(tx_data))
             except ValueError as e:
                 print(f"Warning: Skipping malformed pending transaction during load: {e}")
+        blockchain_instance.pending_transactions = pending
 
-        blockchain_instance.chain = []
-        for block_data in data.get('chain', []):
+        blockchain_instance.chain = chain if chain is not None else []
+        for block_data in ([] if chain is not None else data.get('chain', [])):
             try:
                 # Transactions in block_data are already dicts from to_dict()
-                block = Block(
-                    index=block_data['index'],
-                    transactions=block_data['transactions'], 
-                    timestamp=block_data['timestamp'],
-                    previous_hash=block_data['previous_hash'],
-                    nonce=block_data['nonce']
-                )
-                # Crucially, use the hash stored in the file, not recalculate (unless missing)
-                block.hash = block_data.get('hash', block.calculate_hash()) 
-                blockchain_instance.chain.append(block)
+                # Crucially, Block.from_dict uses the hash stored in the file, not a recalculated one
+                blockchain_instance.chain.append(Block.from_dict(block_data))
             except (KeyError, TypeError, ValueError) as e:
                  print(f"Warning: Skipping malformed block (index {block_data.get('index', 'Unknown')}) during load: {e}")
 
         if not blockchain_instance.chain: # If chain is empty after loading (e.g. corrupt file)
             print("Warning: Loaded chain was empty or invalid. A new genesis block will be created.")
             blockchain_instance.create_genesis_block()
+            confirmed_balances = None
+
+        if confirmed_balances is not None and confirmed_nonces is not None:
+            blockchain_instance.restore_balance_index(confirmed_balances, confirmed_nonces)
+        else:
+            blockchain_instance.rebuild_balance_index()
             
         return blockchain_instance
 
+    def migrate_to_addresses(self) -> int:
+        """
+        Converts blocks that still store full PEM public keys to store addresses, registering every key.
+        Block hashes change, so every block from the first converted one onward is re-linked and
+        re-mined with the configured miner. Signatures stay valid: they cover the full keys, which
+        verification now takes from the key registry.
+
+        Returns:
+            int: The number of transactions converted (0 if the chain already stores addresses).
+        """
+        with self.write_lock: # A one-off rewrite: other writers wait for it, re-mining included
+            return self._migrate_to_addresses()
+
+    def _migrate_to_addresses(self) -> int:
+        converted = 0
+        new_chain = []
+        rewriting = False # Set from the first converted block on: later blocks must be re-linked
+        for block_obj in self.chain:
+            compact_transactions = []
+            for tx_dict in block_obj.transactions:
+                # Kept as stored: these blocks' signatures cover exactly this text
+                self.key_registry.register(tx_dict.get('sender_public_key'), canonical=False)
+                self.key_registry.register(tx_dict.get('recipient_public_key'), canonical=False)
+                compact_transactions.append(compact_tx_dict(tx_dict))
+            block_converted = sum(old != new for old, new in zip(block_obj.transactions, compact_transactions))
+            converted += block_converted
+            rewriting = rewriting or block_converted > 0
+            if not rewriting:
+                new_chain.append(block_obj) # Nothing converted up to here: keep the block as it is
+                continue
+            new_block = Block(block_obj.index, compact_transactions, block_obj.timestamp,
+                              new_chain[-1].hash if new_chain else block_obj.previous_hash, version=block_obj.version)
+            if new_block.index > 0: # The genesis block has no Proof-of-Work
+                self.proof_of_work(new_block)
+            new_chain.append(new_block)
+
+        if converted:
+            self.chain = new_chain
+            self.validated_checkpoint = None
+            self._block_positions = self._tx_locations = self._address_history = None
+            self.tx_index_loader = None
+            self.rebuild_balance_index()
+            print(f"Migrated {converted} transactions to addresses; the chain was re-mined from the first converted block.")
+        return converted
+
     def save_to_file(self, filename: str = "blockchain_data.json"):
         """Saves the current blockchain state to a JSON file."""
         try:
@@ -306,13 +1065,13 @@ class Blockchain:
             traceback.print_exc()
 
     @classmethod
-    def load_from_file(cls, filename: str = "blockchain_data.json") -> 'Blockchain | None':
+    def load_from_file(cls, filename: str = "blockchain_data.json", miner=None) -> 'Blockchain | None':
         """Loads blockchain state from a JSON file."""
         try:
             with open(filename, 'r') as f:
                 data = json.load(f)
             print(f"Blockchain data successfully loaded from {filename}")
-            return cls.from_json_serializable(data)
+            return cls.from_json_serializable(data, miner=miner)
         except FileNotFoundError:
             print(f"Info: No saved blockchain found at '{filename}'.")
             return None
@@ -347,30 +1106,34 @@ if __name__ == '__main__':
     assert bc.is_chain_valid(), "Test 1.2 Failed: Initial chain invalid."
     print("Test 1 Passed: Initialization and Genesis.")
 
-    # Test 2: Mining reward and balance
+    # Test 2: Mining reward and balance (empty blocks are not mined, so a faucet grant is staged first)
+    ok, msg, _ = bc.add_transaction(Transaction("welcome_faucet", miner_pub, COIN))
+    assert ok, f"Test 2.0 Failed: Faucet grant rejected - {msg}"
     block1, duration1, msg1 = bc.mine_pending_transactions(miner_pub)
     assert block1 is not None, f"Test 2.1 Failed: Mining failed - {msg1}"
     assert len(bc.chain) == 2, "Test 2.2 Failed: Block not added after mining."
-    assert bc.get_balance(miner_pub) == bc.mining_reward, "Test 2.3 Failed: Miner reward incorrect."
+    assert bc.get_balance(miner_pub) == bc.mining_reward + COIN, "Test 2.3 Failed: Miner reward incorrect."
     assert bc.is_chain_valid(), "Test 2.4 Failed: Chain invalid after first mine."
     print("Test 2 Passed: Mining Reward and Balance.")
 
     # Test 3: Add valid transaction
-    amount_alice_to_bob = 10.0
+    amount_alice_to_bob = 10 * COIN
     # Alice needs funds first - let's give them via the miner (who has funds)
     if bc.get_balance(miner_pub) >= amount_alice_to_bob:
-        tx_miner_to_alice_data = get_data_to_sign(miner_pub, alice_pub, amount_alice_to_bob * 2) # Give Alice enough
+        priming_nonce = new_nonce()
+        tx_miner_to_alice_data = get_data_to_sign(miner_pub, alice_pub, amount_alice_to_bob * 2, nonce=priming_nonce) # Give Alice enough
         tx_miner_to_alice_sig = sign_data(miner_priv, tx_miner_to_alice_data)
-        tx_miner_to_alice = Transaction(miner_pub, alice_pub, amount_alice_to_bob * 2, tx_miner_to_alice_sig)
+        tx_miner_to_alice = Transaction(miner_pub, alice_pub, amount_alice_to_bob * 2, tx_miner_to_alice_sig, nonce=priming_nonce)
         ok, msg, _ = bc.add_transaction(tx_miner_to_alice)
         assert ok, f"Test 3.0 Failed: Could not add priming transaction - {msg}"
         bc.mine_pending_transactions(miner_pub) # Mine this priming transaction
     
     assert bc.get_balance(alice_pub) >= amount_alice_to_bob, f"Test 3.0.1 Failed: Alice does not have enough funds after priming. Has: {bc.get_balance(alice_pub)}"
 
-    tx_data_alice_to_bob = get_data_to_sign(alice_pub, bob_pub, amount_alice_to_bob)
+    valid_nonce = new_nonce()
+    tx_data_alice_to_bob = get_data_to_sign(alice_pub, bob_pub, amount_alice_to_bob, nonce=valid_nonce)
     tx_sig_alice_to_bob = sign_data(alice_priv, tx_data_alice_to_bob)
-    valid_tx = Transaction(alice_pub, bob_pub, amount_alice_to_bob, tx_sig_alice_to_bob)
+    valid_tx = Transaction(alice_pub, bob_pub, amount_alice_to_bob, tx_sig_alice_to_bob, nonce=valid_nonce)
     
     ok, msg, _ = bc.add_transaction(valid_tx)
     assert ok, f"Test 3.1 Failed: Valid transaction rejected - {msg}"
@@ -388,9 +1151,10 @@ if __name__ == '__main__':
     print("Test 4 Passed: Mine Transaction and Balance Update.")
 
     # Test 5: Add transaction with insufficient funds
-    tx_insufficient_data = get_data_to_sign(bob_pub, alice_pub, bc.get_balance(bob_pub) + 1.0) # Bob tries to send more than he has
+    insufficient_nonce = new_nonce()
+    tx_insufficient_data = get_data_to_sign(bob_pub, alice_pub, bc.get_balance(bob_pub) + 1, nonce=insufficient_nonce) # Bob tries to send more than he has
     tx_insufficient_sig = sign_data(bob_priv, tx_insufficient_data)
-    insufficient_tx = Transaction(bob_pub, alice_pub, bc.get_balance(bob_pub) + 1.0, tx_insufficient_sig)
+    insufficient_tx = Transaction(bob_pub, alice_pub, bc.get_balance(bob_pub) + 1, tx_insufficient_sig, nonce=insufficient_nonce)
     ok, msg, _ = bc.add_transaction(insufficient_tx)
     assert not ok, "Test 5.1 Failed: Insufficient funds transaction accepted."
     print(f"Test 5 Passed: Insufficient Funds Transaction Rejected (Message: {msg}).")
@@ -405,6 +1169,196 @@ if __name__ == '__main__':
     assert loaded_bc.is_chain_valid(), "Test 6.4 Failed: Loaded blockchain is not valid."
     print("Test 6 Passed: Save and Load.")
 
+    # Test 7: Incremental balance index agrees with a full scan
+    assert bc.verify_balance_index(), "Test 7.1 Failed: Balance index diverged from full scan."
+    assert loaded_bc.verify_balance_index(), "Test 7.2 Failed: Loaded balance index diverged from full scan."
+    assert bc.get_balance(bob_pub) == loaded_bc.get_balance(bob_pub), "Test 7.3 Failed: Loaded balance mismatch."
+    print("Test 7 Passed: Balance Index.")
+
+    # Test 8: Legacy float amounts are converted to base units on load
+    legacy_bc = Blockchain(difficulty=1)
+    legacy_bc.create_genesis_block()
+    legacy_grant = {'sender_public_key': 'network', 'recipient_public_key': address_of(alice_pub), 'amount': 0.1, 'signature': None}
+    legacy_block = Block(1, [legacy_grant] * 3, time.time(), legacy_bc.chain[-1].hash)
+    legacy_bc.proof_of_work(legacy_block)
+    legacy_bc.chain.append(legacy_block)
+    legacy_data = {**legacy_bc.to_json_serializable(), 'mining_reward': 12.5}
+    converted_bc = Blockchain.from_json_serializable(json.loads(json.dumps(legacy_data)))
+    assert converted_bc.get_balance(alice_pub) == 30_000_000, "Test 8.1 Failed: Legacy amounts not summed exactly."
+    assert converted_bc.mining_reward == 1_250_000_000, "Test 8.2 Failed: Legacy mining reward not converted."
+    assert converted_bc.is_chain_valid(), "Test 8.3 Failed: Legacy block hashes must be unchanged."
+    print("Test 8 Passed: Legacy Amount Conversion.")
+
+    # Test 9: Fees, duplicates and replays
+    fee, fee_nonce = 5_000, new_nonce()
+    fee_data = get_data_to_sign(alice_pub, bob_pub, COIN, fee, fee_nonce)
+    fee_tx = Transaction(alice_pub, bob_pub, COIN, sign_data(alice_priv, fee_data), fee, fee_nonce)
+    resigned_tx = Transaction(alice_pub, bob_pub, COIN, sign_data(alice_priv, fee_data), fee, fee_nonce) # Same payment, new txid
+    assert resigned_tx.txid != fee_tx.txid
+    alice_before, miner_before = bc.get_balance(alice_pub), bc.get_balance(miner_pub)
+    ok, msg, _ = bc.add_transaction(fee_tx)
+    assert ok, f"Test 9.1 Failed: Fee transaction rejected - {msg}"
+    assert bc.get_spendable_balance(alice_pub) == alice_before - COIN - fee, "Test 9.2 Failed: Pending spend not tracked."
+    assert not bc.add_transaction(Transaction.from_dict(fee_tx.to_dict()))[0], "Test 9.3 Failed: Duplicate accepted."
+    assert not bc.add_transaction(resigned_tx)[0], "Test 9.3.1 Failed: Re-signed duplicate accepted while pending."
+    bc.mine_pending_transactions(miner_pub)
+    assert bc.get_balance(alice_pub) == alice_before - COIN - fee, "Test 9.4 Failed: Fee not paid by sender."
+    assert bc.get_balance(miner_pub) == miner_before + bc.mining_reward + fee, "Test 9.5 Failed: Fee not paid to miner."
+    assert not bc.add_transaction(Transaction.from_dict(fee_tx.to_dict()))[0], "Test 9.6 Failed: Replay of a mined transaction accepted."
+    ok, msg, _ = bc.add_transaction(resigned_tx)
+    assert not ok and "nonce" in msg, f"Test 9.6.1 Failed: Re-signed replay of a mined transaction accepted ({msg})."
+    unnonced = Transaction(alice_pub, bob_pub, COIN, sign_data(alice_priv, get_data_to_sign(alice_pub, bob_pub, COIN)))
+    assert not bc.add_transaction(unnonced)[0], "Test 9.6.2 Failed: A signed transaction without a nonce was accepted."
+    assert bc.get_last_nonce(alice_pub) == fee_nonce, "Test 9.6.3 Failed: Confirmed nonce not tracked."
+    grants = [Transaction("welcome_faucet", bob_pub, COIN) for _ in range(2)]
+    assert all(bc.add_transaction(grant)[0] for grant in grants), "Test 9.6.4 Failed: Equal system grants refused."
+    assert grants[0].txid != grants[1].txid
+    bc.mine_pending_transactions(miner_pub)
+    assert bc.verify_balance_index() and bc.is_chain_valid(), "Test 9.7 Failed: Chain or balance index invalid after fees."
+    print("Test 9 Passed: Fees, Duplicates and Replays.")
+
+    # Test 10: Block limits and draining a backlog
+    bc.max_block_transactions = 3 # Reward + 2 transactions
+    for i in range(5):
+        bc.add_transaction(Transaction("welcome_faucet", bob_pub, (i + 1) * COIN))
+    reports, drain_msg = bc.mine_backlog(miner_pub)
+    assert [report['transactions'] for report in reports] == [3, 3, 2], f"Test 10.1 Failed: Unexpected block sizes {reports}"
+    assert len(bc.pending_transactions) == 0 and reports[-1]['pending_after'] == 0, "Test 10.2 Failed: Backlog not drained."
+    bc.max_block_bytes = 100 # Too small for any transaction
+    too_big = bc.add_transaction(Transaction("welcome_faucet", bob_pub, COIN))
+    assert not too_big[0], "Test 10.3 Failed: Transaction larger than a block accepted."
+    assert bc.is_chain_valid() and bc.verify_balance_index(), "Test 10.4 Failed: Chain invalid after draining."
+    print(f"Test 10 Passed: Block Limits and Backlog Draining ({drain_msg}).")
+
+    # Test 11: Cancelled mining and transactions staged while a block is being mined
+    bc.max_block_bytes = DEFAULT_MAX_BLOCK_BYTES
+    bc.add_transaction(Transaction("welcome_faucet", alice_pub, COIN))
+    height, pending = len(bc.chain), bc.pending_transactions
+    control = MiningControl()
+    control.cancel()
+    cancelled_block, _, cancel_msg = bc.mine_pending_transactions(miner_pub, control)
+    assert cancelled_block is None and len(bc.chain) == height, "Test 11.1 Failed: A cancelled mine added a block."
+    assert bc.pending_transactions == pending, f"Test 11.2 Failed: A cancelled mine changed the pool ({cancel_msg})."
+
+    late_tx = Transaction("welcome_faucet", alice_pub, 2 * COIN)
+    class StagingMiner(SequentialMiner): # Stages a transaction while the block is being mined
+        def mine(self, block, difficulty, control=None):
+            bc.add_transaction(late_tx)
+            return super().mine(block, difficulty, control)
+    bc.miner = StagingMiner()
+    assert bc.mine_pending_transactions(miner_pub, MiningControl())[0] is not None, "Test 11.3 Failed: Mining failed."
+    assert bc.pending_transactions == [late_tx], "Test 11.4 Failed: A transaction staged during mining was lost or mined."
+    bc.miner = SequentialMiner()
+    print("Test 11 Passed: Cancelled Mining and Transactions Staged Meanwhile.")
+
+    # Test 12: Snapshots, mining given transactions, and blocks that lost the race for the tip
+    snap = bc.snapshot()
+    height, alice_balance = snap.height, snap.get_balance(alice_pub, include_pending=False)
+    grant_block, _, grant_msg = bc.mine_transactions([Transaction("welcome_faucet", alice_pub, 3 * COIN)], miner_pub)
+    assert grant_block is not None and bc.pending_transactions == [late_tx], f"Test 12.1 Failed: {grant_msg}"
+    assert bc.get_balance(alice_pub, include_pending=False) == alice_balance + 3 * COIN, "Test 12.2 Failed: Grant not credited."
+    assert snap.height == height and snap.get_balance(alice_pub, include_pending=False) == alice_balance, \
+        "Test 12.3 Failed: A published snapshot changed."
+    signed_tx = Transaction(alice_pub, bob_pub, COIN, "not-checked")
+    assert bc.mine_transactions([signed_tx], miner_pub)[0] is None, "Test 12.4 Failed: A signed transaction was mined directly."
+
+    class RacingMiner(SequentialMiner): # Another block reaches the chain while this one is being mined
+        def mine(self, block, difficulty, control=None):
+            bc.miner = SequentialMiner()
+            bc.mine_transactions([Transaction("welcome_faucet", bob_pub, COIN)], miner_pub)
+            return super().mine(block, difficulty, control)
+    bc.miner = RacingMiner()
+    height = len(bc.chain)
+    stale_block, _, stale_msg = bc.mine_pending_transactions(miner_pub)
+    assert stale_block is None and len(bc.chain) == height + 1, f"Test 12.5 Failed: A stale block was added ({stale_msg})."
+    assert bc.pending_transactions == [late_tx], "Test 12.6 Failed: A discarded block took its transactions out of the pool."
+    assert bc.is_chain_valid() and bc.verify_balance_index(), "Test 12.7 Failed: Chain invalid after a discarded block."
+    print(f"Test 12 Passed: Snapshots and Discarded Stale Blocks ({stale_msg}).")
+
+    # Test 13: Batch submission, each transaction accepted or rejected on its own
+    bc.miner = SequentialMiner()
+    bc.mine_pending_transactions(miner_pub)
+    def signed(amount, fee=0, recipient=bob_pub):
+        nonce = new_nonce()
+        return Transaction(alice_pub, recipient, amount, sign_data(alice_priv, get_data_to_sign(alice_pub, recipient, amount, fee, nonce)),
+                           fee, nonce)
+    spendable = bc.get_spendable_balance(alice_pub)
+    first, forged, overspend = signed(spendable // 2), signed(COIN), signed(spendable // 2 + 1)
+    forged.amount = 2 * COIN # No longer matches its signature
+    snapshots_before = bc.snapshot()
+    results = bc.add_transactions([first, forged, overspend, first, signed(spendable // 2 - 1, fee=1)], workers=2)
+    assert [accepted for accepted, _msg, _next in results] == [True, False, False, False, True], f"Test 13.1 Failed: {results}"
+    assert "signature" in results[1][1] and "Insufficient" in results[2][1] and "already pending" in results[3][1], \
+        f"Test 13.2 Failed: Unexpected rejection reasons {[msg for _ok, msg, _next in results]}"
+    assert bc.get_spendable_balance(alice_pub) == 0 and bc.snapshot() is not snapshots_before, "Test 13.3 Failed: Batch not staged."
+    assert bc.add_transactions([]) == [], "Test 13.4 Failed: Empty batch."
+    print("Test 13 Passed: Batch Submission.")
+
+    # Test 14: Merkle blocks that repeat their last transaction (same root and hash, CVE-2012-2459)
+    from block import BLOCK_VERSION_MERKLE
+    merkle_bc = Blockchain(difficulty=1, block_version=BLOCK_VERSION_MERKLE)
+    merkle_bc.create_genesis_block()
+    for amount in (COIN, 2 * COIN): # With the reward: three leaves, so the last one is paired with itself
+        merkle_bc.add_transaction(Transaction("welcome_faucet", alice_pub, amount))
+    mined_block = merkle_bc.mine_pending_transactions(miner_pub)[0]
+    tx_dicts = list(mined_block.transactions)
+    repeated = Block(mined_block.index, tx_dicts + tx_dicts[-1:], mined_block.timestamp, mined_block.previous_hash,
+                     mined_block.nonce, mined_block.version)
+    assert repeated.hash == mined_block.hash, "Test 14.0 Failed: Expected the repeated block to share the hash."
+    merkle_bc.chain[-1] = repeated
+    assert not merkle_bc.is_chain_valid(full=True), "Test 14.1 Failed: A block repeating a transaction was valid."
+    assert merkle_bc.last_validation_failure['tx_position'] == len(tx_dicts), "Test 14.2 Failed: Wrong failure position."
+    merkle_bc.chain[-1] = mined_block
+    assert merkle_bc.is_chain_valid(full=True), "Test 14.3 Failed: The original block must stay valid."
+    parent = merkle_bc.get_latest_block()
+    grant = Transaction("welcome_faucet", alice_pub, COIN).to_dict(compact=True)
+    repeated_tip = Block(parent.index + 1, [grant, grant, grant], time.time(), parent.hash, version=BLOCK_VERSION_MERKLE)
+    merkle_bc.proof_of_work(repeated_tip)
+    with merkle_bc.write_lock:
+        assert merkle_bc._commit_block(repeated_tip, parent, []) is not None, "Test 14.4 Failed: Repeated transactions committed."
+    assert merkle_bc.get_latest_block() is parent, "Test 14.5 Failed: The chain changed."
+    print("Test 14 Passed: Repeated Transactions in Merkle Blocks Rejected.")
+
+    # Test 15: A key first seen in another PEM text (same address) must not make its owner's transactions invalid once mined
+    carol_priv, carol_pub = generate_key_pair()
+    pem_bc = Blockchain(difficulty=1)
+    pem_bc.create_genesis_block()
+    assert pem_bc.add_transaction(Transaction("welcome_faucet", carol_pub + "\n", 5 * COIN))[0]
+    pem_bc.mine_pending_transactions(miner_pub)
+    assert pem_bc.key_registry.resolve(address_of(carol_pub)) == carol_pub, "Test 15.1 Failed: Key not registered canonically."
+    def carol_signs(sender_pem, recipient_pem):
+        nonce = new_nonce()
+        return Transaction(sender_pem, recipient_pem, COIN, sign_data(carol_priv, get_data_to_sign(sender_pem, recipient_pem, COIN, nonce=nonce)),
+                           nonce=nonce)
+    ok, msg, _ = pem_bc.add_transaction(carol_signs(carol_pub + "\n", bob_pub))
+    assert not ok and "canonical" in msg, f"Test 15.2 Failed: Non-canonical sender accepted - {msg}"
+    assert not pem_bc.add_transaction(carol_signs(carol_pub, bob_pub.replace("\n", "\r\n")))[0], "Test 15.3 Failed: Non-canonical recipient accepted."
+    ok, msg, _ = pem_bc.add_transaction(carol_signs(carol_pub, bob_pub))
+    assert ok, f"Test 15.4 Failed: Canonical transaction rejected - {msg}"
+    pem_bc.mine_pending_transactions(miner_pub)
+    assert pem_bc.is_chain_valid(full=True), f"Test 15.5 Failed: {pem_bc.last_validation_failure}"
+    print("Test 15 Passed: Public Keys in Canonical PEM Form.")
+
+    # Test 16: Only staged transactions are remembered as verified; rejected and evicted ones leave no digest
+    dave_priv, dave_pub = generate_key_pair()
+    memo_bc = Blockchain(difficulty=1)
+    memo_bc.create_genesis_block()
+    memo_bc.add_transaction(Transaction("welcome_faucet", carol_pub, 5 * COIN))
+    memo_bc.mine_pending_transactions(miner_pub)
+    def signs(priv, sender_pem, amount, fee=0):
+        nonce = new_nonce()
+        return Transaction(sender_pem, bob_pub, amount, sign_data(priv, get_data_to_sign(sender_pem, bob_pub, amount, fee, nonce)), fee, nonce)
+    ok, msg, _ = memo_bc.add_transaction(signs(dave_priv, dave_pub, COIN))
+    assert not ok and not memo_bc.verified_signatures, f"Test 16.1 Failed: A rejected transaction was remembered ({msg})."
+    memo_bc.add_transaction(Transaction("welcome_faucet", dave_pub, 5 * COIN))
+    memo_bc.mine_pending_transactions(miner_pub)
+    memo_bc.mempool.max_transactions = 1
+    low_fee, high_fee = signs(carol_priv, carol_pub, COIN), signs(dave_priv, dave_pub, COIN, fee=1)
+    assert memo_bc.add_transaction(low_fee)[0] and len(memo_bc.verified_signatures) == 1, "Test 16.2 Failed: Staged transaction not remembered."
+    assert memo_bc.add_transaction(high_fee)[0] and memo_bc.pending_transactions == [high_fee], "Test 16.3 Failed: No eviction."
+    assert memo_bc.verified_signatures == {Blockchain._signature_digest(high_fee)}, "Test 16.4 Failed: Evicted transaction still remembered."
+    print("Test 16 Passed: Verified Signatures Kept Only for Staged Transactions.")
+
     # Clean up test file
     import os
     if os.path.exists("test_blockchain_temp.json"):
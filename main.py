@@ -4,8 +4,12 @@ import os
 import json
 import time # For delays or timing if needed
 
+from analytics import ANALYTICS_AVAILABLE, ChainAnalytics
 from blockchain import Blockchain
-from transaction import Transaction
+from storage import BlockLogStorage
+from transaction import Transaction, new_nonce
+from utils.addresses import address_of, is_address
+from utils.amounts import format_amount, parse_amount
 from utils.crypto_utils import generate_key_pair, sign_data, get_data_to_sign
 
 # --- Wallet Configuration ---
@@ -73,15 +77,19 @@ def display_current_wallet_info(chain_instance: Blockchain):
     if currentUserKeys["public_key_pem"]:
         print("\n--- Current Wallet Status ---")
         print(f"Wallet Name: {currentUserKeys.get('name', 'N/A')}")
-        print(f"Your Public Key (Address):\n{currentUserKeys['public_key_pem']}")
+        print(f"Your Public Key:\n{currentUserKeys['public_key_pem']}")
+        print(f"Your Address: {address_of(currentUserKeys['public_key_pem'])}")
         balance = chain_instance.get_balance(currentUserKeys['public_key_pem'])
-        print(f"Your Current Balance: {balance:.4f} coins")
+        print(f"Your Current Balance: {format_amount(balance)} coins")
         print("-----------------------------")
     else:
         print("\nNo active wallet. Please generate or load one.")
 
-def print_blockchain_details_cli(chain_instance: Blockchain):
-    """Helper function to print blockchain state for CLI."""
+def print_blockchain_details_cli(chain_instance: Blockchain, start: int = 0, limit: int | None = None):
+    """
+    Helper function to print blockchain state for CLI.
+    Only blocks start .. start + limit - 1 are printed (all remaining blocks if limit is None).
+    """
     print("\n" + "="*10 + " Current Blockchain State (CLI) " + "="*10)
     if not chain_instance.chain:
         print("Blockchain is empty.")
@@ -89,9 +97,15 @@ def print_blockchain_details_cli(chain_instance: Blockchain):
 
     print(f"Total blocks: {len(chain_instance.chain)}")
     print(f"Difficulty: {chain_instance.difficulty}")
-    print(f"Mining Reward: {chain_instance.mining_reward}")
+    print(f"Mining Reward: {format_amount(chain_instance.mining_reward)}")
 
-    for block in chain_instance.chain:
+    blocks = chain_instance.get_blocks(start, limit if limit is not None else len(chain_instance.chain))
+    if blocks:
+        print(f"Showing blocks #{blocks[0].index} to #{blocks[-1].index}")
+    else:
+        print(f"No blocks from index {start}.")
+
+    for block in blocks:
         print(f"\n--- Block #{block.index} ---")
         print(f"  Timestamp: {time.ctime(block.timestamp)}")
         print(f"  Nonce: {block.nonce}")
@@ -104,17 +118,38 @@ def print_blockchain_details_cli(chain_instance: Blockchain):
                 sender_display = "NETWORK (Reward)" if tx.sender_public_key == "network" else f"From: {tx.sender_public_key[:20]}..."
                 recipient_display = f"To: {tx.recipient_public_key[:20]}..."
                 sig_display = "Signed" if tx.signature else "N/A (Network)"
-                print(f"    {i+1}. {sender_display}, {recipient_display}, Amount: {tx.amount}, Sig: {sig_display}")
+                print(f"    {i+1}. {sender_display}, {recipient_display}, Amount: {format_amount(tx.amount)}, Sig: {sig_display}")
         else:
             print("    - No transactions.")
     print("="*10 + " End of Blockchain State " + "="*10)
 
+def print_chain_statistics_cli(chain_instance: Blockchain, top: int = 10, recent_blocks: int = 10):
+    """Prints supply, top holders and the volume of the most recent blocks (confirmed transactions only)."""
+    if not ANALYTICS_AVAILABLE:
+        print("Chain statistics need NumPy ('pip install numpy').")
+        return
+    analytics = ChainAnalytics.from_blockchain(chain_instance)
+    summary = analytics.summary()
+    print("\n" + "="*10 + " Chain Statistics " + "="*10)
+    print(f"Blocks: {summary['height']}, Transactions: {summary['transactions']}, Holders: {summary['holders']}")
+    print(f"Total supply: {format_amount(summary['total_supply'])}")
+    print(f"Transfer volume: {format_amount(summary['transfer_volume'])}")
+    print(f"\nTop {top} holders:")
+    for entry in analytics.ranked_balances(0, top)[0]:
+        print(f"  {entry['rank']:>3}. {entry['address']}  {format_amount(entry['balance'])}")
+    print(f"\nLast {recent_blocks} blocks:")
+    for row in analytics.block_series(max(0, summary['height'] - recent_blocks)):
+        print(f"  #{row['block_index']}: {row['transactions']} txs, volume {format_amount(row['volume'])}, "
+              f"issued {format_amount(row['issued'])}, supply {format_amount(row['supply'])}")
+    print("="*10 + " End of Chain Statistics " + "="*10)
+
 
 def main_cli():
     print("--- Simple Blockchain CLI (with Wallet) ---")
     
-    blockchain_data_filename = "blockchain_data.json" # From app.py
-    my_blockchain = Blockchain.load_from_file(blockchain_data_filename)
+    blockchain_data_filename = "blockchain_data.json" # Legacy whole-file format, imported once
+    storage = BlockLogStorage("blockchain_log") # Same block log as app.py
+    my_blockchain = storage.load_or_import_json(blockchain_data_filename)
 
     if my_blockchain is None:
         print("\nNo existing blockchain found or error loading.")
@@ -148,16 +183,17 @@ def main_cli():
         print("\n" + "-"*15 + " Blockchain CLI Menu " + "-"*15)
         print("1. Add a new transaction")
         print("2. Mine pending transactions")
-        print("3. Display the full blockchain")
+        print("3. Display the blockchain (paged)")
         print("4. Validate the blockchain")
         print("5. View pending transactions")
         print("6. Save blockchain to file")
         print("7. Manage Wallet (Generate/Load/View Keys)")
         print("8. Get balance for any public key")
-        print("9. Exit")
+        print("9. Show chain statistics")
+        print("10. Exit")
         print("-"*47)
 
-        choice = input("Enter your choice (1-9): ").strip()
+        choice = input("Enter your choice (1-10): ").strip()
 
         if choice == '1': # Add Transaction
             if not currentUserKeys["private_key_pem"]:
@@ -173,13 +209,20 @@ def main_cli():
                     continue
 
                 amount_str = input(f"  Enter transaction amount to send to {recipient_public_key_pem[:20]}...: ").strip()
-                amount = float(amount_str)
+                amount = parse_amount(amount_str) # Base units
+                fee_str = input("  Enter fee for the miner (higher fees are mined first; Enter = 0): ").strip()
+                fee = parse_amount(fee_str) if fee_str else 0
+                if fee < 0:
+                    raise ValueError("Fee cannot be negative.")
 
-                # Prepare data for signing (sender is current user)
+                # Prepare data for signing (sender is current user); the nonce keeps the payment unique
+                nonce = new_nonce()
                 data_to_sign_str = get_data_to_sign(
                     currentUserKeys["public_key_pem"],
                     recipient_public_key_pem,
-                    amount
+                    amount,
+                    fee,
+                    nonce
                 )
                 # Sign the transaction data
                 signature_hex = sign_data(currentUserKeys["private_key_pem"], data_to_sign_str)
@@ -188,13 +231,15 @@ def main_cli():
                     sender_public_key=currentUserKeys["public_key_pem"],
                     recipient_public_key=recipient_public_key_pem,
                     amount=amount,
-                    signature=signature_hex
+                    signature=signature_hex,
+                    fee=fee,
+                    nonce=nonce
                 )
                 
                 success, message, next_block_idx = my_blockchain.add_transaction(transaction)
                 if success:
                     print(f"  Transaction successfully added: {message}")
-                    my_blockchain.save_to_file(blockchain_data_filename) # Persist pending
+                    storage.save(my_blockchain) # Persist pending
                 else:
                     print(f"  Error adding transaction: {message}")
 
@@ -209,9 +254,20 @@ def main_cli():
                 continue
             print(f"\n--- Mine Pending Transactions ---")
             print(f"Mining rewards will go to your address: {currentUserKeys['public_key_pem'][:30]}...")
-            
+            pending_count = len(my_blockchain.pending_transactions)
+            if pending_count > my_blockchain.max_block_transactions - 1 and \
+               input(f"  {pending_count} transactions are pending. Mine blocks until none are left? (y/n): ").strip().lower() == 'y':
+                reports, drain_message = my_blockchain.mine_backlog(currentUserKeys["public_key_pem"])
+                for report in reports:
+                    print(f"    Block #{report['index']}: {report['transactions']} txs, {report['bytes']} bytes, "
+                          f"fees {format_amount(report['fees'])}, {report['duration']:.4f} s, {report['pending_after']} pending after")
+                print(f"  {drain_message}")
+                if reports:
+                    storage.save(my_blockchain) # Persist mined blocks
+                continue
+
             mined_block, mining_duration, mine_message = my_blockchain.mine_pending_transactions(
-                mining_reward_address_public_key=currentUserKeys["public_key_pem"]
+                currentUserKeys["public_key_pem"]
             )
             if mined_block:
                 print(f"  {mine_message}")
@@ -219,12 +275,23 @@ def main_cli():
                 print(f"    Nonce: {mined_block.nonce}")
                 if mining_duration is not None:
                     print(f"    Mining Time: {mining_duration:.4f} seconds")
-                my_blockchain.save_to_file(blockchain_data_filename) # Persist mined block
+                storage.save(my_blockchain) # Persist mined block
             else:
                 print(f"  Could not mine: {mine_message}")
 
         elif choice == '3':
-            print_blockchain_details_cli(my_blockchain)
+            page_size = 10
+            start_input = input(f"Start at block index (Enter = last {page_size} blocks): ").strip()
+            try:
+                start = int(start_input) if start_input else max(0, len(my_blockchain.chain) - page_size)
+            except ValueError:
+                print("Invalid block index.")
+                continue
+            while True:
+                print_blockchain_details_cli(my_blockchain, start, page_size)
+                start += page_size
+                if start >= len(my_blockchain.chain) or input("Show next page? (y/n): ").lower() != 'y':
+                    break
 
         elif choice == '4':
             print("\n--- Validate Blockchain ---")
@@ -242,7 +309,7 @@ def main_cli():
         
         elif choice == '6':
             print("\n--- Save Blockchain ---")
-            my_blockchain.save_to_file(blockchain_data_filename)
+            storage.save(my_blockchain)
 
         elif choice == '7': # Manage Wallet
             print("\n--- Wallet Management ---")
@@ -268,16 +335,17 @@ def main_cli():
 
         elif choice == '8': # Get balance for any public key
             print("\n--- Get Balance for Public Key ---")
-            pub_key_to_check = input("Enter the Public Key (PEM format) to check balance for:\n").strip()
+            pub_key_to_check = input("Enter the Public Key (PEM format) or address to check balance for:\n").strip()
             if pub_key_to_check:
                 try:
                     # Basic check for PEM format (very naive)
-                    if not pub_key_to_check.startswith("-----BEGIN PUBLIC KEY-----") or \
-                       not pub_key_to_check.endswith("-----END PUBLIC KEY-----"):
-                        print("  Error: Input does not look like a valid PEM public key.")
+                    if not is_address(pub_key_to_check) and (
+                       not pub_key_to_check.startswith("-----BEGIN PUBLIC KEY-----") or
+                       not pub_key_to_check.endswith("-----END PUBLIC KEY-----")):
+                        print("  Error: Input does not look like a valid PEM public key or address.")
                     else:
                         balance = my_blockchain.get_balance(pub_key_to_check)
-                        print(f"  Balance for {pub_key_to_check[:30]}... is: {balance:.4f} coins")
+                        print(f"  Balance for {pub_key_to_check[:30]}... is: {format_amount(balance)} coins")
                 except Exception as e:
                     print(f"  Error getting balance: {e}")
             else:
@@ -285,15 +353,18 @@ def main_cli():
 
 
         elif choice == '9':
+            print_chain_statistics_cli(my_blockchain)
+
+        elif choice == '10':
             print("\n--- Exit Application ---")
             save_on_exit = input("Save current blockchain state before exiting? (y/n, default: n): ").strip().lower()
             if save_on_exit == 'y':
-                my_blockchain.save_to_file(blockchain_data_filename)
+                storage.save(my_blockchain)
             print("Exiting Simple Blockchain CLI. Goodbye!")
             break
         
         else:
-            print("Invalid choice. Please enter a number between 1 and 9.")
+            print("Invalid choice. Please enter a number between 1 and 10.")
 
 if __name__ == "__main__":
     main_cli()
\ No newline at end of file
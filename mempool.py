@@ -0,0 +1,343 @@
+# mempool.py
+#
+# Pool of staged (not yet mined) transactions. Entries are keyed by txid, so a transaction can only
+# be staged once, and kept in arrival order. A signed transaction is also indexed by (sender, nonce),
+# so a copy with a new signature (re-signed or malleated: same payment, different txid) is refused too,
+# and a block takes each sender's transactions in nonce order. A heap orders them by priority:
+#
+#   system transactions (mining, faucet, allocations) > higher fee > earlier arrival
+#
+# When the pool is full (max_transactions / max_bytes) a new transaction evicts the lowest-priority
+# entries if it outranks them, and is refused otherwise. Each sender may have at most
+# max_per_sender transactions staged. Per-address running totals (pending spend = amount + fee of
+# staged outgoing transactions, and net pending delta) are updated as entries come and go, so
+# balance checks never rescan the pool. Operations that change or walk the pool hold an internal
+# lock, so a background mining job can remove mined entries while request threads stage new ones.
+
+import heapq
+import itertools
+import json
+import threading
+from transaction import Transaction
+from utils.addresses import address_of, compact_tx_dict
+from utils.amounts import format_amount
+from utils.merkle import hash_transaction
+
+SYSTEM_SENDERS = ("network", "welcome_faucet", "GENESIS_ALLOCATION") # Unsigned, created by the node itself
+DEFAULT_MAX_TRANSACTIONS = 5000
+DEFAULT_MAX_BYTES = 2_000_000 # Canonical JSON size of the staged transactions (see MempoolEntry.size)
+DEFAULT_MAX_PER_SENDER = 25
+
+def stored_size(tx: Transaction) -> int:
+    """Bytes of a transaction's canonical JSON form as stored in a block (compact, sorted keys); the size that pool and block limits count."""
+    return len(json.dumps(compact_tx_dict(tx.to_dict()), sort_keys=True).encode('utf-8'))
+
+
+class MempoolEntry:
+    """
+    A staged transaction with what the pool needs to rank and account for it: txid, size (see
+    stored_size), fee, nonce, arrival sequence number and party addresses.
+    """
+    __slots__ = ('tx', 'txid', 'size', 'fee', 'nonce', 'sequence', 'sender', 'recipient', 'system')
+
+    def __init__(self, tx: Transaction, sequence: int):
+        stored = compact_tx_dict(tx.to_dict())
+        self.tx = tx
+        self.txid: str = hash_transaction(stored)
+        self.size: int = len(json.dumps(stored, sort_keys=True).encode('utf-8'))
+        self.fee: int = tx.fee
+        self.nonce: int | None = tx.nonce
+        self.sequence: int = sequence
+        self.sender: str = address_of(tx.sender_public_key)
+        self.recipient: str = address_of(tx.recipient_public_key)
+        self.system: bool = tx.sender_public_key in SYSTEM_SENDERS
+
+    @property
+    def sender_nonce(self) -> int | None:
+        """The nonce that orders and deduplicates this entry among its sender's (None for system and nonce-less transactions)."""
+        return None if self.system else self.nonce
+
+    def priority(self) -> tuple:
+        """Sort key, best first: system transactions, then higher fee, then earlier arrival."""
+        return (not self.system, -self.fee, self.sequence)
+
+    def eviction_key(self) -> tuple:
+        """Sort key, first evicted first: the reverse of priority()."""
+        return (self.system, self.fee, -self.sequence)
+
+
+class Mempool:
+    """
+    Bounded, deduplicated pool of pending transactions ranked by fee (see module comment).
+    Signatures and balances are checked by Blockchain.add_transaction before add() is called.
+    """
+    def __init__(self, max_transactions: int = DEFAULT_MAX_TRANSACTIONS, max_bytes: int = DEFAULT_MAX_BYTES,
+                 max_per_sender: int = DEFAULT_MAX_PER_SENDER):
+        self.max_transactions: int = max_transactions
+        self.max_bytes: int = max_bytes
+        self.max_per_sender: int = max_per_sender # System senders are exempt
+        # Number of transactions that have left the pool (mined, evicted, replaced) since it was created;
+        # a listener that saw only additions since its last look can send just the new tail.
+        self.removal_count: int = 0
+        self._sequence = itertools.count()
+        self._lock = threading.RLock()
+        self._clear()
+
+    def _clear(self):
+        self._entries: dict[str, MempoolEntry] = {} # txid -> entry, in arrival order
+        self._eviction_heap: list[tuple] = [] # (eviction_key, txid); stale items are skipped lazily
+        self._total_bytes = 0
+        self._sender_counts: dict[str, int] = {}
+        self._pending_spends: dict[str, int] = {} # address -> amount + fee of staged outgoing transactions
+        self._pending_deltas: dict[str, int] = {} # address -> net balance change if everything staged were mined
+        self._sender_nonces: dict[str, dict[int, str]] = {} # address -> {nonce: txid} of staged signed transactions
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, txid: str) -> bool:
+        return txid in self._entries
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    def transactions(self) -> list[Transaction]:
+        """The staged transactions in arrival order."""
+        with self._lock:
+            return [entry.tx for entry in self._entries.values()]
+
+    def entries_by_priority(self) -> list[MempoolEntry]:
+        """The staged entries, best first (the order in which a block takes them)."""
+        with self._lock:
+            return sorted(self._entries.values(), key=MempoolEntry.priority)
+
+    def select(self, max_count: int, max_bytes: int) -> list[MempoolEntry]:
+        """
+        Greedy block template: walks the entries best first and takes each one that still fits,
+        skipping any too large for the bytes left, until max_count entries are taken. A sender's
+        transactions are taken in nonce order: one waits until every lower nonce of its sender has
+        been taken (walking again once it has), so a block never confirms a nonce above a pending one.
+        """
+        with self._lock:
+            entries = self.entries_by_priority()
+            # Nonces each sender still has to take, highest first, so the next one is at the end.
+            waiting = {sender: sorted(nonces, reverse=True) for sender, nonces in self._sender_nonces.items()}
+        selected, taken, remaining = [], set(), max_bytes
+        walk = True
+        while walk:
+            deferred = unblocked = False
+            for entry in entries:
+                if len(selected) >= max_count:
+                    break
+                if entry.txid in taken or entry.size > remaining:
+                    continue
+                nonce = entry.sender_nonce
+                if nonce is not None:
+                    if waiting[entry.sender][-1] != nonce:
+                        deferred = True
+                        continue
+                    waiting[entry.sender].pop()
+                    unblocked = True
+                selected.append(entry)
+                taken.add(entry.txid)
+                remaining -= entry.size
+            walk = deferred and unblocked and len(selected) < max_count
+        return selected
+
+    def snapshot(self) -> tuple[tuple[Transaction, ...], dict[str, int], int]:
+        """(staged transactions in arrival order, copy of the per-address pending deltas, removal_count), taken together."""
+        with self._lock:
+            return tuple(entry.tx for entry in self._entries.values()), dict(self._pending_deltas), self.removal_count
+
+    def get(self, txid: str) -> Transaction | None:
+        entry = self._entries.get(txid)
+        return entry.tx if entry else None
+
+    def pending_spend(self, address: str) -> int:
+        """Amount plus fees of the transactions `address` (an address, see utils/addresses.py) has staged."""
+        return self._pending_spends.get(address, 0)
+
+    def pending_delta(self, address: str) -> int:
+        """Net change of `address`'s balance once every staged transaction is mined (fees excluded from the miner side)."""
+        return self._pending_deltas.get(address, 0)
+
+    def highest_nonce(self, address: str) -> int | None:
+        """The highest nonce among the signed transactions `address` has staged (None if none carries one)."""
+        with self._lock:
+            return max(self._sender_nonces.get(address, ()), default=None)
+
+    def sender_count(self, address: str) -> int:
+        return self._sender_counts.get(address, 0)
+
+    def _insert(self, entry: MempoolEntry):
+        self._entries[entry.txid] = entry
+        if entry.sender_nonce is not None:
+            self._sender_nonces.setdefault(entry.sender, {})[entry.sender_nonce] = entry.txid
+        heapq.heappush(self._eviction_heap, (entry.eviction_key(), entry.txid))
+        self._total_bytes += entry.size
+        self._account(entry, 1)
+
+    def _account(self, entry: MempoolEntry, sign: int):
+        """Adds (sign=1) or removes (sign=-1) an entry's contribution to the per-address totals."""
+        outgoing = entry.tx.amount + entry.fee
+        for totals, address, change in ((self._pending_deltas, entry.recipient, entry.tx.amount),
+                                        (self._pending_deltas, entry.sender, -outgoing),
+                                        (self._pending_spends, entry.sender, outgoing),
+                                        (self._sender_counts, entry.sender, 1)):
+            value = totals.get(address, 0) + sign * change
+            if value:
+                totals[address] = value
+            else:
+                totals.pop(address, None)
+
+    def _discard(self, txid: str) -> MempoolEntry | None:
+        entry = self._entries.pop(txid, None)
+        if entry is not None:
+            nonces = self._sender_nonces.get(entry.sender)
+            if nonces is not None and nonces.get(entry.sender_nonce) == txid:
+                del nonces[entry.sender_nonce]
+                if not nonces:
+                    del self._sender_nonces[entry.sender]
+            self._total_bytes -= entry.size
+            self._account(entry, -1)
+            self.removal_count += 1
+        return entry
+
+    def _pop_worst(self) -> MempoolEntry | None:
+        """Pops the lowest-priority live heap item (stale items of removed entries are dropped)."""
+        while self._eviction_heap:
+            key, txid = heapq.heappop(self._eviction_heap)
+            entry = self._entries.get(txid)
+            if entry is not None and entry.eviction_key() == key:
+                return entry
+        return None
+
+    def _compact_heap(self):
+        """Rebuilds the eviction heap once stale items dominate it."""
+        if len(self._eviction_heap) > 2 * len(self._entries) + 64:
+            self._eviction_heap = [(entry.eviction_key(), txid) for txid, entry in self._entries.items()]
+            heapq.heapify(self._eviction_heap)
+
+    def add(self, tx: Transaction) -> tuple[bool, str, list[Transaction]]:
+        """
+        Stages a transaction, evicting lower-priority ones if the pool is full.
+
+        Returns:
+            tuple: (accepted, message, transactions evicted to make room).
+        """
+        with self._lock:
+            return self._add(MempoolEntry(tx, next(self._sequence)))
+
+    def _add(self, entry: MempoolEntry) -> tuple[bool, str, list[Transaction]]:
+        if entry.txid in self._entries:
+            return False, f"Transaction {entry.txid[:16]}... is already pending.", []
+        if entry.sender_nonce is not None and entry.sender_nonce in self._sender_nonces.get(entry.sender, ()):
+            return False, f"Sender already has a pending transaction with nonce {entry.sender_nonce}.", []
+        if not entry.system and self.sender_count(entry.sender) >= self.max_per_sender:
+            return False, f"Sender already has {self.max_per_sender} pending transactions; wait for a block to be mined.", []
+        if entry.size > self.max_bytes:
+            return False, f"Transaction of {entry.size} bytes exceeds the pool size limit.", []
+
+        # Find the lowest-priority entries whose removal makes room; give up if one outranks the newcomer.
+        victims = []
+        count, total = len(self._entries) + 1, self._total_bytes + entry.size
+        while count > self.max_transactions or total > self.max_bytes:
+            worst = self._pop_worst()
+            if worst is None or worst.eviction_key() >= entry.eviction_key():
+                for victim in victims + ([worst] if worst else []):
+                    heapq.heappush(self._eviction_heap, (victim.eviction_key(), victim.txid))
+                floor = f" (lowest pending fee: {format_amount(worst.fee)})" if worst else ""
+                return False, f"Mempool is full and the transaction's fee is too low to replace a pending one{floor}.", []
+            victims.append(worst)
+            count, total = count - 1, total - worst.size
+
+        for victim in victims:
+            self._discard(victim.txid)
+        self._insert(entry)
+        self._compact_heap()
+        return True, "Transaction staged.", [victim.tx for victim in victims]
+
+    def remove(self, txids) -> list[Transaction]:
+        """Removes the given transactions (e.g. once mined); unknown txids are ignored."""
+        with self._lock:
+            removed = [entry.tx for entry in map(self._discard, txids) if entry is not None]
+            self._compact_heap()
+            return removed
+
+    def remove_used_nonces(self, last_nonces: dict[str, int]) -> list[Transaction]:
+        """
+        Removes the staged transactions whose nonce is no longer above their sender's last confirmed
+        one (last_nonces: address -> nonce, e.g. the senders of a block just added); they could
+        never be mined any more.
+        """
+        with self._lock:
+            return self.remove([txid for sender, last in last_nonces.items()
+                                for nonce, txid in self._sender_nonces.get(sender, {}).items() if nonce <= last])
+
+    def reset(self, transactions: list[Transaction]):
+        """
+        Replaces the whole pool with `transactions`, kept in the given order and without limits (e.g.
+        when restoring a saved or temporarily swapped-out pool). Duplicates (by txid, or by sender and
+        nonce) are kept once.
+        """
+        with self._lock:
+            self.removal_count += len(self._entries)
+            self._clear()
+            for tx in transactions:
+                entry = MempoolEntry(tx, next(self._sequence))
+                if entry.txid not in self._entries and entry.sender_nonce not in self._sender_nonces.get(entry.sender, ()):
+                    self._insert(entry)
+
+    def __repr__(self) -> str:
+        return (f"Mempool(transactions={len(self._entries)}/{self.max_transactions}, "
+                f"bytes={self._total_bytes}/{self.max_bytes}, max_per_sender={self.max_per_sender})")
+
+
+if __name__ == '__main__':
+    from utils.amounts import COIN
+
+    print("--- Testing Mempool ---")
+    senders = [f"{i:02x}" * 20 for i in range(4)]
+    def make_tx(sender: int, amount: int, fee: int = 0) -> Transaction:
+        return Transaction(senders[sender], senders[(sender + 1) % 4], amount, f"{sender:02x}{amount:08x}{fee:08x}", fee)
+
+    pool = Mempool(max_transactions=3, max_per_sender=2)
+    assert pool.add(make_tx(0, 5 * COIN, 10))[0] and pool.add(make_tx(1, 1 * COIN, 30))[0]
+    assert not pool.add(make_tx(0, 5 * COIN, 10))[0], "Duplicates must be refused."
+    assert pool.pending_spend(senders[0]) == 5 * COIN + 10 and pool.pending_delta(senders[1]) == 5 * COIN - 1 * COIN - 30
+
+    assert pool.add(make_tx(0, 2 * COIN))[0]
+    assert not pool.add(make_tx(0, 3 * COIN, 99))[0], "Per-sender limit ignored."
+    ok, _msg, evicted = pool.add(make_tx(2, 1 * COIN, 20)) # Full: evicts the fee-less transaction
+    assert ok and [tx.amount for tx in evicted] == [2 * COIN] and len(pool) == 3
+    assert not pool.add(make_tx(3, 1 * COIN, 5))[0], "A lower fee than every pending one must not evict."
+    system_tx = Transaction("welcome_faucet", senders[3], 500 * COIN)
+    ok, _msg, evicted = pool.add(system_tx)
+    assert ok and [tx.fee for tx in evicted] == [10], "System transactions outrank any fee."
+    assert [entry.fee for entry in pool.entries_by_priority()] == [0, 30, 20]
+    assert pool.pending_spend(senders[0]) == 0 and pool.sender_count(senders[0]) == 0
+
+    first, second = pool.entries_by_priority()[:2]
+    assert pool.select(3, first.size + second.size - 1) == [first], "Selection must skip what no longer fits."
+    assert pool.select(1, 10**6) == [first] and pool.select(3, 0) == []
+
+    removed = pool.remove([MempoolEntry(system_tx, 0).txid])
+    assert removed == [system_tx] and len(pool) == 2 and pool.removal_count == 3
+    pool.reset([])
+    assert len(pool) == 0 and pool.total_bytes == 0 and not pool._pending_deltas and not pool._pending_spends
+
+    # A sender's nonce is staged once, whatever the signature, and blocks take nonces in order
+    pool = Mempool()
+    def nonced_tx(nonce: int, fee: int = 0, signature: str = "aa") -> Transaction:
+        return Transaction(senders[0], senders[1], COIN, signature, fee, nonce)
+    assert pool.add(nonced_tx(5))[0] and pool.add(nonced_tx(7, fee=50))[0] and pool.add(make_tx(1, COIN, 10))[0]
+    ok, msg, _ = pool.add(nonced_tx(5, signature="bb")) # Re-signed copy: a new txid for the same payment
+    assert not ok and "nonce 5" in msg, msg
+    assert [entry.nonce for entry in pool.select(3, 10**6)] == [None, 5, 7], "Nonce 7 must wait for nonce 5."
+    assert [entry.nonce for entry in pool.select(2, 10**6)] == [None, 5]
+    assert pool.highest_nonce(senders[0]) == 7 and pool.highest_nonce(senders[1]) is None
+    assert pool.remove_used_nonces({senders[0]: 5}) == [nonced_tx(5)] and len(pool) == 2
+    assert pool.add(nonced_tx(5, signature="bb"))[0], "A removed nonce may be staged again (the chain decides if it is used)."
+    print(f"Final pool: {pool}")
+    print("\nAll Mempool self-tests passed!")
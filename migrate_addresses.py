@@ -0,0 +1,46 @@
+# migrate_addresses.py
+#
+# One-off migration of a stored chain whose transactions still carry full PEM public keys to
+# compact addresses (see utils/addresses.py). Every key is registered in the chain's key
+# registry and the affected blocks are re-mined. Stop the server first, then run from the
+# project root:
+#
+#     python migrate_addresses.py [--log-dir blockchain_log] [--json blockchain_data.json] [--workers N]
+
+import argparse
+
+from miner import create_miner
+from storage import BlockLogStorage
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert stored transactions from PEM public keys to addresses.")
+    parser.add_argument("--log-dir", default="blockchain_log", help="Block log directory (see storage.py).")
+    parser.add_argument("--json", default="blockchain_data.json",
+                        help="Legacy whole-file chain, imported first if the block log does not exist yet.")
+    parser.add_argument("--workers", type=int, default=None, help="Mining processes (default: all CPU cores).")
+    args = parser.parse_args()
+
+    storage = BlockLogStorage(args.log_dir)
+    blockchain = storage.load_or_import_json(args.json, miner=create_miner(args.workers))
+    if blockchain is None:
+        print("No stored chain found; nothing to migrate.")
+        return
+    if not blockchain.is_chain_valid(full=True):
+        print(f"Stored chain is invalid ({blockchain.last_validation_failure}); refusing to migrate it.")
+        return
+
+    converted = blockchain.migrate_to_addresses()
+    if not converted:
+        print("Chain already stores addresses; nothing to do.")
+        return
+    if not blockchain.is_chain_valid(full=True):
+        print(f"Migrated chain failed validation ({blockchain.last_validation_failure}); the stored chain was left unchanged.")
+        return
+    saved, save_msg = storage.save(blockchain)
+    if not saved:
+        print(f"Migrated chain could not be saved ({save_msg}).")
+        return
+    print(f"Done: {converted} transactions converted, {len(blockchain.key_registry)} keys registered.")
+
+if __name__ == '__main__':
+    main()
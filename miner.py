@@ -0,0 +1,295 @@
+# miner.py
+
+import multiprocessing
+import os
+import threading
+import time
+from block import Block
+
+# Sentinel for "no winning nonce found yet" in the shared best-nonce slot.
+_NO_NONCE = 2**62
+# Written to the shared best-nonce slot to stop every worker when a search is cancelled.
+_CANCELLED = -1
+PROGRESS_INTERVAL = 20_000 # Nonces tried between progress checkpoints of the sequential search
+PROGRESS_POLL_SECONDS = 0.25 # How often ParallelMiner looks at its workers' progress and the cancel flag
+
+# Set in each pool worker by _init_worker: the lowest winning nonce found so far, and the total
+# number of hashes tried by all workers (for progress reports). The parent resets both before each search.
+_shared_best_nonce = None
+_shared_hashes = None
+
+
+class MiningCancelled(Exception):
+    """Raised by a mining engine when its MiningControl was cancelled mid-search."""
+
+
+class MiningControl:
+    """
+    Handle on a running Proof-of-Work search, passed to an engine's mine(). Another thread can
+    cancel() it; the engine then stops at its next checkpoint and raises MiningCancelled. If
+    on_progress is given it is called with {'block_index', 'nonce', 'hashes', 'elapsed', 'hash_rate'}
+    at most every progress_interval seconds (from the mining thread).
+    """
+    def __init__(self, on_progress=None, progress_interval: float = 0.5):
+        self.on_progress = on_progress
+        self.progress_interval: float = progress_interval
+        self._cancel_event = threading.Event()
+        self._last_report = 0.0
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel_event.is_set()
+
+    def checkpoint(self, block_index: int, nonce: int, hashes: int, elapsed: float):
+        """Called by engines while searching: raises MiningCancelled if cancelled, otherwise reports progress when due."""
+        if self.cancelled:
+            raise MiningCancelled(f"Mining of block #{block_index} was cancelled.")
+        now = time.monotonic()
+        if self.on_progress is not None and now - self._last_report >= self.progress_interval:
+            self._last_report = now
+            self.on_progress({'block_index': block_index, 'nonce': nonce, 'hashes': hashes, 'elapsed': elapsed,
+                              'hash_rate': hashes / elapsed if elapsed > 0 else 0.0})
+
+
+class MiningResult:
+    """
+    Outcome of a Proof-of-Work search: the winning nonce and hash, the wall-clock
+    duration, and per-worker statistics (hashes tried and hashes/sec).
+    """
+    def __init__(self, nonce: int, block_hash: str, duration: float, worker_stats: list[dict]):
+        self.nonce: int = nonce
+        self.hash: str = block_hash
+        self.duration: float = duration
+        self.worker_stats: list[dict] = worker_stats
+
+    @property
+    def total_hashes(self) -> int:
+        return sum(stat['hashes'] for stat in self.worker_stats)
+
+    @property
+    def hash_rate(self) -> float:
+        """Aggregate hashes per second across all workers."""
+        return self.total_hashes / self.duration if self.duration > 0 else 0.0
+
+    def __repr__(self) -> str:
+        return (f"MiningResult(nonce={self.nonce}, hash='{self.hash[:10]}...', "
+                f"duration={self.duration:.4f}s, workers={len(self.worker_stats)}, "
+                f"hash_rate={self.hash_rate:.0f} H/s)")
+
+
+class SequentialMiner:
+    """
+    Single-core miner: tries nonces 0, 1, 2, ... until the block hash has the
+    required number of leading zeros. This is the reference behaviour every
+    other engine must reproduce. With a MiningControl, progress is reported (and cancellation
+    checked) every PROGRESS_INTERVAL nonces.
+    """
+    def mine(self, block: Block, difficulty: int, control: MiningControl | None = None) -> MiningResult:
+        target_prefix = '0' * difficulty
+        start_time = time.time()
+        hash_for_nonce = block.mining_hasher().hash_for_nonce
+        nonce = 0
+        computed_hash = hash_for_nonce(nonce)
+        while not computed_hash.startswith(target_prefix):
+            nonce += 1
+            if control is not None and nonce % PROGRESS_INTERVAL == 0:
+                control.checkpoint(block.index, nonce, nonce, time.time() - start_time)
+            computed_hash = hash_for_nonce(nonce)
+        block.nonce = nonce
+        duration = time.time() - start_time
+        hashes = nonce + 1
+        stats = [{'worker': 0, 'hashes': hashes, 'duration': duration,
+                  'hash_rate': hashes / duration if duration > 0 else 0.0}]
+        return MiningResult(block.nonce, computed_hash, duration, stats)
+
+    def __repr__(self) -> str:
+        return "SequentialMiner()"
+
+
+def _init_worker(shared_best_nonce, shared_hashes):
+    global _shared_best_nonce, _shared_hashes
+    _shared_best_nonce = shared_best_nonce
+    _shared_hashes = shared_hashes
+
+
+def _search_partition(worker_id: int, workers: int, chunk_size: int,
+                      block: Block, target_prefix: str) -> dict:
+    """
+    Worker entry point. Searches chunks worker_id, worker_id + workers, ... of the
+    nonce space, each chunk_size nonces wide, and publishes any winner to the shared
+    best-nonce slot. Stops once its next chunk starts above the best nonce found by
+    anyone, so every nonce below the final winner is guaranteed to have been tried (a cancelled
+    search sets the slot to _CANCELLED, which stops everyone).
+    """
+    hash_for_nonce = block.mining_hasher().hash_for_nonce
+    start_time = time.time()
+    hashes = 0
+    found_nonce = None
+    chunk = worker_id
+
+    while True:
+        chunk_start = chunk * chunk_size
+        if chunk_start > _shared_best_nonce.value:
+            break
+        chunk_hashes = 0
+        for nonce in range(chunk_start, chunk_start + chunk_size):
+            chunk_hashes += 1
+            if hash_for_nonce(nonce).startswith(target_prefix):
+                found_nonce = nonce
+                break
+        hashes += chunk_hashes
+        with _shared_hashes.get_lock():
+            _shared_hashes.value += chunk_hashes
+        if found_nonce is not None:
+            with _shared_best_nonce.get_lock():
+                if found_nonce < _shared_best_nonce.value:
+                    _shared_best_nonce.value = found_nonce
+            break
+        chunk += workers
+
+    duration = time.time() - start_time
+    return {'worker': worker_id, 'hashes': hashes, 'duration': duration,
+            'hash_rate': hashes / duration if duration > 0 else 0.0,
+            'found_nonce': found_nonce}
+
+
+class ParallelMiner:
+    """
+    Multiprocess miner. The nonce space is split into fixed-size chunks dealt out
+    round-robin to a process pool; all workers stop as soon as the lowest winning
+    nonce is known. Because the lowest winner is always chosen, the mined block is
+    identical to the one SequentialMiner would produce for the same input.
+
+    The pool is started on the first parallel search and kept for every later block (see _worker_pool);
+    searches take turns on it. Below `min_difficulty` handing the search to the workers costs more
+    than the search itself, so those blocks are mined sequentially. With a MiningControl the parent
+    process polls the workers' shared hash count every PROGRESS_POLL_SECONDS to report progress, and
+    cancels the search by writing _CANCELLED to the shared best-nonce slot.
+    """
+    def __init__(self, workers: int | None = None, chunk_size: int = 5000, min_difficulty: int = 4):
+        self.workers: int = max(1, int(workers or os.cpu_count() or 1))
+        self.chunk_size: int = max(1, int(chunk_size))
+        self.min_difficulty: int = int(min_difficulty)
+        self._fallback = SequentialMiner()
+        self._pool = None
+        self._shared_best_nonce = None
+        self._shared_hashes = None
+        self._lock = threading.Lock() # One search at a time: the pool's shared slots belong to the running one
+
+    def _worker_pool(self):
+        """
+        Returns the miner's process pool, starting it on first use (lock held). Its processes are
+        spawned, not forked: the web server mines from a worker thread while other threads hold locks,
+        and a forked child inherits whatever locks were held at that moment. The shared slots are
+        handed to the workers when they start, since spawned processes cannot receive them later.
+        """
+        if self._pool is None:
+            context = multiprocessing.get_context("spawn")
+            self._shared_best_nonce = context.Value('q', _NO_NONCE)
+            self._shared_hashes = context.Value('q', 0)
+            self._pool = context.Pool(self.workers, initializer=_init_worker,
+                                      initargs=(self._shared_best_nonce, self._shared_hashes))
+        return self._pool
+
+    def close(self):
+        """Stops the worker processes (a later search starts new ones)."""
+        with self._lock:
+            if self._pool is not None:
+                self._pool.terminate()
+                self._pool.join()
+                self._pool = None
+
+    def mine(self, block: Block, difficulty: int, control: MiningControl | None = None) -> MiningResult:
+        if self.workers == 1 or difficulty < self.min_difficulty:
+            return self._fallback.mine(block, difficulty, control)
+
+        target_prefix = '0' * difficulty
+        with self._lock:
+            pool = self._worker_pool()
+            shared_best_nonce, shared_hashes = self._shared_best_nonce, self._shared_hashes
+            shared_best_nonce.value, shared_hashes.value = _NO_NONCE, 0 # No worker runs between searches
+
+            start_time = time.time()
+            pending = pool.starmap_async(
+                _search_partition,
+                [(w, self.workers, self.chunk_size, block, target_prefix) for w in range(self.workers)]
+            )
+            while not pending.ready():
+                pending.wait(PROGRESS_POLL_SECONDS)
+                if control is None or pending.ready():
+                    continue
+                try:
+                    hashes = shared_hashes.value # Nonces below about this many have been tried
+                    control.checkpoint(block.index, hashes, hashes, time.time() - start_time)
+                except MiningCancelled:
+                    with shared_best_nonce.get_lock():
+                        shared_best_nonce.value = _CANCELLED
+                    pending.wait() # Every worker has stopped before the next search resets the slots
+                    raise
+            worker_stats = pending.get()
+            duration = time.time() - start_time
+            block.nonce = shared_best_nonce.value
+        computed_hash = block.calculate_hash()
+        return MiningResult(block.nonce, computed_hash, duration, worker_stats)
+
+    def __repr__(self) -> str:
+        return (f"ParallelMiner(workers={self.workers}, chunk_size={self.chunk_size}, "
+                f"min_difficulty={self.min_difficulty})")
+
+
+def create_miner(workers: int | None = None, **kwargs) -> 'SequentialMiner | ParallelMiner':
+    """Returns a SequentialMiner for a single worker, otherwise a ParallelMiner."""
+    if workers is not None and int(workers) <= 1:
+        return SequentialMiner()
+    return ParallelMiner(workers=workers, **kwargs)
+
+
+if __name__ == '__main__':
+    print("--- Testing Mining Engines ---")
+    sample_tx_dicts = [
+        {'sender_public_key': 'AlicePEM', 'recipient_public_key': 'BobPEM', 'amount': 50.0, 'signature': 'sig123'},
+    ]
+    test_difficulty = 4
+    timestamp = time.time()
+
+    sequential_block = Block(1, sample_tx_dicts, timestamp, "0" * 64)
+    sequential_result = SequentialMiner().mine(sequential_block, test_difficulty)
+    print(f"Sequential: {sequential_result}")
+
+    parallel_block = Block(1, sample_tx_dicts, timestamp, "0" * 64)
+    parallel_miner = ParallelMiner(workers=2, chunk_size=1000, min_difficulty=1)
+    parallel_result = parallel_miner.mine(parallel_block, test_difficulty)
+    print(f"Parallel:   {parallel_result}")
+    for stat in parallel_result.worker_stats:
+        print(f"  worker {stat['worker']}: {stat['hashes']} hashes, {stat['hash_rate']:.0f} H/s")
+
+    assert parallel_result.nonce == sequential_result.nonce, "Parallel miner picked a different nonce."
+    assert parallel_block.calculate_hash() == sequential_block.calculate_hash(), "Parallel miner produced a different block."
+    assert parallel_result.hash.startswith('0' * test_difficulty)
+
+    # The pool is kept for the next block, and the shared slots start over for it
+    pool = parallel_miner._pool
+    next_sequential, next_parallel = Block(2, sample_tx_dicts, timestamp, "1" * 64), Block(2, sample_tx_dicts, timestamp, "1" * 64)
+    assert parallel_miner.mine(next_parallel, test_difficulty).nonce == SequentialMiner().mine(next_sequential, test_difficulty).nonce
+    assert pool is not None and parallel_miner._pool is pool, "A new pool was started for the next block."
+
+    # Cancellation: a search that cannot finish quickly stops once its control is cancelled
+    for engine in (SequentialMiner(), parallel_miner):
+        reports = []
+        control = MiningControl(on_progress=reports.append, progress_interval=0)
+        threading.Timer(0.5, control.cancel).start()
+        try:
+            engine.mine(Block(2, sample_tx_dicts, timestamp, "0" * 64), 64, control)
+            raise AssertionError("A cancelled search must not return a result.")
+        except MiningCancelled as e:
+            print(f"{engine}: {e} after {reports[-1]['hashes'] if reports else 0} hashes")
+        assert reports and reports[-1]['hashes'] > 0, "No progress was reported."
+    after_cancel = Block(3, sample_tx_dicts, timestamp, "0" * 64)
+    assert parallel_miner.mine(after_cancel, test_difficulty).hash == SequentialMiner().mine(Block(3, sample_tx_dicts, timestamp, "0" * 64), test_difficulty).hash, \
+        "A search after a cancelled one must start from fresh shared slots."
+    parallel_miner.close()
+
+    print("\nAll miner self-tests passed!")
@@ -0,0 +1,246 @@
+# mining_jobs.py
+#
+# Background mining. A mining request becomes a MiningJob with an id that callers get back at
+# once; jobs run one at a time, in submission order, on a single worker thread (mining the same
+# chain twice at once would only produce competing blocks). Each job carries a MiningControl (see
+# miner.py), so a running Proof-of-Work search reports its progress and can be cancelled.
+# Transactions staged while a job mines stay in the mempool for the next block. A job may instead
+# carry a fixed set of system transactions (e.g. a faucet grant) to mine as one block of their own.
+#
+#   queued -> running -> completed | failed | cancelled      (queued -> cancelled also possible)
+
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from miner import MiningControl
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+FINISHED_STATES = (JOB_COMPLETED, JOB_FAILED, JOB_CANCELLED)
+DEFAULT_MAX_QUEUED_JOBS = 10 # Queued or running jobs; further submissions are refused
+DEFAULT_MAX_FINISHED_JOBS = 100 # Finished jobs kept for status queries, oldest dropped first
+
+class MiningJob:
+    """
+    One mining request: mine up to max_blocks blocks (None = until the pool is empty) with the
+    reward going to miner_public_key, or, if `transactions` is given, one block of exactly those
+    transactions (see Blockchain.mine_transactions). Its status, latest progress report, per-block
+    reports (see Blockchain.mine_backlog) and final message are filled in as it runs.
+    """
+    def __init__(self, miner_public_key: str, max_blocks: int | None = 1, progress_interval: float = 0.5,
+                 transactions: list | None = None):
+        self.id: str = uuid.uuid4().hex
+        self.miner_public_key: str = miner_public_key
+        self.max_blocks: int | None = 1 if transactions is not None else max_blocks
+        self.transactions: list | None = transactions
+        self.status: str = JOB_QUEUED
+        self.created_at: float = time.time()
+        self.started_at: float | None = None
+        self.finished_at: float | None = None
+        self.progress: dict | None = None # Latest MiningControl progress report
+        self.blocks: list[dict] = []
+        self.message: str = ""
+        self.control = MiningControl(progress_interval=progress_interval)
+        self._done = threading.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATES
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """Blocks until the job has finished (or timeout seconds passed); returns whether it finished."""
+        return self._done.wait(timeout)
+
+    def to_dict(self) -> dict:
+        return {'job_id': self.id, 'status': self.status, 'miner_public_key': self.miner_public_key,
+                'max_blocks': self.max_blocks,
+                'transactions': None if self.transactions is None else [tx.txid for tx in self.transactions],
+                'created_at': self.created_at, 'started_at': self.started_at,
+                'finished_at': self.finished_at, 'progress': self.progress, 'blocks': list(self.blocks),
+                'message': self.message}
+
+    def __repr__(self) -> str:
+        return f"MiningJob(id={self.id[:8]}, status={self.status}, blocks={len(self.blocks)}, max_blocks={self.max_blocks})"
+
+
+class MiningJobManager:
+    """
+    Runs MiningJobs on a single background thread. `run` does the actual mining: it is called as
+    run(job) on the worker thread and returns (block reports, message), like Blockchain.mine_backlog
+    (pass job.control to it; a job with job.transactions mines those instead of the pool). The
+    optional listeners are called from the worker thread: on_progress(job, report) for each progress
+    report, on_block(job, block report) as each block is mined (run should forward its blocks with
+    block_mined), and on_update(job) on every status change.
+    """
+    def __init__(self, run, on_progress=None, on_update=None, on_block=None,
+                 max_queued: int = DEFAULT_MAX_QUEUED_JOBS, max_finished: int = DEFAULT_MAX_FINISHED_JOBS):
+        self.run = run
+        self.on_progress = on_progress
+        self.on_update = on_update
+        self.on_block = on_block
+        self.max_queued: int = max_queued
+        self.max_finished: int = max_finished
+        self._jobs: OrderedDict[str, MiningJob] = OrderedDict() # In submission order
+        self._futures: dict = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mining-job")
+
+    def submit(self, miner_public_key: str, max_blocks: int | None = 1,
+               transactions: list | None = None) -> tuple[MiningJob | None, str]:
+        """Queues a job. Returns (job, message), or (None, reason) if too many jobs are already waiting."""
+        with self._lock:
+            active = sum(1 for job in self._jobs.values() if not job.finished)
+            if active >= self.max_queued:
+                return None, f"{active} mining jobs are already queued or running; try again later."
+            job = MiningJob(miner_public_key, max_blocks, transactions=transactions)
+            if self.on_progress is not None:
+                job.control.on_progress = lambda report: self._progress(job, report)
+            self._jobs[job.id] = job
+            self._futures[job.id] = self._executor.submit(self._execute, job)
+            position = active
+        return job, f"Mining job queued ({position} ahead of it)." if position else "Mining job started."
+
+    def get(self, job_id: str) -> MiningJob | None:
+        return self._jobs.get(job_id)
+
+    def jobs(self) -> list[MiningJob]:
+        """Every known job, most recent first."""
+        with self._lock:
+            return list(reversed(self._jobs.values()))
+
+    def cancel(self, job_id: str) -> tuple[bool, str]:
+        """Cancels a queued job outright, or asks a running one to stop at its next checkpoint."""
+        job = self._jobs.get(job_id)
+        if job is None:
+            return False, "Unknown mining job."
+        if job.finished:
+            return False, f"Mining job already {job.status}."
+        job.control.cancel()
+        future = self._futures.get(job_id)
+        if future is not None and future.cancel(): # Had not started
+            self._finish(job, JOB_CANCELLED, "Mining job cancelled before it started.")
+            return True, job.message
+        return True, "Cancellation requested; the job stops at its next checkpoint."
+
+    def cancel_all(self) -> int:
+        """Cancels every queued or running job (e.g. before the chain is replaced). Returns how many."""
+        return sum(self.cancel(job.id)[0] for job in self.jobs() if not job.finished)
+
+    def block_mined(self, job: MiningJob, report: dict):
+        """Records a block mined by `job` (pass as Blockchain.mine_backlog's on_block) and tells on_block."""
+        job.blocks.append(report)
+        if self.on_block is not None:
+            self.on_block(job, report)
+
+    def _progress(self, job: MiningJob, report: dict):
+        job.progress = report
+        self.on_progress(job, report)
+
+    def _execute(self, job: MiningJob):
+        if job.control.cancelled:
+            self._finish(job, JOB_CANCELLED, "Mining job cancelled before it started.")
+            return
+        job.status, job.started_at = JOB_RUNNING, time.time()
+        self._notify(job)
+        try:
+            reports, message = self.run(job)
+        except Exception as e:
+            traceback.print_exc()
+            self._finish(job, JOB_FAILED, f"Mining failed: {e}")
+            return
+        if job.control.cancelled:
+            status = JOB_CANCELLED
+        else:
+            status = JOB_COMPLETED if reports else JOB_FAILED # Nothing mined, e.g. an empty pool
+        self._finish(job, status, message)
+
+    def _finish(self, job: MiningJob, status: str, message: str):
+        job.status, job.message, job.finished_at = status, message, time.time()
+        with self._lock:
+            self._futures.pop(job.id, None)
+            finished = [job_id for job_id, other in self._jobs.items() if other.finished]
+            for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+                del self._jobs[job_id]
+        self._notify(job)
+        job._done.set() # After listeners have seen the final state
+
+    def _notify(self, job: MiningJob):
+        if self.on_update is not None:
+            try:
+                self.on_update(job)
+            except Exception:
+                traceback.print_exc()
+
+    def shutdown(self, wait: bool = True, cancel_jobs: bool = True):
+        if cancel_jobs:
+            self.cancel_all()
+        self._executor.shutdown(wait=wait)
+
+    def __repr__(self) -> str:
+        active = sum(1 for job in self._jobs.values() if not job.finished)
+        return f"MiningJobManager(jobs={len(self._jobs)}, active={active}, max_queued={self.max_queued})"
+
+
+if __name__ == '__main__':
+    from blockchain import Blockchain
+    from transaction import Transaction
+    from utils.amounts import COIN
+    from utils.crypto_utils import generate_key_pair
+
+    print("--- Testing MiningJobManager ---")
+    _miner_priv, miner_pub = generate_key_pair()
+    bc = Blockchain(difficulty=2)
+    bc.create_genesis_block()
+    updates, mined = [], []
+    manager = MiningJobManager(
+        run=lambda job: bc.mine_backlog(job.miner_public_key, job.max_blocks, job.control,
+                                        on_block=lambda report: manager.block_mined(job, report)),
+        on_update=lambda job: updates.append((job.id, job.status)),
+        on_block=lambda job, report: mined.append(report['index']))
+
+    empty_job, _ = manager.submit(miner_pub)
+    assert empty_job.wait(10) and empty_job.status == JOB_FAILED, "Mining an empty pool must fail."
+    assert updates == [(empty_job.id, JOB_RUNNING), (empty_job.id, JOB_FAILED)]
+    for i in range(3):
+        bc.add_transaction(Transaction("welcome_faucet", miner_pub, (i + 1) * COIN))
+    bc.max_block_transactions = 2 # Reward + 1 transaction
+    drain_job, _ = manager.submit(miner_pub, max_blocks=None)
+    manager.shutdown(wait=True, cancel_jobs=False)
+    assert drain_job.status == JOB_COMPLETED and mined == [1, 2, 3] and len(bc.pending_transactions) == 0, drain_job
+    print(f"{drain_job}: {drain_job.message}")
+
+    # A job with fixed transactions mines a block of exactly those and leaves the pool alone
+    def run_fixed(job):
+        block, duration, message = bc.mine_transactions(job.transactions, job.miner_public_key, job.control)
+        return ([bc.block_report(block, duration)] if block else []), message
+    manager = MiningJobManager(run=run_fixed)
+    bc.add_transaction(Transaction("welcome_faucet", miner_pub, COIN)) # Stays pending
+    grant = Transaction("welcome_faucet", miner_pub, 2 * COIN, nonce=1)
+    grant_job, _ = manager.submit(miner_pub, max_blocks=None, transactions=[grant])
+    assert grant_job.wait(10) and grant_job.status == JOB_COMPLETED, grant_job
+    assert grant_job.to_dict()['transactions'] == [grant.txid] and grant_job.max_blocks == 1
+    assert Transaction.from_dict(bc.chain[-1].transactions[1]).txid == grant.txid and len(bc.pending_transactions) == 1
+    manager.shutdown(wait=True, cancel_jobs=False)
+
+    # A long search is cancelled mid-way and leaves the chain and pool untouched
+    bc.difficulty = 64
+    manager = MiningJobManager(run=lambda job: bc.mine_backlog(job.miner_public_key, job.max_blocks, job.control))
+    bc.add_transaction(Transaction("welcome_faucet", miner_pub, COIN))
+    running_job, _ = manager.submit(miner_pub)
+    queued_job, _ = manager.submit(miner_pub)
+    assert manager.cancel(queued_job.id)[0] and queued_job.status == JOB_CANCELLED
+    while running_job.status == JOB_QUEUED:
+        time.sleep(0.01)
+    manager.cancel(running_job.id)
+    assert running_job.wait(10), "A cancelled job must stop."
+    assert running_job.status == JOB_CANCELLED and len(bc.chain) == 5 and len(bc.pending_transactions) == 2, running_job
+    assert not manager.cancel(running_job.id)[0], "A finished job cannot be cancelled again."
+    print(f"{running_job}: {running_job.message}")
+    print("\nAll MiningJobManager self-tests passed!")
@@ -0,0 +1,275 @@
+# persistence.py
+#
+# When changes to the chain reach the disk. State-changing requests call request_save() after their
+# change is made in memory; the scheduler coalesces those requests into few writes ("group commit").
+# A background writer flushes once the oldest unsaved change is max_delay seconds old or max_pending
+# changes have piled up, whichever comes first. How long a caller waits is the durability mode:
+#
+#   sync    - request_save writes before it returns (or finds its change in a write that started
+#             after it): nothing acknowledged is lost, and no caller waits on a timer
+#   batched - request_save waits for the group write that covers its change: nothing acknowledged is
+#             lost, callers wait up to max_delay, and concurrent changes share one write
+#   async   - request_save returns at once: lowest latency, but a crash loses up to max_delay of changes
+#
+# close() (also registered to run at interpreter exit by the app) writes whatever is still unsaved.
+#
+# A failed write leaves its changes unsaved: sync and batched callers whose change it covered get a
+# PersistenceError, and the background writer retries after RETRY_DELAY (or on the next flush()).
+
+import threading
+import time
+import traceback
+
+DURABILITY_MODES = ("sync", "batched", "async")
+DEFAULT_MAX_DELAY = 0.01 # Seconds the oldest unsaved change may wait for its write
+DEFAULT_MAX_PENDING = 100 # Unsaved changes that trigger a write without waiting for max_delay
+RETRY_DELAY = 1.0 # Seconds the background writer waits before retrying a failed write
+
+class PersistenceError(Exception):
+    """A change was made in memory, but the write meant to save it failed (it stays unsaved and is retried)."""
+
+class PersistenceScheduler:
+    """
+    Calls `save` (which writes the whole current state, e.g. BlockLogStorage.save on the chain, and
+    raises if it could not) on behalf of request_save callers, according to `mode` (see
+    DURABILITY_MODES). `mode` may be changed while running. Writes never overlap: the background
+    writer and sync callers take turns.
+    """
+    def __init__(self, save, mode: str = "batched", max_delay: float = DEFAULT_MAX_DELAY,
+                 max_pending: int = DEFAULT_MAX_PENDING):
+        if mode not in DURABILITY_MODES:
+            raise ValueError(f"mode must be one of {DURABILITY_MODES}, got '{mode}'.")
+        self.save = save
+        self.mode: str = mode
+        self.max_delay: float = float(max_delay)
+        self.max_pending: int = max(1, int(max_pending))
+        self.saves: int = 0 # Writes performed
+        self.last_save_at: float | None = None
+        self.failures: int = 0 # Writes that raised
+        self.last_error: str | None = None
+        # Changes are numbered as they are requested; _written is the highest number known to be on disk,
+        # _failed the highest number covered by a write that raised.
+        self._requested: int = 0
+        self._written: int = 0
+        self._failed: int = 0
+        self._retry_at: float = 0.0 # Monotonic time before which the background writer does not retry
+        self._first_unsaved_at: float | None = None # When the oldest change not yet written was requested
+        self._flush_now: bool = False
+        self._closed: bool = False
+        self._condition = threading.Condition()
+        self._write_lock = threading.Lock()
+        # Daemon, so it never holds up interpreter exit; close() does the final write.
+        self._writer = threading.Thread(target=self._run, name="persistence-writer", daemon=True)
+        self._writer.start()
+
+    @property
+    def unsaved(self) -> int:
+        """Changes requested but not yet written."""
+        return self._requested - self._written
+
+    def request_save(self):
+        """
+        Records a change to the state and, depending on the mode, waits until it has been written.
+        Raises PersistenceError if the write covering it (sync, batched) failed.
+        """
+        with self._condition:
+            self._requested += 1
+            change = self._requested
+            if self._closed or self.mode == "sync":
+                pass # Written below, by this thread
+            else:
+                if self._first_unsaved_at is None:
+                    self._first_unsaved_at = time.monotonic()
+                self._condition.notify_all()
+                if self.mode == "async":
+                    return
+                if self._wait_for(change):
+                    return
+        self._write(change)
+
+    def flush(self):
+        """
+        Writes every change requested so far, if not already written, and waits for it. Raises
+        PersistenceError if that write failed.
+        """
+        with self._condition:
+            change = self._requested
+            if self._written >= change:
+                return
+            if not self._closed:
+                self._flush_now = True
+                self._condition.notify_all()
+                if self._wait_for(change):
+                    return
+        self._write(change)
+
+    def _wait_for(self, change: int) -> bool:
+        """
+        Waits (condition held) until the background writer has written `change` (True), or the
+        scheduler closed (False: the caller writes it itself). Raises PersistenceError if a write
+        covering it fails meanwhile.
+        """
+        failures_before = self.failures
+        def failed() -> bool:
+            return self.failures > failures_before and self._failed >= change
+        while self._written < change and not failed() and not self._closed:
+            self._condition.wait()
+        if self._written >= change:
+            return True
+        if failed():
+            raise self._failure()
+        return False
+
+    def close(self):
+        """Writes anything unsaved and stops the background writer (call on shutdown)."""
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify_all()
+        self._writer.join()
+        if self.unsaved:
+            try:
+                self._write(self._requested)
+            except PersistenceError:
+                pass # Already reported by _write
+
+    def _write(self, change: int):
+        """
+        Writes the current state, which includes every change up to number `change` (and any since).
+        Raises PersistenceError if `save` raised; the changes then stay unsaved.
+        """
+        with self._write_lock:
+            with self._condition:
+                if self._written >= change: # Covered by a write that finished while we waited for the lock
+                    return
+                change = self._requested # Everything requested so far is in memory, so this write covers it
+            try:
+                self.save()
+            except Exception as e:
+                traceback.print_exc()
+                with self._condition:
+                    self.failures += 1
+                    self.last_error = str(e) or type(e).__name__
+                    self._failed = max(self._failed, change)
+                    self._retry_at = time.monotonic() + RETRY_DELAY
+                    self._condition.notify_all()
+                raise self._failure() from e
+            with self._condition:
+                self.saves += 1
+                self.last_save_at = time.time()
+                self._written = max(self._written, change)
+                if self._written >= self._requested:
+                    self._first_unsaved_at = None # Changes the group timer was started for are written
+                self._condition.notify_all()
+
+    def _failure(self) -> PersistenceError:
+        return PersistenceError(f"The change was made but could not be saved ({self.last_error}); the write is retried.")
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._closed and self._written >= self._requested:
+                    self._condition.wait()
+                # Let the group fill up until the oldest change has waited max_delay (or enough piled up).
+                while not self._closed and not self._flush_now and self._first_unsaved_at is not None \
+                        and self._requested - self._written < self.max_pending:
+                    remaining = self._first_unsaved_at + self.max_delay - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                # After a failed write, wait before retrying (unless flush() asks for it now).
+                while not self._closed and not self._flush_now and time.monotonic() < self._retry_at:
+                    self._condition.wait(self._retry_at - time.monotonic())
+                if self._closed:
+                    return # close() writes what is left
+                change, self._first_unsaved_at, self._flush_now = self._requested, None, False
+            try:
+                self._write(change)
+            except PersistenceError:
+                pass # Reported to the callers waiting for it; the changes stay unsaved and are retried
+
+    def stats(self) -> dict:
+        with self._condition:
+            return {'mode': self.mode, 'max_delay_ms': self.max_delay * 1000, 'max_pending': self.max_pending,
+                    'unsaved': self._requested - self._written, 'saves': self.saves, 'changes': self._requested,
+                    'last_save_at': self.last_save_at, 'failures': self.failures, 'last_error': self.last_error}
+
+    def __repr__(self) -> str:
+        return f"PersistenceScheduler(mode={self.mode}, saves={self.saves}, unsaved={self.unsaved})"
+
+
+if __name__ == '__main__':
+    print("--- Testing PersistenceScheduler ---")
+    written = []
+    def slow_save():
+        time.sleep(0.01)
+        written.append(time.monotonic())
+
+    # sync: every change is written before request_save returns
+    scheduler = PersistenceScheduler(slow_save, mode="sync")
+    for _ in range(3):
+        scheduler.request_save()
+    assert len(written) == 3 and scheduler.unsaved == 0, scheduler
+
+    # batched: concurrent changes share writes, and each caller returns only once its change is written
+    written.clear()
+    scheduler.mode, scheduler.max_delay = "batched", 0.05
+    returned_unsaved = []
+    def change():
+        scheduler.request_save()
+        returned_unsaved.append(not written) # Nothing written yet, so this caller's change is not on disk
+    threads = [threading.Thread(target=change) for _ in range(50)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert scheduler.unsaved == 0 and 1 <= len(written) < 10, f"50 changes took {len(written)} writes."
+    assert not any(returned_unsaved), "A batched caller returned before its change was written."
+    print(f"batched: 50 concurrent changes in {len(written)} write(s)")
+
+    # max_pending triggers a write before max_delay has passed
+    written.clear()
+    scheduler.mode, scheduler.max_delay, scheduler.max_pending = "async", 10.0, 5
+    for _ in range(5):
+        scheduler.request_save()
+    deadline = time.monotonic() + 2
+    while not written and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert written, "Reaching max_pending did not trigger a write."
+
+    # async: returns at once; flush() and close() write what is left
+    written.clear()
+    scheduler.request_save()
+    assert scheduler.unsaved == 1 and not written, "An async change was written before max_delay."
+    scheduler.flush()
+    assert scheduler.unsaved == 0 and len(written) == 1, scheduler
+    scheduler.request_save()
+    scheduler.close()
+    assert scheduler.unsaved == 0 and len(written) == 2, "close() did not write the last change."
+    scheduler.request_save() # After close every change is written directly
+    assert len(written) == 3 and scheduler.unsaved == 0
+    print(f"{scheduler}: {scheduler.stats()}")
+
+    # A failed write leaves its changes unsaved and is reported to the callers waiting for it
+    disk_full = [True]
+    def failing_save():
+        if disk_full[0]:
+            raise IOError("Simulated full disk")
+        written.append(time.monotonic())
+    for mode in ("sync", "batched"):
+        written.clear()
+        scheduler = PersistenceScheduler(failing_save, mode=mode)
+        disk_full[0] = True
+        try:
+            scheduler.request_save()
+            raise AssertionError(f"{mode}: a failed write was not reported.")
+        except PersistenceError:
+            pass
+        assert scheduler.unsaved == 1 and scheduler.failures == 1 and not written, scheduler.stats()
+        disk_full[0] = False
+        scheduler.flush() # Retried at once, without waiting for RETRY_DELAY
+        assert scheduler.unsaved == 0 and len(written) == 1, scheduler.stats()
+        scheduler.close()
+    print(f"failed writes: reported and retried ({scheduler.stats()['last_error']})")
+    print("\nAll PersistenceScheduler self-tests passed!")
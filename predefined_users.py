@@ -3,6 +3,8 @@
 # For a persistent simulation across different runs with the same users,
 # ensure this file remains consistent or regenerate as needed.
 
+from utils.addresses import address_of
+
 PREDEFINED_USERS_DATA = [
     {
         "name": "Alice Alpha",
@@ -68,8 +70,9 @@ x3oeBi5TfLdGPdy6Lv8GvDCqZdnfAe9oiA==
 # You can add 5 more users similarly by running the generation script below.
 
 def get_public_user_info():
-    """Returns a list of dictionaries, each with 'name' and 'public_key_pem'."""
-    return [{"name": user["name"], "public_key_pem": user["public_key_pem"]} for user in PREDEFINED_USERS_DATA]
+    """Returns a list of dictionaries, each with 'name', 'public_key_pem' and the key's compact 'address'."""
+    return [{"name": user["name"], "public_key_pem": user["public_key_pem"], "address": address_of(user["public_key_pem"])}
+            for user in PREDEFINED_USERS_DATA]
 
 if __name__ == '__main__':
     from utils.crypto_utils import generate_key_pair # Ensure this path is correct if running standalone
@@ -1,5 +1,5 @@
 // static/js/apiClient.js
-import { showNotification } from "./utils.js";
+import { parseAmountToUnits, showNotification } from "./utils.js";
 
 const API_BASE_URL = ""; // Assuming API is on the same origin
 
@@ -59,7 +59,7 @@ export async function createBlockchainAPI(difficulty, miningReward) {
     headers: { "Content-Type": "application/json" },
     body: JSON.stringify({
       difficulty: parseInt(difficulty),
-      mining_reward: parseFloat(miningReward),
+      mining_reward: parseAmountToUnits(miningReward), // Base units
     }),
   });
   if (!result.success)
@@ -108,11 +108,12 @@ export async function addTransactionAPI(payload) {
   return result;
 }
 
-export async function mineBlockAPI(minerAddressPublicKey) {
+// Queues a background mining job; the result's `job` carries the job id to follow.
+export async function mineBlockAPI(minerAddressPublicKey, drain = false) {
   const result = await fetchAPI("/api/blockchain/mine", {
     method: "POST",
     headers: { "Content-Type": "application/json" },
-    body: JSON.stringify({ miner_address_public_key: minerAddressPublicKey }),
+    body: JSON.stringify({ miner_address_public_key: minerAddressPublicKey, drain }),
   });
   // Success message is usually handled by the calling function based on result.message
   if (!result.success)
@@ -123,6 +124,23 @@ export async function mineBlockAPI(minerAddressPublicKey) {
   return result;
 }
 
+export async function getMiningJobAPI(jobId) {
+  return await fetchAPI(`/api/mining/jobs/${encodeURIComponent(jobId)}`);
+}
+
+export async function cancelMiningJobAPI(jobId) {
+  const result = await fetchAPI(
+    `/api/mining/jobs/${encodeURIComponent(jobId)}/cancel`,
+    { method: "POST" }
+  );
+  if (!result.success)
+    showNotification(
+      "Error cancelling mining job: " + (result.error || "Unknown"),
+      true
+    );
+  return result;
+}
+
 export async function validateChainAPI() {
   const result = await fetchAPI("/api/blockchain/validate");
   // Notification handled by caller based on result.valid
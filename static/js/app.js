@@ -1,10 +1,12 @@
 // static/js/app.js
-import { showNotification } from "./utils.js";
+import { formatUnits, nextNonce, parseAmountToUnits, showNotification } from "./utils.js";
 import {
   createBlockchainAPI,
   addTransactionAPI,
   signDataInsecureAPI,
   mineBlockAPI,
+  getMiningJobAPI,
+  cancelMiningJobAPI,
   validateChainAPI,
   saveBlockchainAPI,
 } from "./apiClient.js";
@@ -15,7 +17,7 @@ import {
   getPublicKey,
   getPrivateKey,
 } from "./keyManager.js";
-import { initializeSocket } from "./socketHandler.js";
+import { initializeSocket, watchMiningJob } from "./socketHandler.js";
 
 // --- DOM Element Cache ---
 const domCache = {
@@ -46,18 +48,21 @@ const elements = {
   miningRewardInput: domCache.get("mining-reward"),
   recipientPublicKeyInput: domCache.get("recipient-public-key"),
   amountInput: domCache.get("amount"),
+  feeInput: domCache.get("fee"),
   senderPublicKeyTextarea: domCache.get("sender-public-key"),
   minerAddressPublicKeyTextarea: domCache.get("miner-address-public-key"),
+  drainBacklogCheckbox: domCache.get("drain-backlog"),
 
   // Mining Modal UI
   miningAttemptsEl: domCache.get("mining-attempts"),
   miningTimeEl: domCache.get("mining-time"),
   miningProgressEl: domCache.get("mining-progress"),
   miningHashValueEl: domCache.query("#mining-hash-display .hash-value"),
+  miningRateEl: domCache.get("mining-rate"),
+  miningStatusEl: domCache.get("mining-status"),
+  cancelMiningBtn: domCache.get("cancel-mining-btn"),
 };
 
-let miningAnimationInterval = null;
-
 // --- Form and Button Event Listeners ---
 
 if (elements.createBlockchainBtn) {
@@ -138,23 +143,32 @@ if (elements.transactionForm) {
     if (!elements.recipientPublicKeyInput || !elements.amountInput) return;
 
     const recipientPublicKey = elements.recipientPublicKeyInput.value;
-    const amount = parseFloat(elements.amountInput.value);
+    const amount = parseAmountToUnits(elements.amountInput.value); // Base units
+    const feeText = elements.feeInput ? elements.feeInput.value.trim() : "";
+    const fee = feeText ? parseAmountToUnits(feeText) : 0; // Base units, paid to the miner
 
     if (!recipientPublicKey.trim() || !(amount > 0)) {
       showNotification(
-        "Valid Recipient Public Key (non-empty) and a positive Amount are required.",
+        "Valid Recipient Public Key (non-empty) and a positive Amount (at most 8 decimals) are required.",
         true
       );
       return;
     }
+    if (fee === null) {
+      showNotification("Fee must be a non-negative amount with at most 8 decimals.", true);
+      return;
+    }
 
     addTxButton.disabled = true;
     addTxButton.innerHTML =
       '<span class="spinner-border spinner-border-sm" role="status" aria-hidden="true"></span> Adding...';
 
-    const dataToSign = `${senderPublicKey}${recipientPublicKey}${amount.toFixed(
-      8
-    )}`;
+    // A fee is only part of the signed text when non-zero; the nonce follows as "#<nonce>" and keeps the
+    // payment unique (see get_data_to_sign in utils/crypto_utils.py and new_nonce in transaction.py)
+    const nonce = nextNonce();
+    const dataToSign = `${senderPublicKey}${recipientPublicKey}${formatUnits(
+      amount
+    )}${fee > 0 ? formatUnits(fee) : ""}#${nonce}`;
 
     const signResult = await signDataInsecureAPI(privateKey, dataToSign);
     if (!signResult.success || !signResult.signature) {
@@ -168,6 +182,8 @@ if (elements.transactionForm) {
       sender_public_key: senderPublicKey,
       recipient_public_key: recipientPublicKey,
       amount,
+      fee,
+      nonce,
       signature,
     });
 
@@ -219,64 +235,107 @@ if (elements.miningForm) {
     mineButton.innerHTML =
       '<span class="spinner-border spinner-border-sm" role="status" aria-hidden="true"></span> Initiating...';
 
-    const miningModal = elements.miningModalEl
-      ? bootstrap.Modal.getOrCreateInstance(elements.miningModalEl)
-      : null;
-
-    if (elements.miningAttemptsEl) elements.miningAttemptsEl.textContent = "0";
-    if (elements.miningTimeEl) elements.miningTimeEl.textContent = "0.0s";
-    if (elements.miningProgressEl) elements.miningProgressEl.style.width = "0%";
-    if (miningModal) miningModal.show();
-
-    mineButton.innerHTML =
-      '<span class="spinner-border spinner-border-sm" role="status" aria-hidden="true"></span> Mining...';
-
-    let attempts = 0;
-    const startTime = Date.now();
-    if (miningAnimationInterval) clearInterval(miningAnimationInterval);
-    miningAnimationInterval = setInterval(() => {
-      attempts++;
-      if (elements.miningAttemptsEl)
-        elements.miningAttemptsEl.textContent = attempts.toLocaleString();
-      if (elements.miningTimeEl)
-        elements.miningTimeEl.textContent =
-          ((Date.now() - startTime) / 1000).toFixed(1) + "s";
-      if (elements.miningProgressEl)
-        elements.miningProgressEl.style.width = `${Math.min(
-          95,
-          (attempts % 100) * 0.95
-        )}%`;
-      if (elements.miningHashValueEl)
-        elements.miningHashValueEl.textContent = Array.from(
-          { length: 10 },
-          () => Math.floor(Math.random() * 16).toString(16)
-        ).join("");
-    }, 60);
-
-    const mineResult = await mineBlockAPI(minerAddressPublicKey);
-
-    if (miningAnimationInterval) clearInterval(miningAnimationInterval);
-    miningAnimationInterval = null;
+    const drain = Boolean(elements.drainBacklogCheckbox && elements.drainBacklogCheckbox.checked);
+    const submitResult = await mineBlockAPI(minerAddressPublicKey, drain);
+    if (!submitResult.success || !submitResult.job) {
+      // Error notification handled by apiClient
+      mineButton.disabled = false;
+      mineButton.innerHTML = originalButtonText;
+      return;
+    }
+    followMiningJob(submitResult.job, mineButton, originalButtonText);
+  });
+}
 
-    if (mineResult.success && mineResult.block) {
-      if (elements.miningProgressEl)
-        elements.miningProgressEl.style.width = "100%";
+// Shows a queued mining job's live progress in the mining modal until it finishes.
+// Progress arrives over Socket.IO; the job is also polled in case an event is missed.
+function followMiningJob(job, mineButton, originalButtonText) {
+  const miningModal = elements.miningModalEl
+    ? bootstrap.Modal.getOrCreateInstance(elements.miningModalEl)
+    : null;
+  if (elements.miningAttemptsEl) elements.miningAttemptsEl.textContent = "0";
+  if (elements.miningTimeEl) elements.miningTimeEl.textContent = "0.0s";
+  if (elements.miningRateEl) elements.miningRateEl.textContent = "-";
+  if (elements.miningProgressEl) elements.miningProgressEl.style.width = "0%";
+  if (elements.miningStatusEl) elements.miningStatusEl.textContent = job.status === "queued"
+    ? "Waiting for earlier mining jobs to finish..."
+    : "Please wait while the block is being mined on the server.";
+  if (elements.cancelMiningBtn) elements.cancelMiningBtn.disabled = false;
+  if (miningModal) miningModal.show();
+  mineButton.innerHTML =
+    '<span class="spinner-border spinner-border-sm" role="status" aria-hidden="true"></span> Mining...';
+
+  let finished = false;
+  let pollTimer = null;
+  let stopWatching = null;
+  const onProgress = (report) => {
+    if (elements.miningAttemptsEl)
+      elements.miningAttemptsEl.textContent = report.hashes.toLocaleString();
+    if (elements.miningTimeEl)
+      elements.miningTimeEl.textContent = report.elapsed.toFixed(1) + "s";
+    if (elements.miningRateEl)
+      elements.miningRateEl.textContent = `${Math.round(report.hash_rate).toLocaleString()} H/s`;
+    // Chance that a block would have been found by now: 1 - e^(-hashes / 16^difficulty)
+    const expectedHashes = Math.pow(16, report.difficulty || 1);
+    if (elements.miningProgressEl)
+      elements.miningProgressEl.style.width = `${Math.min(
+        95,
+        (1 - Math.exp(-report.hashes / expectedHashes)) * 100
+      ).toFixed(0)}%`;
+    if (elements.miningHashValueEl)
+      elements.miningHashValueEl.textContent = report.nonce.toString(16).padStart(10, "0").slice(-10);
+    if (elements.miningStatusEl)
+      elements.miningStatusEl.textContent = `Mining block #${report.block_index}` +
+        (report.blocks_mined ? ` (${report.blocks_mined} mined so far)` : "") + "...";
+  };
+  const onUpdate = (update) => {
+    if (finished || !["completed", "failed", "cancelled"].includes(update.status)) {
+      if (update.status === "running" && elements.miningStatusEl)
+        elements.miningStatusEl.textContent = "Please wait while the block is being mined on the server.";
+      return;
+    }
+    finished = true;
+    if (pollTimer) clearInterval(pollTimer);
+    if (stopWatching) stopWatching();
+    if (elements.miningModalEl) elements.miningModalEl.dataset.jobId = "";
+    const lastBlock = update.blocks.length ? update.blocks[update.blocks.length - 1] : null;
+    if (lastBlock) {
+      if (elements.miningProgressEl) elements.miningProgressEl.style.width = "100%";
       if (elements.miningHashValueEl)
-        elements.miningHashValueEl.textContent =
-          mineResult.block.hash.substring(0, 10);
-
-      setTimeout(() => {
-        if (miningModal) miningModal.hide();
-        showNotification(
-          mineResult.message || `Block #${mineResult.block.index} mined!`
-        );
-      }, 1200);
-    } else {
-      if (miningModal) miningModal.hide();
-      // Error notification handled by apiClient if mineResult.success is false
+        elements.miningHashValueEl.textContent = lastBlock.hash.substring(0, 10);
     }
+    setTimeout(() => {
+      if (miningModal) miningModal.hide();
+      showNotification(
+        update.message || `Mining job ${update.status}.`,
+        update.status === "failed"
+      );
+    }, lastBlock ? 1200 : 0);
     mineButton.disabled = false;
     mineButton.innerHTML = originalButtonText;
+  };
+
+  if (elements.miningModalEl) elements.miningModalEl.dataset.jobId = job.job_id;
+  stopWatching = watchMiningJob(job.job_id, { onProgress, onUpdate });
+  if (finished) {
+    stopWatching(); // The job had already finished
+    return;
+  }
+  pollTimer = setInterval(async () => {
+    const result = await getMiningJobAPI(job.job_id);
+    if (result.success && result.job) onUpdate(result.job);
+  }, 2000);
+}
+
+if (elements.cancelMiningBtn) {
+  elements.cancelMiningBtn.addEventListener("click", async () => {
+    const jobId = elements.miningModalEl && elements.miningModalEl.dataset.jobId;
+    if (!jobId) return;
+    elements.cancelMiningBtn.disabled = true;
+    const result = await cancelMiningJobAPI(jobId);
+    if (result.success && elements.miningStatusEl)
+      elements.miningStatusEl.textContent = "Cancelling...";
+    else elements.cancelMiningBtn.disabled = false;
   });
 }
 
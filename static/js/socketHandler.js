@@ -5,6 +5,93 @@ import { handleBlockchainUpdateFromSocket } from "./uiUpdater.js";
 
 let socket; // Module-level socket instance
 
+// Chain sync protocol (must match SYNC_PROTOCOL_VERSION in app.py).
+// The server broadcasts only new blocks and pending-pool changes ("delta"); we keep track of
+// the height and tip hash we hold so we can tell whether a delta applies to our copy.
+const SYNC_PROTOCOL_VERSION = 2;
+const chainState = {
+  height: 0,
+  tipHash: null,
+  pendingTransactions: [],
+  syncInFlight: false,
+};
+
+// Background mining jobs: the latest state seen for each job, and per-job listeners.
+// A job can finish before the client learns its id, so its last state is kept for watchMiningJob.
+const miningJobStates = new Map();
+const miningJobWatchers = new Map();
+
+function notifyMiningWatchers(jobId, kind, data) {
+  const watcher = miningJobWatchers.get(jobId);
+  if (watcher && watcher[kind]) watcher[kind](data);
+}
+
+// Calls onProgress(report) for each 'mining_progress' event of the job and onUpdate(job) for each
+// status change (at once if the job already reported one). Returns a function that stops watching.
+export function watchMiningJob(jobId, { onProgress, onUpdate }) {
+  miningJobWatchers.set(jobId, { onProgress, onUpdate });
+  const known = miningJobStates.get(jobId);
+  if (known && onUpdate) onUpdate(known);
+  return () => {
+    miningJobWatchers.delete(jobId);
+    miningJobStates.delete(jobId);
+  };
+}
+
+function requestSync(reason) {
+  if (!socket || !socket.connected) return;
+  chainState.syncInFlight = true;
+  socket.emit("sync_request", {
+    protocol: SYNC_PROTOCOL_VERSION,
+    height: chainState.height,
+    tip_hash: chainState.tipHash,
+    reason: reason,
+  });
+}
+
+// Applies a 'snapshot' or 'delta' payload to our chain state and the UI.
+async function applyChainUpdate(data, fallbackMessage) {
+  if (!data || !data.status || data.protocol !== SYNC_PROTOCOL_VERSION) {
+    console.error("Socket.IO: Received malformed chain update:", data);
+    showNotification("Received incomplete update from server.", true);
+    return;
+  }
+
+  if (data.type === "snapshot") {
+    chainState.syncInFlight = false;
+    chainState.height = data.height;
+    chainState.tipHash = data.tip_hash;
+    chainState.pendingTransactions = data.pending.added;
+    showNotification(data.status.message || fallbackMessage, false);
+    await handleBlockchainUpdateFromSocket({
+      status: data.status,
+      blocks: data.blocks,
+    });
+    return;
+  }
+
+  // Delta: only applies on top of exactly the chain we hold.
+  const matchesOurChain =
+    data.from_height === chainState.height &&
+    (data.from_height === 0 || data.base_hash === chainState.tipHash);
+  if (!matchesOurChain) {
+    // While a sync reply is on its way, broadcasts sent before it are already covered by it.
+    if (!chainState.syncInFlight) requestSync("Missed updates");
+    return;
+  }
+  chainState.syncInFlight = false;
+  chainState.height = data.height;
+  chainState.tipHash = data.tip_hash;
+  chainState.pendingTransactions = data.pending.reset
+    ? data.pending.added
+    : chainState.pendingTransactions.concat(data.pending.added);
+  showNotification(data.status.message || fallbackMessage, false);
+  await handleBlockchainUpdateFromSocket({
+    status: data.status,
+    newBlocks: data.blocks,
+  });
+}
+
 export function initializeSocket() {
   if (socket && socket.connected) {
     console.log("Socket already initialized and connected.");
@@ -21,10 +108,11 @@ export function initializeSocket() {
       "Live connection to blockchain server established!",
       false
     );
-    // Request initial state which includes blockchain data.
-    // The handler for 'initial_state' will then call handleBlockchainUpdateFromSocket,
-    // which in turn refreshes the user directory among other things.
-    socket.emit("request_update", { reason: "Client initial connection" });
+    // Ask for everything after the chain we already hold: a full snapshot on first
+    // connect, only the missed blocks after a reconnect.
+    requestSync(
+      chainState.height === 0 ? "Client initial connection" : "Client reconnected"
+    );
   });
 
   socket.on("disconnect", (reason) => {
@@ -46,41 +134,25 @@ export function initializeSocket() {
   });
 
   socket.on("initial_state", async (data) => {
-    // Made async because handler is async
     console.log("Socket.IO: Received 'initial_state'", data);
-    if (data && data.status) {
-      // Basic check for valid data structure
-      showNotification(
-        data.status.message || "Initial blockchain state received.",
-        false
-      );
-      await handleBlockchainUpdateFromSocket(data);
-    } else {
-      console.error(
-        "Socket.IO: Received malformed 'initial_state' data:",
-        data
-      );
-      showNotification("Received incomplete initial state from server.", true);
-    }
+    await applyChainUpdate(data, "Initial blockchain state received.");
   });
 
   socket.on("blockchain_updated", async (data) => {
-    // Made async
     console.log("Socket.IO: Received 'blockchain_updated'", data);
-    if (data && data.status) {
-      // Basic check
-      showNotification(
-        data.status.message || "Blockchain has been updated!",
-        false
-      );
-      await handleBlockchainUpdateFromSocket(data);
-    } else {
-      console.error(
-        "Socket.IO: Received malformed 'blockchain_updated' data:",
-        data
-      );
-      showNotification("Received incomplete update from server.", true);
-    }
+    await applyChainUpdate(data, "Blockchain has been updated!");
+  });
+
+  socket.on("mining_progress", (report) => {
+    notifyMiningWatchers(report.job_id, "onProgress", report);
+  });
+
+  socket.on("mining_job_updated", (job) => {
+    console.log("Socket.IO: Received 'mining_job_updated'", job);
+    miningJobStates.set(job.job_id, job);
+    if (miningJobStates.size > 50)
+      miningJobStates.delete(miningJobStates.keys().next().value); // Oldest first
+    notifyMiningWatchers(job.job_id, "onUpdate", job);
   });
 }
 
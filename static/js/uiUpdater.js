@@ -4,6 +4,7 @@ import {
   formatTimestamp,
   formatHash,
   showNotification,
+  unitsToCoins,
 } from "./utils.js";
 import { getBalanceAPI, getUserDirectoryAPI } from "./apiClient.js";
 import { getPublicKey } from "./keyManager.js"; // To get the active user's public key
@@ -24,7 +25,7 @@ export async function updateBalanceUI() {
   const result = await getBalanceAPI(encodedPublicKey);
 
   if (result.success) {
-    balanceElement.textContent = parseFloat(result.balance).toFixed(4);
+    balanceElement.textContent = unitsToCoins(result.balance).toFixed(4);
   } else {
     balanceElement.textContent = "Error";
     // Error notification is handled by apiClient's fetchAPI if it was an API error
@@ -40,7 +41,7 @@ export function updateDashboardUI(status) {
   animateNumberChange("difficulty-status", String(status.difficulty));
   animateNumberChange(
     "mining-reward-status",
-    parseFloat(status.mining_reward).toFixed(1)
+    unitsToCoins(status.mining_reward).toFixed(1)
   );
 }
 
@@ -56,86 +57,103 @@ export function updateBlockchainDisplayUI(blocks) {
     return;
   }
 
+  // Show newest blocks at the top
   [...blocks].reverse().forEach((block) => {
-    // Show newest blocks at the top
-    const blockElement = document.createElement("div");
-    blockElement.className = "block card mb-3 shadow-sm";
-    const transactionsHtml =
-      block.transactions.length > 0
-        ? block.transactions
-            .map((tx) => {
-              const senderDisplay =
-                tx.sender_public_key === "network" ||
-                tx.sender_public_key === "welcome_faucet" ||
-                tx.sender_public_key === "GENESIS_ALLOCATION"
-                  ? `<strong class="text-primary">${tx.sender_public_key.toUpperCase()}</strong>`
-                  : `<span title="Sender PK: ${
-                      tx.sender_public_key
-                    }">${formatHash(tx.sender_public_key, 6)}</span>`;
-
-              const recipientDisplay = `<span title="Recipient PK: ${
-                tx.recipient_public_key
-              }">${formatHash(tx.recipient_public_key, 6)}</span>`;
-
-              const amountClass =
-                tx.sender_public_key === "network" ||
-                tx.sender_public_key === "welcome_faucet" ||
-                tx.sender_public_key === "GENESIS_ALLOCATION"
-                  ? "text-success" // Green for incoming system funds
-                  : "text-danger"; // Red for outgoing user funds (from perspective of chain, not specific user)
-
-              const amountPrefix =
-                tx.sender_public_key === "network" ||
-                tx.sender_public_key === "welcome_faucet" ||
-                tx.sender_public_key === "GENESIS_ALLOCATION"
-                  ? "+"
-                  : "-"; // This might be confusing; tx list doesn't know "my" perspective. Let's keep it simple.
-
-              return `
-              <div class="transaction-item small p-1 mb-1 border rounded d-flex justify-content-between align-items-center">
-                  <span class="text-truncate" style="max-width: 70%;">
-                     <i class="bi bi-arrow-right-circle me-1"></i>
-                     From: ${senderDisplay} → To: ${recipientDisplay}
-                  </span>
-                  <span class="fw-bold ms-2 ${amountClass}">
-                     ${parseFloat(tx.amount).toFixed(2)}
-                  </span>
-              </div>`;
-            })
-            .join("")
-        : '<p class="fst-italic text-muted my-1">No transactions in this block.</p>';
-
-    blockElement.innerHTML = `
-      <div class="card-header block-header d-flex justify-content-between align-items-center">
-          <span class="block-index fw-bold text-primary">Block #${
-            block.index
-          }</span>
-          <span class="block-hash text-muted small" title="Full Hash: ${
-            block.hash
-          }">${formatHash(block.hash, 8)}</span>
-      </div>
-      <div class="card-body block-details py-2 px-3">
-          <p class="card-text small mb-1"><strong>Prev. Hash:</strong> <span class="text-muted" title="Full Previous Hash: ${
-            block.previous_hash
-          }">${formatHash(block.previous_hash, 8)}</span></p>
-          <p class="card-text small mb-1"><strong>Timestamp:</strong> <span class="text-muted">${formatTimestamp(
-            block.timestamp
-          )}</span></p>
-          <p class="card-text small mb-1"><strong>Nonce:</strong> <span class="text-muted">${
-            block.nonce
-          }</span></p>
-      </div>
-      <div class="card-footer transactions-list small py-2 px-3">
-          <h6 class="small mb-1 fw-bold">Transactions (${
-            block.transactions.length
-          }):</h6>
-          ${transactionsHtml}
-      </div>
-    `;
-    container.appendChild(blockElement);
+    container.appendChild(createBlockElement(block));
   });
 }
 
+// Adds newly mined blocks to the top of the visualizer without re-rendering existing ones
+export function prependBlocksToDisplayUI(newBlocks) {
+  const container = document.getElementById("blockchain-display");
+  if (!container || !newBlocks || newBlocks.length === 0) return;
+  if (!container.querySelector(".block")) container.innerHTML = ""; // Drop the "empty" placeholder
+
+  newBlocks.forEach((block) => {
+    container.insertBefore(createBlockElement(block), container.firstChild);
+  });
+}
+
+function createBlockElement(block) {
+  const blockElement = document.createElement("div");
+  blockElement.className = "block card mb-3 shadow-sm";
+  const transactionsHtml =
+    block.transactions.length > 0
+      ? block.transactions
+          .map((tx) => {
+            const senderDisplay =
+              tx.sender_public_key === "network" ||
+              tx.sender_public_key === "welcome_faucet" ||
+              tx.sender_public_key === "GENESIS_ALLOCATION"
+                ? `<strong class="text-primary">${tx.sender_public_key.toUpperCase()}</strong>`
+                : `<span title="Sender PK: ${
+                    tx.sender_public_key
+                  }">${formatHash(tx.sender_public_key, 6)}</span>`;
+
+            const recipientDisplay = `<span title="Recipient PK: ${
+              tx.recipient_public_key
+            }">${formatHash(tx.recipient_public_key, 6)}</span>`;
+
+            const amountClass =
+              tx.sender_public_key === "network" ||
+              tx.sender_public_key === "welcome_faucet" ||
+              tx.sender_public_key === "GENESIS_ALLOCATION"
+                ? "text-success" // Green for incoming system funds
+                : "text-danger"; // Red for outgoing user funds (from perspective of chain, not specific user)
+
+            const amountPrefix =
+              tx.sender_public_key === "network" ||
+              tx.sender_public_key === "welcome_faucet" ||
+              tx.sender_public_key === "GENESIS_ALLOCATION"
+                ? "+"
+                : "-"; // This might be confusing; tx list doesn't know "my" perspective. Let's keep it simple.
+
+            return `
+            <div class="transaction-item small p-1 mb-1 border rounded d-flex justify-content-between align-items-center">
+                <span class="text-truncate" style="max-width: 70%;">
+                   <i class="bi bi-arrow-right-circle me-1"></i>
+                   From: ${senderDisplay} → To: ${recipientDisplay}
+                </span>
+                <span class="fw-bold ms-2 ${amountClass}">
+                   ${unitsToCoins(tx.amount).toFixed(2)}${
+                     tx.fee ? ` <span class="fw-normal text-muted">(fee ${unitsToCoins(tx.fee)})</span>` : ""
+                   }
+                </span>
+            </div>`;
+          })
+          .join("")
+      : '<p class="fst-italic text-muted my-1">No transactions in this block.</p>';
+
+  blockElement.innerHTML = `
+    <div class="card-header block-header d-flex justify-content-between align-items-center">
+        <span class="block-index fw-bold text-primary">Block #${
+          block.index
+        }</span>
+        <span class="block-hash text-muted small" title="Full Hash: ${
+          block.hash
+        }">${formatHash(block.hash, 8)}</span>
+    </div>
+    <div class="card-body block-details py-2 px-3">
+        <p class="card-text small mb-1"><strong>Prev. Hash:</strong> <span class="text-muted" title="Full Previous Hash: ${
+          block.previous_hash
+        }">${formatHash(block.previous_hash, 8)}</span></p>
+        <p class="card-text small mb-1"><strong>Timestamp:</strong> <span class="text-muted">${formatTimestamp(
+          block.timestamp
+        )}</span></p>
+        <p class="card-text small mb-1"><strong>Nonce:</strong> <span class="text-muted">${
+          block.nonce
+        }</span></p>
+    </div>
+    <div class="card-footer transactions-list small py-2 px-3">
+        <h6 class="small mb-1 fw-bold">Transactions (${
+          block.transactions.length
+        }):</h6>
+        ${transactionsHtml}
+    </div>
+  `;
+  return blockElement;
+}
+
 // Populates the User Directory UI
 export function populateUserDirectoryUI(users) {
   const directoryContainer = document.getElementById("user-directory-display");
@@ -206,7 +224,7 @@ export function populateUserDirectoryUI(users) {
     balanceSpan.className = "directory-balance badge bg-info text-dark me-2"; // Added margin
     balanceSpan.textContent =
       typeof user.balance === "number"
-        ? `${parseFloat(user.balance).toFixed(2)} Coins`
+        ? `${unitsToCoins(user.balance).toFixed(2)} Coins`
         : user.balance;
 
     // --- NEW COPY BUTTON ---
@@ -254,7 +272,9 @@ export async function handleBlockchainUpdateFromSocket(data) {
     updateDashboardUI(data.status);
   }
   if (data.blocks) {
-    updateBlockchainDisplayUI(data.blocks);
+    updateBlockchainDisplayUI(data.blocks); // Full snapshot
+  } else if (data.newBlocks) {
+    prependBlocksToDisplayUI(data.newBlocks); // Delta update
   }
   updateBalanceUI(); // Update active browser user's balance
 
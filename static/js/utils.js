@@ -72,3 +72,41 @@ export function formatHash(hash, length = 10) {
     hash.substring(0, length) + "..." + hash.substring(hash.length - length)
   );
 }
+
+// Amounts: the API works in integer base units, COIN per coin (see utils/amounts.py)
+export const COIN = 100000000;
+const AMOUNT_DECIMALS = 8;
+
+// Helper: Parse a coin amount typed by the user ("12.5") into base units; null if invalid or too precise
+export function parseAmountToUnits(text) {
+  const match = /^\s*(\d*)(?:\.(\d*))?\s*$/.exec(String(text));
+  if (!match || (match[1] === "" && !match[2])) return null;
+  const fraction = match[2] || "";
+  if (fraction.length > AMOUNT_DECIMALS) return null;
+  const units =
+    BigInt(match[1] || "0") * BigInt(COIN) +
+    BigInt(fraction.padEnd(AMOUNT_DECIMALS, "0"));
+  return units <= BigInt(Number.MAX_SAFE_INTEGER) ? Number(units) : null;
+}
+
+// Helper: Exact coin text of a base-unit amount ("1.50000000"), the form transactions are signed with
+export function formatUnits(units) {
+  const value = BigInt(units);
+  const magnitude = value < 0n ? -value : value;
+  const coin = BigInt(COIN);
+  const fraction = (magnitude % coin).toString().padStart(AMOUNT_DECIMALS, "0");
+  return `${value < 0n ? "-" : ""}${magnitude / coin}.${fraction}`;
+}
+
+// Helper: Coin value of a base-unit amount, for display
+export function unitsToCoins(units) {
+  return Number(units) / COIN;
+}
+
+// Helper: Fresh transaction nonce, microseconds since the epoch and above the last one handed out
+// (like new_nonce in transaction.py), so each payment is unique and later ones have higher nonces
+let lastNonce = 0;
+export function nextNonce() {
+  lastNonce = Math.max(Date.now() * 1000, lastNonce + 1);
+  return lastNonce;
+}
@@ -0,0 +1,878 @@
+# storage.py
+
+import glob
+import itertools
+import json
+import mmap
+import os
+import shutil
+import struct
+import threading
+import time
+import traceback
+import weakref
+import zlib
+from collections import OrderedDict
+from block import Block
+from blockchain import Blockchain
+from utils.binary_codec import decode_block, encode_block
+
+# Record header: payload length and CRC32 of the payload, both unsigned big-endian 32-bit.
+RECORD_HEADER = struct.Struct(">II")
+# Index entry for block i (stored at i * INDEX_ENTRY.size in index.bin):
+# segment number, record offset in that segment, record length (header included), block hash.
+INDEX_ENTRY = struct.Struct(">IQI32s")
+FSYNC_POLICIES = ("always", "interval", "never")
+RECORD_FORMATS = ("binary", "json")
+# A rewritten log is built in "<directory>.rewrite"; the log it replaces is moved to "<directory>.replaced-<pid>-<ns>".
+REWRITE_SUFFIX = ".rewrite"
+REPLACED_SUFFIX = ".replaced-"
+SIGNATURE_COMPACT_RATIO = 0.25 # signatures.log is rewritten once this share of its digests were forgotten
+
+
+def _decode_payload(payload: bytes) -> dict:
+    """Decodes a record payload: JSON records start with '{', anything else is a binary block."""
+    return json.loads(payload) if payload[:1] == b"{" else decode_block(payload)
+
+
+def _read_last_line(path: str, chunk_size: int = 4096) -> bytes | None:
+    """
+    The last line of a file without its newline, read backwards from the end in chunks.
+    None if the file is empty or does not end with a newline (a torn last line).
+    """
+    with open(path, "rb") as f:
+        position = f.seek(0, os.SEEK_END)
+        tail = b""
+        while position > 0:
+            step = min(chunk_size, position)
+            position -= step
+            f.seek(position)
+            tail = f.read(step) + tail
+            if not tail.endswith(b"\n"):
+                return None
+            start = tail.rfind(b"\n", 0, len(tail) - 1)
+            if start >= 0:
+                return tail[start + 1:-1]
+        return tail[:-1] if tail else None
+
+
+def _sync_directory(path: str):
+    """Makes renames within a directory durable (best effort: not every platform can fsync a directory)."""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _hash_to_bytes(block_hash: str | None) -> bytes:
+    try:
+        return bytes.fromhex(block_hash) if block_hash and len(block_hash) == 64 else bytes(32)
+    except ValueError:
+        return bytes(32)
+
+
+class BlockIndex:
+    """
+    Fixed-width offset index over the segment files, read through mmap.
+
+    Looking up block i is one slice of the mapped index plus one slice of the mapped segment,
+    so any block can be fetched without reading or parsing the rest of the chain. The
+    hash -> index map is built lazily from the mapped index the first time it is needed.
+
+    Reads may run on request threads while a save appends: a lock is held around every use and
+    replacement of the mappings (only while slicing, not while decoding), so no reader touches a
+    mapping that is being closed.
+    """
+    def __init__(self, directory: str):
+        self.directory: str = directory
+        self.path: str = os.path.join(directory, "index.bin")
+        self._file = None
+        self._map = None
+        self._count: int = 0
+        self._segment_maps: dict[int, tuple] = {} # segment number -> (file, mmap)
+        self._hash_to_index: dict[bytes, int] | None = None
+        self._lock = threading.RLock() # Guards the mappings and the hash map (see class docstring)
+
+    def open(self):
+        with self._lock:
+            self.close()
+            if not os.path.exists(self.path):
+                open(self.path, "wb").close()
+            self._map_index()
+
+    def _map_index(self):
+        """Maps index.bin as it is now, releasing the previous mapping of it (lock held)."""
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+        self._file = open(self.path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._count = size // INDEX_ENTRY.size
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+
+    def close(self):
+        """Releases every mapping (required before segment files are truncated or removed)."""
+        with self._lock:
+            for segment_file, segment_map in self._segment_maps.values():
+                segment_map.close()
+                segment_file.close()
+            self._segment_maps = {}
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self._count = 0
+            self._hash_to_index = None
+
+    def relocate(self, directory: str):
+        """Follows the files to `directory` after they were moved there (open mappings stay valid)."""
+        with self._lock:
+            self.directory = directory
+            self.path = os.path.join(directory, "index.bin")
+
+    def __len__(self) -> int:
+        return self._count
+
+    def entry(self, block_index: int) -> tuple[int, int, int, bytes]:
+        with self._lock:
+            if not 0 <= block_index < self._count:
+                raise IndexError(f"Block #{block_index} is not in the index ({self._count} blocks).")
+            return INDEX_ENTRY.unpack_from(self._map, block_index * INDEX_ENTRY.size)
+
+    def _segment_map(self, segment_number: int, needed_size: int):
+        """The mapping of a segment covering at least needed_size bytes (lock held)."""
+        mapped = self._segment_maps.get(segment_number)
+        if mapped is None or len(mapped[1]) < needed_size:
+            # The active segment grows as blocks are appended, so its mapping is refreshed on demand.
+            if mapped is not None:
+                mapped[1].close()
+                mapped[0].close()
+            segment_file = open(os.path.join(self.directory, f"segment-{segment_number:06d}.log"), "rb")
+            mapped = (segment_file, mmap.mmap(segment_file.fileno(), 0, access=mmap.ACCESS_READ))
+            self._segment_maps[segment_number] = mapped
+        return mapped[1]
+
+    def read_block_dict(self, block_index: int) -> dict:
+        """Reads and CRC-checks the record of block `block_index` straight from the mapped segment."""
+        with self._lock: # The payload slice is a copy, so it is checked and decoded without the lock
+            segment_number, offset, length, _hash = self.entry(block_index)
+            segment_map = self._segment_map(segment_number, offset + length)
+            payload_length, checksum = RECORD_HEADER.unpack_from(segment_map, offset)
+            payload = segment_map[offset + RECORD_HEADER.size:offset + RECORD_HEADER.size + payload_length]
+        if zlib.crc32(payload) != checksum:
+            raise ValueError(f"Corrupt record for Block #{block_index} in segment {segment_number}.")
+        return _decode_payload(payload)
+
+    def find(self, block_hash: str) -> int | None:
+        """Returns the index of the block with the given hash, or None."""
+        with self._lock:
+            if self._hash_to_index is None:
+                self._hash_to_index = {}
+                for i in range(self._count):
+                    self._hash_to_index[self.entry(i)[3]] = i
+            return self._hash_to_index.get(_hash_to_bytes(block_hash))
+
+    def append(self, entries: list[tuple[int, int, int, str]], sync: bool):
+        """
+        Appends (segment number, offset, length, hash) entries and remaps the index. Segment mappings
+        are kept: they still cover the blocks they did and are extended on demand (see _segment_map).
+        """
+        with open(self.path, "ab") as f:
+            f.write(b"".join(INDEX_ENTRY.pack(seg, offset, length, _hash_to_bytes(block_hash))
+                             for seg, offset, length, block_hash in entries))
+            if sync:
+                f.flush()
+                os.fsync(f.fileno())
+        with self._lock:
+            first_new = self._count
+            self._map_index()
+            if self._hash_to_index is not None:
+                for i, entry in enumerate(entries, start=first_new):
+                    self._hash_to_index[_hash_to_bytes(entry[3])] = i
+
+
+class LazyChain:
+    """
+    List-like chain backed by a BlockIndex. Stored blocks are decoded only when accessed
+    (and kept in a small LRU cache); blocks appended in this session are held in memory.
+    Supports len(), indexing (including negative indices and slices), iteration and append().
+    Safe to read from several threads: the cache is only changed under its lock.
+    """
+    def __init__(self, index: BlockIndex, cache_size: int = 1024):
+        self._index: BlockIndex = index
+        self._stored_count: int = len(index)
+        self._appended: list[Block] = []
+        self._cache: OrderedDict[int, Block] = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.cache_size: int = cache_size
+
+    def __len__(self) -> int:
+        return self._stored_count + len(self._appended)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self[i] for i in range(*item.indices(len(self)))]
+        position = item + len(self) if item < 0 else item
+        if not 0 <= position < len(self):
+            raise IndexError("chain index out of range")
+        if position >= self._stored_count:
+            return self._appended[position - self._stored_count]
+        with self._cache_lock:
+            block = self._cache.get(position)
+            if block is not None:
+                self._cache.move_to_end(position)
+                return block
+        block = Block.from_dict(self._index.read_block_dict(position)) # Decoded outside the lock
+        with self._cache_lock:
+            block = self._cache.setdefault(position, block) # Another thread may have decoded it meanwhile
+            self._cache.move_to_end(position)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return block
+
+    def __iter__(self):
+        for position in range(len(self)):
+            yield self[position]
+
+    def append(self, block: Block):
+        self._appended.append(block)
+
+    def rebind(self, index: BlockIndex):
+        """Reads stored blocks through `index` from now on; it must hold the same blocks at the same positions."""
+        self._index = index
+
+    def index_of_hash(self, block_hash: str) -> int | None:
+        """Returns the chain position of the block with the given hash, or None."""
+        position = self._index.find(block_hash) if block_hash else None
+        if position is not None and position < self._stored_count:
+            return position
+        for offset, block in enumerate(self._appended):
+            if block.hash == block_hash:
+                return self._stored_count + offset
+        return None
+
+    def __repr__(self) -> str:
+        return f"LazyChain(blocks={len(self)}, stored={self._stored_count}, cached={len(self._cache)})"
+
+
+class BlockLogStorage:
+    """
+    Append-only storage engine for a Blockchain.
+
+    Each block is written once, as a length-prefixed, CRC-checked record appended to the
+    active segment file (segment-000001.log, segment-000002.log, ...). With record_format="binary"
+    (the default) the record holds the block's binary encoding (Block.to_bytes), falling back to
+    JSON for blocks that encoding cannot reproduce exactly; both kinds are read back. Small, frequently changing
+    state lives in separate files that are replaced atomically: pending transactions in
+    pending.json and chain settings in meta.json. Verified-signature digests are appended to
+    signatures.log, one per line, and the transaction index records of each block (txids and
+    parties, see Blockchain.tx_index_record) to txindex.log, one JSON line per block. Public keys
+    registered for the addresses stored in blocks are appended to keys.log as [address, PEM] lines.
+
+    fsync_policy controls durability of appends:
+        "always"   - fsync after every save (safest, slowest)
+        "interval" - fsync at most every `fsync_interval` seconds
+        "never"    - leave flushing to the operating system
+
+    A crash in the middle of an append can leave a partial ("torn") record at the end of the
+    last segment; it is detected by its length/CRC and truncated away on the next load. When the
+    log has to be rewritten (a replaced chain, or a failed save) the new log is built next to the
+    directory and swapped into place (see _rewrite).
+    """
+    def __init__(self, directory: str = "blockchain_log", fsync_policy: str = "always",
+                 fsync_interval: float = 1.0, segment_max_bytes: int = 64 * 1024 * 1024,
+                 record_format: str = "binary"):
+        if fsync_policy not in FSYNC_POLICIES:
+            raise ValueError(f"fsync_policy must be one of {FSYNC_POLICIES}, got '{fsync_policy}'.")
+        if record_format not in RECORD_FORMATS:
+            raise ValueError(f"record_format must be one of {RECORD_FORMATS}, got '{record_format}'.")
+        self.record_format: str = record_format
+        self.directory: str = directory
+        self.fsync_policy: str = fsync_policy
+        self.fsync_interval: float = float(fsync_interval)
+        self.segment_max_bytes: int = int(segment_max_bytes)
+        self._last_fsync: float = 0.0
+        # What is already on disk, so save() only appends the difference.
+        self._persisted_count: int = 0
+        self._persisted_tip_hash: str | None = None
+        self._persisted_signatures: set[str] = set()
+        self._persisted_keys: set[str] = set()
+        # Blocks covered by txindex.log; 0 with blocks on disk means it is rewritten on the next save.
+        self._tx_index_count: int = 0
+        # Set when a save fails part-way: what is on disk is then unknown, so the next save rewrites.
+        self._needs_rewrite: bool = False
+        # A crash between moving the old log aside and moving a finished rewrite into place (see _rewrite).
+        rewrite_dir = directory + REWRITE_SUFFIX
+        if not os.path.exists(directory) and os.path.exists(os.path.join(rewrite_dir, "meta.json")):
+            os.replace(rewrite_dir, directory)
+        for replaced_dir in glob.glob(glob.escape(directory + REPLACED_SUFFIX) + "*"):
+            if not os.path.basename(replaced_dir).startswith(os.path.basename(directory) + f"{REPLACED_SUFFIX}{os.getpid()}-"):
+                shutil.rmtree(replaced_dir, ignore_errors=True) # Left behind by an earlier process
+        os.makedirs(self.directory, exist_ok=True)
+        self.index: BlockIndex = BlockIndex(self.directory)
+
+    # --- Paths ---
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    @staticmethod
+    def _segment_number(path: str) -> int:
+        return int(os.path.basename(path)[len("segment-"):-len(".log")])
+
+    def _segment_paths(self) -> list[str]:
+        names = sorted(n for n in os.listdir(self.directory) if n.startswith("segment-") and n.endswith(".log"))
+        return [self._path(n) for n in names]
+
+    def _new_segment_path(self, number: int) -> str:
+        return self._path(f"segment-{number:06d}.log")
+
+    def exists(self) -> bool:
+        """True if the directory holds a stored chain (at least meta.json)."""
+        return os.path.exists(self._path("meta.json"))
+
+    # --- Low-level writes ---
+
+    def _should_fsync(self) -> bool:
+        if self.fsync_policy == "always":
+            return True
+        if self.fsync_policy == "interval":
+            return time.time() - self._last_fsync >= self.fsync_interval
+        return False
+
+    def _sync(self, f):
+        f.flush()
+        os.fsync(f.fileno())
+        self._last_fsync = time.time()
+
+    def _write_atomic_json(self, name: str, data, sync: bool):
+        """Writes a small JSON file via a temporary file and os.replace, so readers never see half a file."""
+        tmp_path = self._path(name + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+            if sync:
+                self._sync(f)
+        os.replace(tmp_path, self._path(name))
+
+    def _encode_record(self, block_dict: dict) -> bytes:
+        payload = None
+        if self.record_format == "binary":
+            try:
+                payload = encode_block(block_dict)
+            except ValueError:
+                pass # Not exactly representable in binary (e.g. an amount beyond int64): store as JSON
+        if payload is None:
+            payload = json.dumps(block_dict, sort_keys=True).encode("utf-8")
+        return RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+    def _append_blocks(self, blocks: list, sync: bool) -> list[tuple[int, int, int, str]]:
+        """Appends block records and returns their index entries (segment number, offset, length, hash)."""
+        segments = self._segment_paths()
+        segment_number = self._segment_number(segments[-1]) if segments else 1
+        entries = []
+        f = open(self._new_segment_path(segment_number), "ab")
+        try:
+            for block_obj in blocks:
+                record = self._encode_record(block_obj.to_dict())
+                if f.tell() > 0 and f.tell() + len(record) > self.segment_max_bytes:
+                    if sync:
+                        self._sync(f)
+                    f.close()
+                    segment_number += 1
+                    f = open(self._new_segment_path(segment_number), "ab")
+                entries.append((segment_number, f.tell(), len(record), block_obj.hash))
+                f.write(record)
+            if sync:
+                self._sync(f)
+        finally:
+            f.close()
+        return entries
+
+    def _append_signatures(self, digests: list[str], sync: bool):
+        with open(self._path("signatures.log"), "a") as f:
+            f.write("".join(digest + "\n" for digest in digests))
+            if sync:
+                self._sync(f)
+
+    def _rewrite_signatures(self, digests: list[str], sync: bool):
+        """Replaces signatures.log with exactly `digests` (dropping forgotten ones), via a temporary file."""
+        tmp_path = self._path("signatures.log.tmp")
+        with open(tmp_path, "w") as f:
+            f.write("".join(digest + "\n" for digest in digests))
+            if sync:
+                self._sync(f)
+        os.replace(tmp_path, self._path("signatures.log"))
+
+    def _append_keys(self, key_entries: list[tuple[str, str]], sync: bool):
+        with open(self._path("keys.log"), "a") as f:
+            f.write("".join(json.dumps([address, public_key_pem]) + "\n" for address, public_key_pem in key_entries))
+            if sync:
+                self._sync(f)
+
+    def _append_tx_index(self, chain, sync: bool):
+        """Writes transaction index records for the blocks txindex.log does not cover yet."""
+        mode = "a" if self._tx_index_count > 0 else "w" # Nothing usable on disk: start the file over
+        with open(self._path("txindex.log"), mode) as f:
+            for position in range(self._tx_index_count, len(chain)):
+                f.write(json.dumps(Blockchain.tx_index_record(position, chain[position])) + "\n")
+            if sync:
+                self._sync(f)
+
+    def _tx_index_matches(self, stored_count: int, tip_hash: str | None) -> bool:
+        """
+        Cheap check that txindex.log holds one record per stored block, ending at the tip. Records are
+        only ever appended in block order (the file is started over otherwise), so the last one is
+        enough: it is read backwards from the end of the file instead of reading every record.
+        """
+        path = self._path("txindex.log")
+        if not os.path.exists(path):
+            return False
+        if stored_count == 0:
+            return os.path.getsize(path) == 0
+        last_line = _read_last_line(path)
+        if last_line is None:
+            return False # Empty, or a torn last line
+        try:
+            record = json.loads(last_line)
+        except ValueError:
+            return False
+        return record.get("block") == stored_count - 1 and record.get("hash") == tip_hash
+
+    def read_tx_index(self):
+        """Yields the stored transaction index records in block order (used as Blockchain.tx_index_loader)."""
+        count = self._tx_index_count
+        with open(self._path("txindex.log")) as f:
+            for line in itertools.islice(f, count):
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    return
+
+    def _rewrite(self, blockchain: Blockchain):
+        """
+        Writes the whole chain as a new log in a sibling directory, then swaps it into place. Nothing
+        stored is removed before its replacement is complete, and the replaced files are only moved
+        aside: a LazyChain (e.g. of a chain being replaced) may still read blocks through the old
+        index, so they are deleted once that index is no longer used.
+        """
+        rewrite_dir = self.directory + REWRITE_SUFFIX
+        shutil.rmtree(rewrite_dir, ignore_errors=True)
+        fresh = BlockLogStorage(rewrite_dir, self.fsync_policy, self.fsync_interval, self.segment_max_bytes, self.record_format)
+        fresh._append_changes(blockchain)
+
+        old_index = self.index
+        if os.path.exists(self.directory):
+            replaced_dir = f"{self.directory}{REPLACED_SUFFIX}{os.getpid()}-{time.time_ns()}"
+            os.replace(self.directory, replaced_dir)
+            old_index.relocate(replaced_dir)
+            weakref.finalize(old_index, shutil.rmtree, replaced_dir, True)
+        os.replace(rewrite_dir, self.directory)
+        fresh.index.relocate(self.directory)
+        _sync_directory(os.path.dirname(os.path.abspath(self.directory)))
+
+        self.index = fresh.index
+        if isinstance(blockchain.chain, LazyChain):
+            blockchain.chain.rebind(self.index) # Same blocks at the same positions
+        self._persisted_count, self._persisted_tip_hash = fresh._persisted_count, fresh._persisted_tip_hash
+        self._persisted_signatures, self._persisted_keys = fresh._persisted_signatures, fresh._persisted_keys
+        self._tx_index_count, self._last_fsync = fresh._tx_index_count, fresh._last_fsync
+        self._needs_rewrite = False
+
+    # --- Public API ---
+
+    def save(self, blockchain: Blockchain) -> tuple[bool, str]:
+        """
+        Persists the blockchain. Blocks already on disk are not rewritten: only blocks added since
+        the last save are appended. If the chain was replaced (e.g. a new chain was created) the
+        log is rewritten from scratch. Holds the blockchain's write lock throughout, so the blocks,
+        balances, signatures and pool written all belong to the same state.
+        Returns (saved, message); after a failure the next save rewrites the log.
+        """
+        with blockchain.write_lock:
+            return self._save(blockchain)
+
+    def _save(self, blockchain: Blockchain) -> tuple[bool, str]:
+        try:
+            chain = blockchain.chain
+            extends_disk = (not self._needs_rewrite and self._persisted_count <= len(chain) and
+                            (self._persisted_count == 0 or chain[self._persisted_count - 1].hash == self._persisted_tip_hash))
+            if not extends_disk:
+                print(f"Chain in memory does not extend the stored log in '{self.directory}'. Rewriting it.")
+                self._rewrite(blockchain)
+            elif self._persisted_count == 0:
+                self._rewrite(blockchain) # Nothing loaded from here: replace leftovers (e.g. a log that failed to load)
+            else:
+                self._append_changes(blockchain)
+        except IOError as e:
+            self._needs_rewrite = True
+            msg = f"Could not save blockchain to '{self.directory}': {e}"
+            print(f"Error: {msg}")
+            return False, msg
+        except Exception as e:
+            self._needs_rewrite = True
+            print(f"An unexpected error occurred while saving blockchain: {e}")
+            traceback.print_exc()
+            return False, f"Unexpected error while saving blockchain to '{self.directory}': {e}"
+        return True, f"Blockchain state saved to '{self.directory}'."
+
+    def _append_changes(self, blockchain: Blockchain):
+        """Appends what changed since the last save (everything, into an empty directory)."""
+        chain = blockchain.chain
+        sync = self._should_fsync()
+        new_blocks = chain[self._persisted_count:]
+        if new_blocks:
+            self.index.append(self._append_blocks(new_blocks, sync), sync)
+            # Confirmed balances and nonces only change with new blocks; storing them lets a lazy load skip the rebuild.
+            self._write_atomic_json("balances.json", {
+                "height": len(chain), "tip_hash": chain[-1].hash, "balances": blockchain.export_balance_index(),
+                "nonces": blockchain.export_nonce_index()
+            }, sync)
+        if self._tx_index_count < len(chain):
+            self._append_tx_index(chain, sync)
+            self._tx_index_count = len(chain)
+        new_signatures = sorted(blockchain.verified_signatures - self._persisted_signatures)
+        stale_signatures = len(self._persisted_signatures - blockchain.verified_signatures)
+        if stale_signatures and stale_signatures >= SIGNATURE_COMPACT_RATIO * len(self._persisted_signatures):
+            # Forgotten digests (transactions that left the pool unmined) are only dropped from memory
+            # by the chain; the log is rewritten once enough of it is stale.
+            self._rewrite_signatures(sorted(blockchain.verified_signatures), sync)
+            self._persisted_signatures = set(blockchain.verified_signatures)
+            new_signatures = []
+        elif new_signatures:
+            self._append_signatures(new_signatures, sync)
+        registered_keys = blockchain.key_registry.to_dict()
+        new_keys = sorted((address, pem) for address, pem in registered_keys.items() if address not in self._persisted_keys)
+        if new_keys:
+            self._append_keys(new_keys, sync)
+
+        self._write_atomic_json("pending.json", [tx.to_dict() for tx in blockchain.pending_transactions], sync)
+        self._write_atomic_json("meta.json", {
+            "difficulty": blockchain.difficulty,
+            "mining_reward": blockchain.mining_reward,
+            "block_version": blockchain.block_version,
+            "validated_checkpoint": blockchain.validated_checkpoint
+        }, sync)
+
+        self._persisted_count = len(chain)
+        self._persisted_tip_hash = chain[-1].hash if chain else None
+        self._persisted_signatures.update(new_signatures)
+        self._persisted_keys.update(address for address, _pem in new_keys)
+        print(f"Blockchain state saved to '{self.directory}' ({len(new_blocks)} new block(s) appended).")
+
+    def _scan_records(self) -> list[tuple[int, int, int, dict]]:
+        """
+        Reads every block record as (segment number, offset, record length, block dict), truncating
+        a torn or corrupt tail. A bad record in an earlier segment also drops the segments after it,
+        since the chain cannot continue past a gap.
+        """
+        records = []
+        segments = self._segment_paths()
+        for position, path in enumerate(segments):
+            segment_number = self._segment_number(path)
+            with open(path, "rb") as f:
+                data = f.read()
+            offset = 0
+            while offset < len(data):
+                bad_record = offset + RECORD_HEADER.size > len(data)
+                if not bad_record:
+                    length, checksum = RECORD_HEADER.unpack_from(data, offset)
+                    payload = data[offset + RECORD_HEADER.size:offset + RECORD_HEADER.size + length]
+                    bad_record = len(payload) != length or zlib.crc32(payload) != checksum
+                if bad_record:
+                    print(f"Warning: Torn or corrupt record at offset {offset} in '{path}'. Truncating.")
+                    with open(path, "r+b") as f:
+                        f.truncate(offset)
+                    for later_path in segments[position + 1:]:
+                        print(f"Warning: Dropping segment '{later_path}' after the truncated record.")
+                        os.remove(later_path)
+                    return records
+                records.append((segment_number, offset, RECORD_HEADER.size + length, _decode_payload(payload)))
+                offset += RECORD_HEADER.size + length
+        return records
+
+    def _index_matches_segments(self) -> bool:
+        """
+        Cheap consistency check between index.bin and the segments: the index must hold whole
+        entries and its last entry must end exactly where the last segment ends.
+        """
+        if not os.path.exists(self.index.path):
+            return False
+        index_size = os.path.getsize(self.index.path)
+        segments = self._segment_paths()
+        if index_size % INDEX_ENTRY.size != 0:
+            return False
+        if index_size == 0 or not segments:
+            return index_size == 0 and not segments
+        with open(self.index.path, "rb") as f:
+            f.seek(index_size - INDEX_ENTRY.size)
+            segment_number, offset, length, _hash = INDEX_ENTRY.unpack(f.read(INDEX_ENTRY.size))
+        last_segment = segments[-1]
+        return (segment_number == self._segment_number(last_segment) and
+                offset + length == os.path.getsize(last_segment))
+
+    def _open_index(self):
+        """Opens the block index, rebuilding it from a full segment scan if it is missing or stale (e.g. after a crash)."""
+        self.index.close()
+        if not self._index_matches_segments():
+            print(f"Rebuilding block index for '{self.directory}'...")
+            records = self._scan_records()
+            tmp_path = self.index.path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(b"".join(INDEX_ENTRY.pack(seg, offset, length, _hash_to_bytes(block_dict.get("hash")))
+                                 for seg, offset, length, block_dict in records))
+            os.replace(tmp_path, self.index.path)
+        self.index.open()
+
+    def _read_small_files(self) -> tuple[dict, list, list, dict | None, dict]:
+        with open(self._path("meta.json")) as f:
+            meta = json.load(f)
+        pending = []
+        if os.path.exists(self._path("pending.json")):
+            with open(self._path("pending.json")) as f:
+                pending = json.load(f)
+        signatures = []
+        if os.path.exists(self._path("signatures.log")):
+            with open(self._path("signatures.log")) as f:
+                # A torn last line is simply not a complete digest; skip it.
+                signatures = [line.strip() for line in f if len(line.strip()) == 64]
+        balances = None
+        if os.path.exists(self._path("balances.json")):
+            with open(self._path("balances.json")) as f:
+                balances = json.load(f)
+        keys = {}
+        if os.path.exists(self._path("keys.log")):
+            with open(self._path("keys.log")) as f:
+                for line in f:
+                    try:
+                        address, public_key_pem = json.loads(line)
+                    except ValueError:
+                        break # Torn last line
+                    keys[address] = public_key_pem
+        return meta, pending, signatures, balances, keys
+
+    def load(self, miner=None, lazy: bool = True) -> Blockchain | None:
+        """
+        Loads the blockchain from the log directory, or returns None if nothing is stored.
+
+        With lazy=True (the default) nothing but the small side files and the block index is read:
+        the chain is a LazyChain that decodes blocks on demand, and the confirmed balances come from
+        balances.json when it matches the stored chain. With lazy=False every block is read up front.
+        """
+        if not self.exists():
+            print(f"Info: No block log found in '{self.directory}'.")
+            return None
+        try:
+            meta, pending, signatures, balances, keys = self._read_small_files()
+            data = {**meta, "pending_transactions": pending, "verified_signatures": signatures, "key_registry": keys}
+
+            self._open_index()
+            if lazy:
+                chain = LazyChain(self.index)
+                stored_count = len(chain)
+                tip_hash = chain[-1].hash if stored_count else None
+                confirmed_balances = confirmed_nonces = None
+                if balances and balances.get("height") == stored_count and balances.get("tip_hash") == tip_hash:
+                    confirmed_balances, confirmed_nonces = balances.get("balances"), balances.get("nonces")
+                blockchain = Blockchain.from_json_serializable(data, miner=miner, chain=chain, confirmed_balances=confirmed_balances,
+                                                               confirmed_nonces=confirmed_nonces)
+            else:
+                records = self._scan_records()
+                stored_count = len(records)
+                tip_hash = records[-1][3].get("hash") if records else None
+                blockchain = Blockchain.from_json_serializable(
+                    {**data, "chain": [record[3] for record in records]}, miner=miner
+                )
+
+            self._persisted_count = stored_count
+            self._persisted_tip_hash = tip_hash
+            self._persisted_signatures = set(signatures)
+            self._persisted_keys = set(blockchain.key_registry.to_dict())
+            if self._tx_index_matches(stored_count, tip_hash):
+                self._tx_index_count = stored_count
+                blockchain.tx_index_loader = self.read_tx_index
+            else:
+                self._tx_index_count = 0 # Missing or stale (e.g. crash mid-save): rewritten on the next save
+            print(f"Blockchain data successfully loaded from '{self.directory}' ({stored_count} blocks{', lazily' if lazy else ''}).")
+            return blockchain
+        except (json.JSONDecodeError, IOError) as e:
+            print(f"Error reading block log from '{self.directory}': {e}. A new blockchain may be initialized.")
+            return None
+        except Exception as e:
+            print(f"An unexpected error occurred during loading from '{self.directory}': {e}. A new blockchain may be initialized.")
+            traceback.print_exc()
+            return None
+
+    def load_or_import_json(self, json_filename: str = "blockchain_data.json", miner=None) -> Blockchain | None:
+        """
+        Loads the blockchain from the log; if no log exists yet but a legacy whole-file JSON chain
+        does, that chain is loaded and written into the log (one-time migration).
+        """
+        if self.exists():
+            return self.load(miner=miner)
+        legacy_blockchain = Blockchain.load_from_file(json_filename, miner=miner)
+        if legacy_blockchain is not None:
+            print(f"Migrating '{json_filename}' into block log '{self.directory}'...")
+            self.save(legacy_blockchain)
+        return legacy_blockchain
+
+    def __repr__(self) -> str:
+        return f"BlockLogStorage(directory='{self.directory}', fsync_policy='{self.fsync_policy}')"
+
+
+if __name__ == '__main__':
+    import shutil
+    import sys
+    import tempfile
+    from transaction import Transaction
+    from utils.amounts import COIN
+
+    print("--- Testing BlockLogStorage ---")
+    test_dir = tempfile.mkdtemp(prefix="block_log_test_")
+    try:
+        bc = Blockchain(difficulty=1)
+        bc.create_genesis_block()
+        for _ in range(3):
+            bc.add_transaction(Transaction("welcome_faucet", "ReceiverPEM", 10 * COIN))
+            bc.mine_pending_transactions("MinerPEM")
+        bc.add_transaction(Transaction("welcome_faucet", "ReceiverPEM", 5 * COIN)) # Stays pending
+
+        storage = BlockLogStorage(test_dir, fsync_policy="never", segment_max_bytes=512)
+        storage.save(bc)
+        segment_sizes = [os.path.getsize(p) for p in storage._segment_paths()]
+        assert len(segment_sizes) > 1, "Expected the small segment limit to roll over to new segments."
+
+        bc.mine_pending_transactions("MinerPEM")
+        storage.save(bc)
+        assert [os.path.getsize(p) for p in storage._segment_paths()][:len(segment_sizes) - 1] == segment_sizes[:-1], \
+            "Closed segments must not be rewritten."
+
+        loaded = BlockLogStorage(test_dir).load()
+        assert loaded is not None and [b.hash for b in loaded.chain] == [b.hash for b in bc.chain]
+        assert loaded.get_balance("ReceiverPEM") == bc.get_balance("ReceiverPEM")
+        assert loaded.export_nonce_index() == bc.export_nonce_index()
+        print("Test 1 Passed: Append and reload.")
+
+        assert isinstance(loaded.chain, LazyChain), "Default load should be lazy."
+        assert loaded.chain.index_of_hash(bc.chain[2].hash) == 2, "Hash index lookup failed."
+        eager = BlockLogStorage(test_dir).load(lazy=False)
+        assert eager is not None and [b.hash for b in eager.chain] == [b.hash for b in bc.chain]
+        print("Test 1.1 Passed: Lazy and eager loads agree.")
+
+        assert loaded.tx_index_loader is not None, "Stored transaction index should be used."
+        reward_txid = Transaction.from_dict(bc.chain[3].transactions[0]).txid
+        assert loaded.get_transaction(reward_txid) == bc.get_transaction(reward_txid)
+        assert loaded.get_transaction(reward_txid)['block_index'] == 3, "Equal rewards carry a nonce, so each has its own txid."
+        assert len(loaded.get_address_history("ReceiverPEM")[0]) == len(bc.get_address_history("ReceiverPEM")[0]) == 4
+        print("Test 1.2 Passed: Transaction indexes served from txindex.log.")
+
+        tx_index_path = storage._path("txindex.log")
+        with open(tx_index_path, "rb") as f:
+            last_record = f.read().splitlines()[-1]
+        assert _read_last_line(tx_index_path, chunk_size=7) == last_record, "Last line not found across chunks."
+        with open(tx_index_path, "ab") as f:
+            f.write(b'{"block": 99')
+        assert not BlockLogStorage(test_dir)._tx_index_matches(len(bc.chain), bc.chain[-1].hash), "Torn record accepted."
+        assert BlockLogStorage(test_dir).load().tx_index_loader is None, "A torn txindex.log must not be used."
+        print("Test 1.3 Passed: txindex.log checked from its last record.")
+
+        # Simulate a crash halfway through appending the last record.
+        last_segment = storage._segment_paths()[-1]
+        with open(last_segment, "ab") as f:
+            f.write(RECORD_HEADER.pack(1000, 0) + b'{"index": 99')
+        recovered = BlockLogStorage(test_dir).load()
+        assert recovered is not None and len(recovered.chain) == len(bc.chain), "Torn tail was not truncated."
+        print("Test 2 Passed: Torn tail recovery.")
+
+        mixed_dir = os.path.join(test_dir, "mixed")
+        BlockLogStorage(mixed_dir, fsync_policy="never", record_format="json").save(bc)
+        bc.add_transaction(Transaction("welcome_faucet", "ReceiverPEM", 2**64)) # Beyond int64: JSON record
+        bc.mine_pending_transactions("MinerPEM")
+        bc.add_transaction(Transaction("welcome_faucet", "ReceiverPEM", 250_000_000))
+        bc.mine_pending_transactions("MinerPEM")
+        mixed_storage = BlockLogStorage(mixed_dir, fsync_policy="never")
+        mixed_storage.load()
+        mixed_storage.save(bc)
+        mixed = BlockLogStorage(mixed_dir).load()
+        assert [b.to_dict() for b in mixed.chain] == [b.to_dict() for b in bc.chain], "Mixed JSON/binary records did not round-trip."
+        print("Test 3 Passed: JSON and binary records in one log.")
+
+        # Request threads read a lazily loaded chain while saves append to (and remap) its index.
+        served_storage = BlockLogStorage(os.path.join(test_dir, "served"), fsync_policy="never", segment_max_bytes=512)
+        served_storage.save(bc)
+        served = served_storage.load()
+        served.chain.cache_size = 2 # Constant eviction
+        stored_hashes = [b.hash for b in bc.chain]
+        read_errors, saving = [], threading.Event()
+        def reader():
+            try:
+                while saving.is_set():
+                    for i, block_hash in enumerate(stored_hashes):
+                        assert served.chain[i].hash == block_hash
+                        assert served_storage.index.read_block_dict(len(served_storage.index) - 1)
+            except Exception as e:
+                read_errors.append(repr(e))
+        saving.set()
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6) # Switch threads often enough to interleave reads with remapping
+        readers = [threading.Thread(target=reader) for _ in range(4)]
+        for thread in readers:
+            thread.start()
+        for _ in range(10):
+            served.add_transaction(Transaction("welcome_faucet", "ReceiverPEM", COIN))
+            served.mine_pending_transactions("MinerPEM")
+            served_storage.save(served)
+        saving.clear()
+        for thread in readers:
+            thread.join()
+        sys.setswitchinterval(switch_interval)
+        assert not read_errors, f"Reads raced with save: {read_errors[:3]}"
+        assert len(BlockLogStorage(served_storage.directory).load().chain) == len(bc.chain) + 10
+        print("Test 4 Passed: Reads while saving.")
+
+        # A failed save makes the next one rewrite the log, while the chain keeps reading through the old index.
+        append_tx_index = served_storage._append_tx_index
+        def failing_append(*_args):
+            raise IOError("Simulated full disk")
+        served_storage._append_tx_index = failing_append
+        served.add_transaction(Transaction("welcome_faucet", "ReceiverPEM", COIN))
+        served.mine_pending_transactions("MinerPEM")
+        assert not served_storage.save(served)[0], "A failed save must report it."
+        served_storage._append_tx_index = append_tx_index
+        old_chain = served.chain
+        replacement = Blockchain(difficulty=1)
+        replacement.create_genesis_block()
+        served_storage.save(replacement) # Rewrites again, under a chain still being read
+        assert [b.hash for b in old_chain] == [b.hash for b in served.chain] and len(old_chain) == len(bc.chain) + 11
+        reloaded = BlockLogStorage(served_storage.directory).load()
+        assert reloaded is not None and [b.hash for b in reloaded.chain] == [b.hash for b in replacement.chain]
+        assert served_storage.save(served)[0] # Back to the served chain, rewritten from the blocks it reads
+        assert [b.hash for b in BlockLogStorage(served_storage.directory).load().chain] == [b.hash for b in old_chain]
+        print("Test 5 Passed: Rewrites never remove blocks a chain still reads.")
+
+        # Digests the chain forgot stay in signatures.log until enough of it is stale, then it is rewritten.
+        memo_storage = BlockLogStorage(os.path.join(test_dir, "memo"))
+        memo_storage.save(bc)
+        digests = [f"{i:064x}" for i in range(8)]
+        bc.verified_signatures = set(digests)
+        memo_storage.save(bc)
+        bc.verified_signatures.discard(digests[0])
+        memo_storage.save(bc)
+        assert len(BlockLogStorage(memo_storage.directory).load().verified_signatures) == 8
+        bc.verified_signatures.discard(digests[1])
+        memo_storage.save(bc)
+        assert BlockLogStorage(memo_storage.directory).load().verified_signatures == set(digests[2:])
+        print("Test 6 Passed: Forgotten signature digests compacted away.")
+    finally:
+        shutil.rmtree(test_dir)
+
+    print("\nAll BlockLogStorage self-tests passed!")
@@ -1,14 +1,44 @@
 # transaction.py
 
+import threading
+import time
 from utils.crypto_utils import get_data_to_sign # To prepare data for signing
+from utils.addresses import compact_tx_dict
+from utils.amounts import format_amount, to_units
+from utils.binary_codec import decode_transaction, encode_transaction
+from utils.merkle import hash_transaction
+
+MAX_NONCE = 2**63 - 1 # Nonces are stored as int64 (see utils/binary_codec.py)
+_nonce_lock = threading.Lock()
+_last_nonce = 0
+
+def new_nonce() -> int:
+    """
+    A fresh transaction nonce: microseconds since the epoch, raised past the last one this process
+    handed out, so nonces from one process never repeat and keep increasing. Stays below 2**53,
+    so JavaScript clients read it exactly.
+    """
+    global _last_nonce
+    with _nonce_lock:
+        _last_nonce = max(time.time_ns() // 1000, _last_nonce + 1)
+        return _last_nonce
 
 class Transaction:
     """
     Represents a single transaction in the blockchain.
     Each transaction has a sender (public key), a recipient (public key),
-    an amount, and a signature from the sender.
+    an amount in integer base units (see utils/amounts.py), an optional fee paid to the miner of the
+    block that includes it, a nonce and a signature from the sender.
+    The nonce makes a payment unique independently of its signature (ECDSA signatures can be re-made
+    or malleated into a different txid): a signed transaction's nonce must exceed every earlier one
+    of its sender, and system transactions get a fresh one (see new_nonce) so equal grants differ.
+    Inside blocks the public keys are replaced by their compact addresses (see to_dict(compact=True));
+    the signature always covers the full PEM keys.
     """
-    def __init__(self, sender_public_key: str, recipient_public_key: str, amount: float, signature: str | None = None):
+    __slots__ = ('sender_public_key', 'recipient_public_key', 'amount', 'signature', 'fee', 'nonce')
+
+    def __init__(self, sender_public_key: str, recipient_public_key: str, amount: int, signature: str | None = None,
+                 fee: int = 0, nonce: int | None = None):
         """
         Initializes a new transaction.
 
@@ -16,55 +46,95 @@ class Transaction:
             sender_public_key (str): The public key (PEM format) of the sender.
                                      Can be "network", "welcome_faucet" for system transactions.
             recipient_public_key (str): The public key (PEM format) of the recipient.
-            amount (float): The amount being transferred. Must be positive.
+            amount (int): The amount being transferred, in base units (COIN per coin). Must be positive.
             signature (str | None, optional): The transaction signature (hex string) generated by the sender.
                                               None for system transactions or if signature is to be added later.
+            fee (int, optional): Base units paid to the miner on top of the amount (0 = no fee). Part of the signed data.
+            nonce (int | None, optional): Non-negative number that makes the transaction unique (None only for
+                                          transactions from before nonces existed). Part of the signed data.
         """
         if not isinstance(sender_public_key, str) or not sender_public_key:
             raise ValueError("Sender public key must be a non-empty string.")
         if not isinstance(recipient_public_key, str) or not recipient_public_key:
             raise ValueError("Recipient public key must be a non-empty string.")
-        if not isinstance(amount, (int, float)) or amount <= 0:
-            raise ValueError("Amount must be a positive number.")
+        if not isinstance(amount, int) or isinstance(amount, bool) or amount <= 0:
+            raise ValueError("Amount must be a positive integer number of base units.")
         if signature is not None and (not isinstance(signature, str) or not signature): # Allow empty string for signature if needed? No, should be valid hex or None.
             raise ValueError("Signature, if provided, must be a non-empty hex string.")
+        if not isinstance(fee, int) or isinstance(fee, bool) or fee < 0:
+            raise ValueError("Fee must be a non-negative integer number of base units.")
+        if nonce is not None and (not isinstance(nonce, int) or isinstance(nonce, bool) or not 0 <= nonce <= MAX_NONCE):
+            raise ValueError(f"Nonce must be an integer from 0 to {MAX_NONCE}.")
 
         self.sender_public_key: str = sender_public_key
         self.recipient_public_key: str = recipient_public_key
-        self.amount: float = float(amount)
+        self.amount: int = amount
         self.signature: str | None = signature # Hex string of the signature
+        self.fee: int = fee
+        self.nonce: int | None = nonce
 
     def get_data_for_signing(self) -> str:
         """
         Generates the canonical string representation of the transaction data
         that needs to be signed by the sender. Excludes the signature itself.
         """
-        return get_data_to_sign(self.sender_public_key, self.recipient_public_key, self.amount)
+        return get_data_to_sign(self.sender_public_key, self.recipient_public_key, self.amount, self.fee, self.nonce)
 
-    def to_dict(self) -> dict:
+    def to_dict(self, compact: bool = False) -> dict:
         """
         Returns a dictionary representation of the transaction.
-        Useful for serialization and hashing within a block.
+        With compact=True public keys are replaced by their addresses: the form stored in blocks.
+        The 'fee' key is only present for a non-zero fee and 'nonce' only for a nonce, so older
+        transactions keep their txids.
         """
-        return {
+        tx_dict = {
             'sender_public_key': self.sender_public_key,
             'recipient_public_key': self.recipient_public_key,
             'amount': self.amount,
             'signature': self.signature
         }
+        if self.fee:
+            tx_dict['fee'] = self.fee
+        if self.nonce is not None:
+            tx_dict['nonce'] = self.nonce
+        return compact_tx_dict(tx_dict) if compact else tx_dict
+
+    def to_bytes(self, compact: bool = False) -> bytes:
+        """
+        Binary encoding of to_dict(compact) (see utils/binary_codec.py), always with fee and nonce fields.
+        """
+        return encode_transaction(self.to_dict(compact), nonces=True)
 
     @classmethod
-    def from_dict(cls, tx_data: dict) -> 'Transaction':
+    def from_bytes(cls, data: bytes, key_registry=None) -> 'Transaction':
+        return cls.from_dict(decode_transaction(data, nonces=True)[0], key_registry=key_registry)
+
+    @property
+    def txid(self) -> str:
+        """
+        Deterministic transaction ID: the SHA-256 of the canonical signed transaction in the form
+        it is stored in a block (to_dict(compact=True) serialized with sorted keys), which is also
+        the transaction's Merkle leaf.
+        """
+        return hash_transaction(self.to_dict(compact=True))
+
+    @classmethod
+    def from_dict(cls, tx_data: dict, key_registry=None) -> 'Transaction':
         """
         Creates a Transaction object from a dictionary.
+        If a KeyRegistry is given, addresses are resolved back to their registered public keys
+        (unknown addresses are kept as-is). Legacy float amounts are converted to base units.
         """
         if not all(k in tx_data for k in ['sender_public_key', 'recipient_public_key', 'amount']):
             raise ValueError("Transaction data dictionary is missing required keys.")
+        resolve = key_registry.resolve if key_registry is not None else (lambda identity: identity)
         return cls(
-            sender_public_key=tx_data['sender_public_key'],
-            recipient_public_key=tx_data['recipient_public_key'],
-            amount=float(tx_data['amount']), # Ensure amount is float
-            signature=tx_data.get('signature') # Signature might be None
+            sender_public_key=resolve(tx_data['sender_public_key']),
+            recipient_public_key=resolve(tx_data['recipient_public_key']),
+            amount=to_units(tx_data['amount']),
+            signature=tx_data.get('signature'), # Signature might be None
+            fee=tx_data.get('fee', 0),
+            nonce=tx_data.get('nonce')
         )
 
     def __repr__(self) -> str:
@@ -84,8 +154,9 @@ class Transaction:
             
         sig_status = "N/A" if self.sender_public_key in ["network", "welcome_faucet"] else ("Signed" if self.signature else "Unsigned")
         
+        fee_text = f", Fee: {format_amount(self.fee)}" if self.fee else ""
         return (f"Transaction(From: {short_sender}, To: {short_recipient}, "
-                f"Amount: {self.amount:.4f}, Signature: {sig_status})")
+                f"Amount: {format_amount(self.amount)}{fee_text}, Signature: {sig_status})")
 
     def __eq__(self, other) -> bool:
         if not isinstance(other, Transaction):
@@ -93,9 +164,12 @@ class Transaction:
         return (self.sender_public_key == other.sender_public_key and
                 self.recipient_public_key == other.recipient_public_key and
                 self.amount == other.amount and
-                self.signature == other.signature)
+                self.signature == other.signature and
+                self.fee == other.fee and
+                self.nonce == other.nonce)
 
 if __name__ == '__main__':
+    from utils.amounts import COIN
     from utils.crypto_utils import generate_key_pair, sign_data, verify_signature
 
     print("--- Testing Transaction Class with Signatures ---")
@@ -103,22 +177,22 @@ if __name__ == '__main__':
     alice_priv, alice_pub = generate_key_pair()
     bob_priv, bob_pub = generate_key_pair()
 
-    amount_to_send = 50.12345678
-    data_to_sign_alice = get_data_to_sign(alice_pub, bob_pub, amount_to_send) # Uses .8f precision
+    amount_to_send = 5_012_345_678 # 50.12345678 coins in base units
+    data_to_sign_alice = get_data_to_sign(alice_pub, bob_pub, amount_to_send)
     alice_signature = sign_data(alice_priv, data_to_sign_alice)
 
     tx1 = Transaction(
         sender_public_key=alice_pub,
         recipient_public_key=bob_pub,
-        amount=amount_to_send, # Store full precision
+        amount=amount_to_send,
         signature=alice_signature
     )
-    print(f"Transaction 1: {tx1}") # __repr__ uses .4f for display
-    print(f"Dictionary: {tx1.to_dict()}") # to_dict stores full float precision
+    print(f"Transaction 1: {tx1}")
+    print(f"Dictionary: {tx1.to_dict()}")
 
     is_tx1_valid_sig = verify_signature(
         tx1.sender_public_key,
-        tx1.get_data_for_signing(), # This will use .8f precision
+        tx1.get_data_for_signing(),
         tx1.signature
     )
     print(f"Is Transaction 1 signature valid? {is_tx1_valid_sig}")
@@ -127,7 +201,7 @@ if __name__ == '__main__':
     reward_tx = Transaction(
         sender_public_key="network",
         recipient_public_key=alice_pub,
-        amount=100.0
+        amount=100 * COIN
     )
     print(f"Reward Transaction: {reward_tx}")
     assert reward_tx.signature is None
@@ -137,4 +211,43 @@ if __name__ == '__main__':
     assert tx1 == recreated_tx1, f"Equality failed: {tx1} != {recreated_tx1}"
     print("Transaction.from_dict and __eq__ test PASSED.")
 
+    # A transaction stored before amounts became integers: its float is read as coins
+    legacy_tx = Transaction.from_dict({**tx1_dict, 'amount': 50.12345678})
+    assert legacy_tx == tx1 and verify_signature(alice_pub, legacy_tx.get_data_for_signing(), alice_signature)
+    try:
+        Transaction(alice_pub, bob_pub, 1.5)
+        raise AssertionError("Float amounts must be refused.")
+    except ValueError:
+        pass
+    print("Legacy amount conversion test PASSED.")
+
+    # A fee is signed and stored only when non-zero
+    fee_tx = Transaction(alice_pub, bob_pub, amount_to_send, fee=2_500)
+    fee_tx.signature = sign_data(alice_priv, fee_tx.get_data_for_signing())
+    assert fee_tx.get_data_for_signing() == data_to_sign_alice + "0.00002500"
+    assert fee_tx.to_dict()['fee'] == 2_500 and 'fee' not in tx1_dict
+    assert Transaction.from_dict(fee_tx.to_dict()) == fee_tx and Transaction.from_bytes(fee_tx.to_bytes()) == fee_tx
+    assert Transaction.from_bytes(tx1.to_bytes()) == tx1 and fee_tx.txid != tx1.txid
+    assert not verify_signature(alice_pub, data_to_sign_alice, fee_tx.signature), "The fee must be covered by the signature."
+    print("Fee test PASSED.")
+
+    # A nonce is signed and stored; re-signing the same payment keeps its nonce, not its txid
+    nonce = new_nonce()
+    assert new_nonce() > nonce
+    nonce_tx = Transaction(alice_pub, bob_pub, amount_to_send, nonce=nonce)
+    nonce_tx.signature = sign_data(alice_priv, nonce_tx.get_data_for_signing())
+    assert nonce_tx.get_data_for_signing() == f"{data_to_sign_alice}#{nonce}" and nonce_tx.to_dict()['nonce'] == nonce
+    assert Transaction.from_dict(nonce_tx.to_dict()) == nonce_tx and Transaction.from_bytes(nonce_tx.to_bytes()) == nonce_tx
+    assert 'nonce' not in tx1_dict and Transaction.from_bytes(tx1.to_bytes()).nonce is None
+    assert not verify_signature(alice_pub, data_to_sign_alice, nonce_tx.signature), "The nonce must be covered by the signature."
+    grants = [Transaction("welcome_faucet", bob_pub, 100 * COIN, nonce=new_nonce()) for _ in range(2)]
+    assert grants[0].txid != grants[1].txid, "Equal system grants must differ by nonce."
+    for bad_nonce in (-1, MAX_NONCE + 1, 1.0, True):
+        try:
+            Transaction(alice_pub, bob_pub, 1, nonce=bad_nonce)
+            raise AssertionError(f"Nonce {bad_nonce!r} must be refused.")
+        except ValueError:
+            pass
+    print("Nonce test PASSED.")
+
     print("\nAll Transaction class self-tests passed!")
\ No newline at end of file
@@ -0,0 +1,164 @@
+# utils/addresses.py
+
+import functools
+import hashlib
+import json
+import string
+import threading
+from Cryptodome.IO import PEM
+from Cryptodome.PublicKey import ECC
+
+# An address is the first 160 bits of SHA-256 over the DER encoding of a public key, in hex.
+ADDRESS_HEX_LENGTH = 40
+_HEX_DIGITS = frozenset(string.hexdigits.lower())
+
+def is_address(value) -> bool:
+    """True if value looks like a compact address (40 lowercase hex characters)."""
+    return isinstance(value, str) and len(value) == ADDRESS_HEX_LENGTH and set(value) <= _HEX_DIGITS
+
+def is_public_key_pem(value) -> bool:
+    return isinstance(value, str) and value.lstrip().startswith("-----BEGIN")
+
+@functools.lru_cache(maxsize=4096)
+def public_key_to_address(public_key_pem: str) -> str:
+    """
+    Returns the compact address of a PEM public key. Only the DER bytes are hashed, so the
+    same key gives the same address however its PEM text is wrapped.
+    Raises ValueError if the PEM cannot be decoded.
+    """
+    der, _marker, _encrypted = PEM.decode(public_key_pem.strip())
+    return hashlib.sha256(der).hexdigest()[:ADDRESS_HEX_LENGTH]
+
+@functools.lru_cache(maxsize=4096)
+def canonical_public_key_pem(public_key_pem: str) -> str:
+    """
+    Returns the one PEM text of a public key that transactions sign and registries store: the key
+    re-exported by pycryptodome, as generate_key_pair produces it. Different wrappings or trailing
+    whitespace of the same key have the same address but would not verify the same signatures.
+    Raises ValueError if the PEM does not hold an ECC public key.
+    """
+    return ECC.import_key(public_key_pem).export_key(format='PEM')
+
+def address_of(identity: str) -> str:
+    """
+    Normalizes a transaction party to the form balances and indexes are keyed by: PEM public
+    keys become addresses; addresses and system senders ("network", ...) are returned unchanged.
+    """
+    if is_public_key_pem(identity):
+        try:
+            return public_key_to_address(identity)
+        except ValueError:
+            return identity # Not decodable: keep the raw text as its own identity
+    return identity
+
+def compact_tx_dict(tx_dict: dict) -> dict:
+    """Returns a copy of a transaction dict with sender and recipient public keys replaced by addresses."""
+    compact = dict(tx_dict)
+    for field in ('sender_public_key', 'recipient_public_key'):
+        if field in compact:
+            compact[field] = address_of(compact[field])
+    return compact
+
+
+class KeyRegistry:
+    """
+    Maps addresses back to the PEM public keys they were derived from. Blocks store only
+    addresses, so signatures are verified against the key registered for the address, and a
+    signature only verifies if it covers exactly that PEM text (see signing_form).
+    Entries are self-certifying: a key is only accepted under its own address.
+    """
+    def __init__(self, keys: dict[str, str] | None = None):
+        self._keys: dict[str, str] = {}
+        self._lock = threading.Lock()
+        for address, public_key_pem in (keys or {}).items():
+            # Stored entries are kept as they are: stored signatures were checked against that text.
+            if self.register(public_key_pem, canonical=False) != address:
+                print(f"Warning: Registry entry for {address} does not hold that address's key; ignoring the stated address.")
+
+    def register(self, public_key_pem: str, canonical: bool = True) -> str | None:
+        """
+        Registers a PEM public key and returns its address (None if it is not a decodable PEM). A key
+        seen for the first time is stored in its canonical form (see canonical_public_key_pem) unless
+        canonical=False, e.g. for keys taken from stored blocks. The first text stored for a key stays.
+        """
+        if not is_public_key_pem(public_key_pem):
+            return None
+        try:
+            address = public_key_to_address(public_key_pem)
+        except ValueError:
+            return None
+        with self._lock:
+            if address not in self._keys:
+                self._keys[address] = self._canonical(public_key_pem) if canonical else public_key_pem
+        return address
+
+    @staticmethod
+    def _canonical(public_key_pem: str) -> str:
+        try:
+            return canonical_public_key_pem(public_key_pem)
+        except ValueError:
+            return public_key_pem # Decodable PEM but not an ECC key: nothing can sign for it anyway
+
+    def signing_form(self, public_key_pem: str) -> str:
+        """
+        The PEM text of this key that signatures must cover: the text registered for its address, or
+        its canonical form if it is not registered yet. A transaction naming a key in any other form
+        could be verified when staged but not once its block stores only the address.
+        """
+        try:
+            address = public_key_to_address(public_key_pem)
+        except ValueError:
+            return public_key_pem
+        registered = self._keys.get(address)
+        return registered if registered is not None else self._canonical(public_key_pem)
+
+    def get(self, address: str) -> str | None:
+        return self._keys.get(address)
+
+    def resolve(self, identity: str) -> str:
+        """Returns the registered PEM for an address; anything else (PEMs, system senders, unknown addresses) unchanged."""
+        return self._keys.get(identity, identity) if is_address(identity) else identity
+
+    def __contains__(self, address: str) -> bool:
+        return address in self._keys
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def to_dict(self) -> dict[str, str]:
+        with self._lock:
+            return dict(self._keys)
+
+    def __repr__(self) -> str:
+        return f"KeyRegistry(keys={len(self._keys)})"
+
+
+if __name__ == '__main__':
+    from utils.crypto_utils import generate_key_pair
+
+    print("--- Testing Address Utilities ---")
+    _priv, pub = generate_key_pair()
+    address = public_key_to_address(pub)
+    print(f"Address: {address}")
+    assert is_address(address) and not is_address(pub)
+    assert public_key_to_address(pub.replace("\n", "\r\n") + "\n") == address, "Address must not depend on PEM wrapping."
+    assert address_of(pub) == address and address_of(address) == address and address_of("network") == "network"
+
+    assert canonical_public_key_pem(pub) == pub, "Generated keys must already be canonical."
+    assert canonical_public_key_pem(pub + "\n") == pub and canonical_public_key_pem(pub.replace("\n", "\r\n")) == pub
+
+    registry = KeyRegistry()
+    assert registry.signing_form(pub + "\n") == pub, "An unregistered key signs in its canonical form."
+    assert registry.register(pub + "\n") == address and registry.resolve(address) == pub, "New keys are stored canonically."
+    assert registry.signing_form(pub) == pub and registry.signing_form(pub + "  ") == pub
+    legacy = KeyRegistry({address: pub + "\n"}) # Stored entries keep their text
+    assert legacy.resolve(address) == pub + "\n" and legacy.signing_form(pub) == pub + "\n"
+    assert registry.register("welcome_faucet") is None and registry.resolve("welcome_faucet") == "welcome_faucet"
+    assert KeyRegistry(registry.to_dict()).get(address) == pub
+    assert len(KeyRegistry({"0" * ADDRESS_HEX_LENGTH: pub})) == 1 # Re-filed under its real address
+
+    tx = {'sender_public_key': pub, 'recipient_public_key': 'network', 'amount': 1.0, 'signature': None}
+    assert compact_tx_dict(tx)['sender_public_key'] == address and tx['sender_public_key'] == pub
+    print(f"Compact tx: {len(json.dumps(compact_tx_dict(tx)))} bytes vs {len(json.dumps(tx))} bytes")
+
+    print("\nAll address self-tests passed!")
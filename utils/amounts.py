@@ -0,0 +1,81 @@
+# utils/amounts.py
+
+import math
+from decimal import Decimal, InvalidOperation, ROUND_HALF_EVEN
+
+# Amounts are integers of base units, COIN units to one coin (like satoshis), so sums and balances
+# are exact. Coins only appear at the edges: user input, display and the signed text.
+AMOUNT_DECIMALS = 8
+COIN = 10**AMOUNT_DECIMALS
+
+def parse_amount(value) -> int:
+    """
+    Parses a coin amount typed by a user ("12.5", 12.5 or 12) into base units.
+    Raises ValueError if it is not a finite number or has more than AMOUNT_DECIMALS decimal places.
+    """
+    if isinstance(value, bool):
+        raise ValueError(f"Invalid amount {value!r}.")
+    try:
+        coins = Decimal(str(value).strip()) # str() of a float is its shortest repr: 0.1 -> "0.1"
+    except InvalidOperation:
+        raise ValueError(f"Invalid amount {value!r}.")
+    if not coins.is_finite():
+        raise ValueError(f"Invalid amount {value!r}.")
+    units = coins * COIN
+    if units != units.to_integral_value():
+        raise ValueError(f"Amount {value} has more than {AMOUNT_DECIMALS} decimal places.")
+    return int(units)
+
+def to_units(amount) -> int:
+    """
+    Returns a stored amount in base units. Integers already are; floats are coin amounts written
+    before amounts became integers (legacy chain files) and are rounded to the nearest unit, the
+    same rounding the signed text (format_amount) always used, so their signatures stay valid.
+    """
+    if isinstance(amount, int) and not isinstance(amount, bool):
+        return amount
+    if isinstance(amount, float) and math.isfinite(amount):
+        return int((Decimal(amount) * COIN).to_integral_value(ROUND_HALF_EVEN))
+    raise ValueError(f"Amount must be an integer number of base units, got {amount!r}.")
+
+def format_amount(units: int) -> str:
+    """Exact coin text of a base-unit amount with AMOUNT_DECIMALS places, e.g. 150000000 -> '1.50000000'."""
+    if not isinstance(units, int) or isinstance(units, bool):
+        raise ValueError(f"Amount must be an integer number of base units, got {units!r}.")
+    whole, fraction = divmod(abs(units), COIN)
+    return f"{'-' if units < 0 else ''}{whole}.{fraction:0{AMOUNT_DECIMALS}d}"
+
+def to_coins(units: int) -> float:
+    """Coin value of a base-unit amount as a float, for display only."""
+    return units / COIN
+
+def tx_dict_in_units(tx_dict: dict) -> dict:
+    """Returns a transaction dict with its amount in base units (a copy if a legacy float amount was converted)."""
+    amount = tx_dict.get('amount')
+    if isinstance(amount, float):
+        return {**tx_dict, 'amount': to_units(amount)}
+    return tx_dict
+
+
+if __name__ == '__main__':
+    print("--- Testing Amount Utilities ---")
+    assert parse_amount("12.5") == 1_250_000_000 and parse_amount(0.1) == 10_000_000 and parse_amount(7) == 7 * COIN
+    assert parse_amount("0.00000001") == 1
+    for bad in ("0.000000001", "abc", "nan", float("inf"), True):
+        try:
+            parse_amount(bad)
+            raise AssertionError(f"parse_amount should have refused {bad!r}")
+        except ValueError:
+            pass
+
+    assert to_units(5) == 5 and to_units(10.0) == 10 * COIN
+    assert format_amount(150_000_000) == "1.50000000" and format_amount(-1) == "-0.00000001"
+    # Legacy floats: the converted amount signs to the same text as the float did
+    for legacy in (0.1, 50.12345678, 0.1 + 0.2, 11.120000000000001, 1e-9, 123456.789):
+        assert format_amount(to_units(legacy)) == f"{legacy:.8f}", legacy
+
+    # Float sums drift; base units do not
+    assert sum([0.1] * 10) != 1.0 and sum([to_units(0.1)] * 10) == COIN
+    tx = {'sender_public_key': 'a', 'recipient_public_key': 'b', 'amount': 2.5, 'signature': None}
+    assert tx_dict_in_units(tx)['amount'] == 250_000_000 and tx['amount'] == 2.5
+    print("\nAll amount self-tests passed!")
@@ -0,0 +1,263 @@
+# utils/binary_codec.py
+#
+# Compact, deterministic binary encoding of blocks and transactions (all integers big-endian):
+#
+#   string field  tag 0 = None | tag 1 = lowercase hex, uint16 byte length + raw bytes
+#                 | tag 2 = UTF-8 text, uint32 byte length + bytes
+#   transaction   sender, recipient (string fields), amount (int64 base units, see
+#                 utils/amounts.py), signature (string field)[, fee (int64, 0 = no fee)
+#                 [, nonce (int64, -1 = no nonce)]]
+#   block         FORMAT_MARKER, version (uint8), index (uint64), timestamp (float64),
+#                 nonce (uint64), previous_hash, merkle_root, hash (string fields),
+#                 transaction count (uint32), transactions
+#
+# Hex strings (addresses, hashes, signatures) are stored as raw bytes, which halves them.
+# Blocks from before amounts became integers store float coin amounts; they are written with
+# LEGACY_FORMAT_MARKER, their amounts as int64 base units, and decode back to the same floats.
+# Blocks holding any transaction with a fee are written with FEE_FORMAT_MARKER, and every transaction
+# of such a block carries the fee field. Blocks holding any transaction with a nonce are written with
+# NONCE_FORMAT_MARKER, and every transaction of such a block carries both the fee and the nonce field.
+# decode(encode(x)) == x exactly; values the format cannot reproduce exactly (unknown keys, float
+# amounts with more than 8 decimals, blocks mixing float and integer amounts) raise ValueError
+# so callers can fall back to JSON.
+
+import json
+import math
+import struct
+from utils.amounts import COIN
+
+FORMAT_MARKER = 0xB2 # First byte of an encoded block; JSON payloads start with '{'
+LEGACY_FORMAT_MARKER = 0xB1 # Block whose transactions hold legacy float coin amounts
+FEE_FORMAT_MARKER = 0xB3 # Block whose transactions carry a fee field
+NONCE_FORMAT_MARKER = 0xB4 # Block whose transactions carry a fee and a nonce field
+TX_KEYS = ('sender_public_key', 'recipient_public_key', 'amount', 'signature')
+BLOCK_KEYS = ('index', 'transactions', 'timestamp', 'previous_hash', 'nonce', 'version', 'merkle_root', 'hash')
+
+_TAG_NONE, _TAG_HEX, _TAG_TEXT = 0, 1, 2
+_UINT32 = struct.Struct(">I")
+_INT64 = struct.Struct(">q")
+_BLOCK_FIXED = struct.Struct(">BBQdQ") # marker, version, index, timestamp, nonce
+_HEADER_FIXED = struct.Struct(">BQd") # version, index, timestamp
+NONCE = struct.Struct(">Q")
+_HEX_PREFIX = struct.Struct(">BH") # tag, byte length
+_TEXT_PREFIX = struct.Struct(">BI")
+
+_NONE_FIELD = bytes([_TAG_NONE])
+
+def _encode_str(value: str | None) -> bytes:
+    if value is None:
+        return _NONE_FIELD
+    if not isinstance(value, str):
+        raise ValueError(f"Expected a string or None, got {type(value).__name__}.")
+    if value and len(value) % 2 == 0 and len(value) < 2**17:
+        try:
+            raw = bytes.fromhex(value)
+        except ValueError:
+            raw = None
+        if raw is not None and raw.hex() == value: # Only lowercase hex without whitespace round-trips
+            return _HEX_PREFIX.pack(_TAG_HEX, len(raw)) + raw
+    raw = value.encode('utf-8')
+    return _TEXT_PREFIX.pack(_TAG_TEXT, len(raw)) + raw
+
+def _decode_str(data: bytes, offset: int) -> tuple[str | None, int]:
+    tag = data[offset]
+    if tag == _TAG_HEX:
+        (_tag, length) = _HEX_PREFIX.unpack_from(data, offset)
+        offset += _HEX_PREFIX.size
+        return data[offset:offset + length].hex(), offset + length
+    if tag == _TAG_NONE:
+        return None, offset + 1
+    if tag == _TAG_TEXT:
+        (_tag, length) = _TEXT_PREFIX.unpack_from(data, offset)
+        offset += _TEXT_PREFIX.size
+        return data[offset:offset + length].decode('utf-8'), offset + length
+    raise ValueError(f"Unknown string tag {tag} at offset {offset}.")
+
+def legacy_amount_to_units(amount) -> int:
+    """Converts a legacy float coin amount to base units, raising ValueError if that would not round-trip exactly."""
+    if not isinstance(amount, float) or not math.isfinite(amount):
+        raise ValueError(f"Legacy amount must be a finite float, got {amount!r}.")
+    units = round(amount * COIN)
+    if abs(units) >= 2**63 or units / COIN != amount:
+        raise ValueError(f"Amount {amount!r} has more precision than {COIN} units per coin.")
+    return units
+
+def _encode_amount(amount, legacy: bool) -> bytes:
+    if legacy:
+        return _INT64.pack(legacy_amount_to_units(amount))
+    if not isinstance(amount, int) or isinstance(amount, bool) or not -2**63 <= amount < 2**63:
+        raise ValueError(f"Amount must be an int64 number of base units, got {amount!r}.")
+    return _INT64.pack(amount)
+
+def encode_transaction(tx_dict: dict, legacy: bool = False, fees: bool = False, nonces: bool = False) -> bytes:
+    """
+    Encodes a transaction dictionary; legacy=True for one holding a float coin amount, fees=True to
+    append the fee field (required if the dictionary has a 'fee' key), nonces=True to append the fee
+    and nonce fields (required if it has a 'nonce' key).
+    """
+    fees = fees or nonces
+    optional = set(tx_dict) - set(TX_KEYS)
+    if not set(TX_KEYS) <= set(tx_dict) or not optional <= ({'fee'} if fees else set()) | ({'nonce'} if nonces else set()):
+        raise ValueError(f"Transaction keys {sorted(tx_dict)} do not match the binary format.")
+    encoded = (_encode_str(tx_dict['sender_public_key']) + _encode_str(tx_dict['recipient_public_key']) +
+               _encode_amount(tx_dict['amount'], legacy) + _encode_str(tx_dict['signature']))
+    if not fees:
+        return encoded
+    fee = tx_dict.get('fee')
+    if fee is not None and (legacy or fee == 0): # An explicit zero fee would decode without its key
+        raise ValueError(f"Fee {fee!r} cannot be encoded.")
+    encoded += _encode_amount(fee or 0, False)
+    if not nonces:
+        return encoded
+    nonce = tx_dict.get('nonce')
+    if nonce is not None and (type(nonce) is not int or not 0 <= nonce < 2**63):
+        raise ValueError(f"Nonce {nonce!r} cannot be encoded.")
+    return encoded + _INT64.pack(-1 if nonce is None else nonce)
+
+def decode_transaction(data: bytes, offset: int = 0, legacy: bool = False, fees: bool = False,
+                       nonces: bool = False) -> tuple[dict, int]:
+    """Decodes one transaction starting at offset; returns (transaction dict, offset after it)."""
+    sender, offset = _decode_str(data, offset)
+    recipient, offset = _decode_str(data, offset)
+    (units,) = _INT64.unpack_from(data, offset)
+    signature, offset = _decode_str(data, offset + _INT64.size)
+    tx_dict = {'sender_public_key': sender, 'recipient_public_key': recipient,
+               'amount': units / COIN if legacy else units, 'signature': signature}
+    if fees or nonces:
+        (fee,) = _INT64.unpack_from(data, offset)
+        offset += _INT64.size
+        if fee:
+            tx_dict['fee'] = fee
+    if nonces:
+        (nonce,) = _INT64.unpack_from(data, offset)
+        offset += _INT64.size
+        if nonce >= 0:
+            tx_dict['nonce'] = nonce
+    return tx_dict, offset
+
+def encode_block(block_dict: dict) -> bytes:
+    """Encodes a block dictionary (Block.to_dict())."""
+    if set(block_dict) != set(BLOCK_KEYS):
+        raise ValueError(f"Block keys {sorted(block_dict)} do not match the binary format.")
+    if not isinstance(block_dict['timestamp'], float):
+        raise ValueError("Block timestamp must be a float.")
+    try:
+        return _encode_block_parts(block_dict)
+    except struct.error as e: # Index or nonce out of range
+        raise ValueError(f"Block #{block_dict['index']} cannot be encoded: {e}")
+
+def _encode_block_parts(block_dict: dict) -> bytes:
+    transactions = block_dict['transactions']
+    legacy = bool(transactions) and all(isinstance(tx_dict.get('amount'), float) for tx_dict in transactions)
+    fees = any('fee' in tx_dict for tx_dict in transactions)
+    nonces = any('nonce' in tx_dict for tx_dict in transactions)
+    marker = (LEGACY_FORMAT_MARKER if legacy else NONCE_FORMAT_MARKER if nonces else
+              FEE_FORMAT_MARKER if fees else FORMAT_MARKER)
+    parts = [
+        _BLOCK_FIXED.pack(marker, block_dict['version'], block_dict['index'], block_dict['timestamp'], block_dict['nonce']),
+        _encode_str(block_dict['previous_hash']),
+        _encode_str(block_dict['merkle_root']),
+        _encode_str(block_dict['hash']),
+        _UINT32.pack(len(transactions))
+    ]
+    parts.extend(encode_transaction(tx_dict, legacy, fees, nonces and not legacy) for tx_dict in transactions)
+    return b"".join(parts)
+
+def decode_block(data: bytes) -> dict:
+    marker, version, index, timestamp, nonce = _BLOCK_FIXED.unpack_from(data, 0)
+    if marker not in (FORMAT_MARKER, LEGACY_FORMAT_MARKER, FEE_FORMAT_MARKER, NONCE_FORMAT_MARKER):
+        raise ValueError("Not a binary-encoded block.")
+    legacy, fees, nonces = marker == LEGACY_FORMAT_MARKER, marker == FEE_FORMAT_MARKER, marker == NONCE_FORMAT_MARKER
+    offset = _BLOCK_FIXED.size
+    previous_hash, offset = _decode_str(data, offset)
+    merkle_root, offset = _decode_str(data, offset)
+    block_hash, offset = _decode_str(data, offset)
+    (tx_count,) = _UINT32.unpack_from(data, offset)
+    offset += _UINT32.size
+    transactions = []
+    for _ in range(tx_count):
+        tx_dict, offset = decode_transaction(data, offset, legacy, fees, nonces)
+        transactions.append(tx_dict)
+    return {'index': index, 'transactions': transactions, 'timestamp': timestamp, 'previous_hash': previous_hash,
+            'nonce': nonce, 'version': version, 'merkle_root': merkle_root, 'hash': block_hash}
+
+def encode_block_header(version: int, index: int, timestamp: float, previous_hash: str, merkle_root: str) -> bytes:
+    """
+    Hashed header of a binary-format block, without the nonce. The nonce follows as 8 bytes
+    (NONCE), so miners can hash this prefix once and only feed in the nonce per attempt.
+    """
+    return (_HEADER_FIXED.pack(version, index, float(timestamp)) +
+            _encode_str(previous_hash) + _encode_str(merkle_root))
+
+
+if __name__ == '__main__':
+    import time
+    from utils.addresses import public_key_to_address
+    from utils.crypto_utils import generate_key_pair
+
+    print("--- Testing Binary Codec ---")
+    _priv, pub = generate_key_pair()
+    address = public_key_to_address(pub)
+    transactions = [
+        {'sender_public_key': 'network', 'recipient_public_key': address, 'amount': 100 * COIN, 'signature': None},
+        {'sender_public_key': address, 'recipient_public_key': '0' * 40, 'amount': 5_012_345_678, 'signature': 'ab' * 70},
+        {'sender_public_key': pub, 'recipient_public_key': 'Bob', 'amount': 1, 'signature': 'ABCD'}, # Legacy PEM, text signature
+    ]
+    block_dict = {'index': 7, 'transactions': transactions, 'timestamp': time.time(), 'previous_hash': 'f' * 64,
+                  'nonce': 123456, 'version': 1, 'merkle_root': None, 'hash': '0a' * 32}
+    encoded = encode_block(block_dict)
+    decoded = decode_block(encoded)
+    assert decoded == block_dict, "Block did not round-trip."
+    assert json.dumps(decoded, sort_keys=True) == json.dumps(block_dict, sort_keys=True), "JSON form changed."
+    print(f"Block: {len(encoded)} bytes binary vs {len(json.dumps(block_dict, sort_keys=True))} bytes JSON")
+
+    genesis = {**block_dict, 'index': 0, 'transactions': [], 'previous_hash': '0', 'nonce': 0}
+    assert decode_block(encode_block(genesis)) == genesis
+    for tx_dict in transactions:
+        assert decode_transaction(encode_transaction(tx_dict))[0] == tx_dict
+
+    # Blocks stored before amounts became integers keep their float amounts
+    legacy_block = {**block_dict, 'transactions': [{**tx_dict, 'amount': tx_dict['amount'] / COIN} for tx_dict in transactions]}
+    legacy_encoded = encode_block(legacy_block)
+    assert legacy_encoded[0] == LEGACY_FORMAT_MARKER and decode_block(legacy_encoded) == legacy_block
+    assert json.dumps(decode_block(legacy_encoded), sort_keys=True) == json.dumps(legacy_block, sort_keys=True)
+    for bad_block in ({**legacy_block, 'transactions': legacy_block['transactions'][:1] + transactions[:1]},
+                      {**legacy_block, 'transactions': [{**transactions[0], 'amount': 1.000000001}]}):
+        try:
+            encode_block(bad_block)
+            raise AssertionError("Mixed or over-precise amounts should have been refused.")
+        except ValueError:
+            pass
+
+    # Blocks with fees carry a fee field for every transaction
+    fee_block = {**block_dict, 'transactions': transactions[:1] + [{**transactions[1], 'fee': 2_500}]}
+    fee_encoded = encode_block(fee_block)
+    assert fee_encoded[0] == FEE_FORMAT_MARKER and decode_block(fee_encoded) == fee_block
+    assert encode_block(block_dict)[0] == FORMAT_MARKER, "Blocks without fees keep the plain format."
+    for bad_fee_tx in ({**transactions[1], 'fee': 0}, {**transactions[1], 'fee': 1.5}):
+        try:
+            encode_transaction(bad_fee_tx, fees=True)
+            raise AssertionError(f"Encoding should have been refused: {bad_fee_tx}")
+        except ValueError:
+            pass
+
+    # Blocks with nonces carry a fee and a nonce field for every transaction
+    nonce_block = {**block_dict, 'transactions': [{**transactions[0], 'nonce': 0}, {**transactions[1], 'fee': 2_500, 'nonce': 2**62},
+                                                  transactions[2]]}
+    nonce_encoded = encode_block(nonce_block)
+    assert nonce_encoded[0] == NONCE_FORMAT_MARKER and decode_block(nonce_encoded) == nonce_block
+    for bad_nonce_tx in ({**transactions[1], 'nonce': -1}, {**transactions[1], 'nonce': 2**63}, {**transactions[1], 'nonce': True}):
+        try:
+            encode_transaction(bad_nonce_tx, nonces=True)
+            raise AssertionError(f"Encoding should have been refused: {bad_nonce_tx}")
+        except ValueError:
+            pass
+
+    for bad_tx in ({**transactions[0], 'amount': 1.5}, {**transactions[0], 'amount': 2**63}, {**transactions[0], 'memo': 'x'}):
+        try:
+            encode_transaction(bad_tx)
+            raise AssertionError(f"Encoding should have been refused: {bad_tx}")
+        except ValueError:
+            pass
+
+    print("\nAll binary codec self-tests passed!")
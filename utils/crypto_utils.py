@@ -4,9 +4,78 @@ from Cryptodome.PublicKey import ECC
 from Cryptodome.Signature import DSS
 from Cryptodome.Hash import SHA256
 import binascii # For converting bytes to hex and vice-versa
+import hashlib
+import multiprocessing
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from utils.amounts import format_amount
 
 # Use a common elliptic curve (e.g., NIST P-256)
 CURVE = 'P-256'
+# Default number of parsed keys kept by the key cache
+DEFAULT_KEY_CACHE_SIZE = 256
+
+class KeyCache:
+    """
+    Bounded LRU cache of parsed ECC keys and their DSS signer/verifier objects, keyed by PEM.
+    The same handful of PEM keys is imported over and over (predefined users, CLI wallet),
+    and ECC.import_key is far more expensive than a dictionary lookup.
+    """
+    def __init__(self, maxsize: int = DEFAULT_KEY_CACHE_SIZE):
+        self.maxsize: int = max(0, int(maxsize))
+        self.hits: int = 0
+        self.misses: int = 0
+        self._entries: OrderedDict[str, tuple] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key_pem: str) -> tuple:
+        """
+        Returns (ECC key, DSS object) for the PEM, parsing and caching it on a miss.
+        Raises ValueError (from ECC.import_key) for an invalid PEM; failures are not cached.
+        """
+        with self._lock:
+            entry = self._entries.get(key_pem)
+            if entry is not None:
+                self._entries.move_to_end(key_pem)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        key = ECC.import_key(key_pem)
+        entry = (key, DSS.new(key, 'fips-186-3')) # Randomized k per signature ('deterministic-rfc6979' would fix it)
+        if self.maxsize:
+            with self._lock:
+                self._entries[key_pem] = entry
+                self._entries.move_to_end(key_pem)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, key_pem: str | None = None):
+        """Drops one PEM from the cache, or every entry (and the counters) if none is given."""
+        with self._lock:
+            if key_pem is None:
+                self._entries.clear()
+                self.hits = 0
+                self.misses = 0
+            else:
+                self._entries.pop(key_pem, None)
+
+    def resize(self, maxsize: int):
+        """Changes the size limit, evicting least recently used entries if needed."""
+        with self._lock:
+            self.maxsize = max(0, int(maxsize))
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'size': len(self._entries), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses}
+
+# Process-wide cache used by sign_data and verify_signature
+key_cache = KeyCache()
 
 def generate_key_pair() -> tuple[str, str]:
     """
@@ -29,9 +98,8 @@ def sign_data(private_key_pem: str, data: str) -> str:
     Signs data using the provided private key.
     """
     try:
-        private_key = ECC.import_key(private_key_pem)
+        _private_key, signer = key_cache.get(private_key_pem)
         data_hash = SHA256.new(data.encode('utf-8'))
-        signer = DSS.new(private_key, 'fips-186-3') # Deterministic signatures
         signature = signer.sign(data_hash)
         return binascii.hexlify(signature).decode('ascii')
     except Exception as e:
@@ -44,10 +112,9 @@ def verify_signature(public_key_pem: str, data: str, signature_hex: str) -> bool
     Verifies a signature against the given data and public key.
     """
     try:
-        public_key = ECC.import_key(public_key_pem)
+        _public_key, verifier = key_cache.get(public_key_pem)
         data_hash = SHA256.new(data.encode('utf-8'))
         signature_bytes = binascii.unhexlify(signature_hex)
-        verifier = DSS.new(public_key, 'fips-186-3')
         verifier.verify(data_hash, signature_bytes)
         return True
     except (ValueError, TypeError): # Catches errors from unhexlify or DSS.verify
@@ -56,11 +123,125 @@ def verify_signature(public_key_pem: str, data: str, signature_hex: str) -> bool
         print(f"Unexpected error during verification: {e}")
         return False
 
-def get_data_to_sign(sender_public_key: str, recipient_public_key: str, amount: float) -> str:
+def signature_digest(public_key_pem: str, data: str, signature_hex: str) -> str:
+    """
+    Content address of a (public key, signed data, signature) triple, used to remember
+    signatures that have already been verified. Fields are NUL-separated so that
+    different splits of the same characters cannot collide.
+    """
+    triple = "\x00".join((public_key_pem, data, signature_hex)).encode('utf-8')
+    return hashlib.sha256(triple).hexdigest()
+
+# Fewer signatures than this are verified inline even when workers > 1: one check takes about 2 ms,
+# roughly what a round trip to the pool costs, so the pool only pays off for larger lists.
+PARALLEL_MIN_SIGNATURES = 256
+
+# Process pool shared by every parallel verification (see _verification_pool)
+_pool: ProcessPoolExecutor | None = None
+_pool_workers: int = 0
+_pool_lock = threading.Lock()
+
+def _verification_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Returns the process pool shared by parallel verifications, starting it on first use; asking for
+    more workers than it has replaces it (calls already running finish on the old one). Its processes
+    are spawned, not forked: callers such as the web server are multi-threaded, and a forked child
+    inherits whatever locks other threads held at that moment.
+    """
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or workers > _pool_workers:
+            previous = _pool
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            _pool_workers = workers
+            if previous is not None:
+                previous.shutdown(wait=False)
+        return _pool
+
+def _discard_pool(pool: ProcessPoolExecutor):
+    """Forgets a pool whose worker died (BrokenProcessPool), so the next call starts a new one."""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is pool:
+            _pool, _pool_workers = None, 0
+
+def _first_invalid_in_batch(batch: list[tuple[str, str, str]]) -> int | None:
+    """Returns the offset of the first (public_key_pem, data, signature_hex) job that fails, or None."""
+    for offset, (public_key_pem, data, signature_hex) in enumerate(batch):
+        if not verify_signature(public_key_pem, data, signature_hex):
+            return offset
+    return None
+
+def find_first_invalid_signature(jobs: list[tuple[str, str, str]], workers: int = 1, batch_size: int = 64,
+                                 min_parallel: int = PARALLEL_MIN_SIGNATURES) -> int | None:
+    """
+    Verifies many signatures and returns the index of the first invalid one (in job order),
+    or None if all are valid.
+
+    With workers > 1 the jobs are split into batches verified by the shared process pool. Results
+    are consumed in submission order and the batches after the first failing one are cancelled, so
+    the reported index is the same as a sequential scan would give.
+
+    Args:
+        jobs (list[tuple[str, str, str]]): (public_key_pem, data, signature_hex) triples.
+        workers (int): Number of processes; 1 verifies sequentially.
+        batch_size (int): Number of signatures verified per pool task.
+        min_parallel (int): Fewer jobs than this (or than one batch) are verified sequentially.
+    """
+    if workers <= 1 or len(jobs) <= batch_size or len(jobs) < min_parallel:
+        return _first_invalid_in_batch(jobs)
+
+    batches = [jobs[start:start + batch_size] for start in range(0, len(jobs), batch_size)]
+    pool = _verification_pool(workers)
+    futures = []
+    try:
+        futures = [pool.submit(_first_invalid_in_batch, batch) for batch in batches]
+        for batch_number, future in enumerate(futures):
+            offset = future.result()
+            if offset is not None:
+                return batch_number * batch_size + offset
+        return None
+    except BrokenProcessPool:
+        _discard_pool(pool)
+        return _first_invalid_in_batch(jobs)
+    finally:
+        for future in futures:
+            future.cancel() # Batches after a failure are not needed
+
+def _verify_batch(batch: list[tuple[str, str, str]]) -> list[bool]:
+    return [verify_signature(public_key_pem, data, signature_hex) for public_key_pem, data, signature_hex in batch]
+
+def verify_signatures(jobs: list[tuple[str, str, str]], workers: int = 1, batch_size: int = 64,
+                      min_parallel: int = PARALLEL_MIN_SIGNATURES) -> list[bool]:
+    """
+    Verifies many signatures and returns whether each one is valid, in job order. Unlike
+    find_first_invalid_signature every job is checked, e.g. to accept or reject each transaction of
+    a submitted batch on its own. With workers > 1 and at least min_parallel jobs the batches are
+    verified by the shared process pool.
+    """
+    if workers <= 1 or len(jobs) <= batch_size or len(jobs) < min_parallel:
+        return _verify_batch(jobs)
+
+    batches = [jobs[start:start + batch_size] for start in range(0, len(jobs), batch_size)]
+    pool = _verification_pool(workers)
+    try:
+        return [valid for batch_result in pool.map(_verify_batch, batches) for valid in batch_result]
+    except BrokenProcessPool:
+        _discard_pool(pool)
+        return _verify_batch(jobs)
+
+def get_data_to_sign(sender_public_key: str, recipient_public_key: str, amount: int, fee: int = 0,
+                     nonce: int | None = None) -> str:
     """
     Creates a consistent string representation of transaction data for signing.
+    The amount is in base units and is written as exact coins with 8 decimals (see utils/amounts.py).
+    A fee is appended the same way, only when non-zero, so transactions without a fee sign the same text as before fees existed.
+    A nonce, if given, follows as "#<nonce>"; transactions from before nonces existed sign without it.
     """
-    return f"{sender_public_key}{recipient_public_key}{amount:.8f}" # Fixed precision for float
+    data = f"{sender_public_key}{recipient_public_key}{format_amount(amount)}"
+    if fee:
+        data += format_amount(fee)
+    return data if nonce is None else f"{data}#{nonce}"
 
 
 if __name__ == '__main__':
@@ -70,7 +251,7 @@ if __name__ == '__main__':
     print("Private Key (PEM):\n", priv_key)
     print("\nPublic Key (PEM):\n", pub_key)
 
-    message_data = get_data_to_sign(pub_key, "recipient_pub_key_test", 123.456)
+    message_data = get_data_to_sign(pub_key, "recipient_pub_key_test", 12_345_600_000)
     print(f"\nData to sign: {message_data}")
 
     try:
@@ -86,11 +267,38 @@ if __name__ == '__main__':
         print("Is signature valid (with wrong public key)?", is_valid_wrong_key)
         assert not is_valid_wrong_key
 
-        tampered_data = get_data_to_sign(pub_key, "recipient_pub_key_test", 123.457)
+        tampered_data = get_data_to_sign(pub_key, "recipient_pub_key_test", 12_345_700_000)
         is_valid_tampered_data = verify_signature(pub_key, tampered_data, signature)
         print("Is signature valid (with tampered data)?", is_valid_tampered_data)
         assert not is_valid_tampered_data
         
+        batch_jobs = [(pub_key, message_data, signature)] * 10
+        assert find_first_invalid_signature(batch_jobs, workers=2, batch_size=3) is None and _pool is None, \
+            "A list below min_parallel must be verified inline."
+        assert find_first_invalid_signature(batch_jobs, workers=2, batch_size=3, min_parallel=0) is None
+        batch_jobs[7] = (pub_key, tampered_data, signature)
+        assert find_first_invalid_signature(batch_jobs, workers=2, batch_size=3, min_parallel=0) == 7
+        assert find_first_invalid_signature(batch_jobs, workers=1) == 7
+        expected = [index != 7 for index in range(10)]
+        assert verify_signatures(batch_jobs, workers=2, batch_size=3, min_parallel=0) == expected == verify_signatures(batch_jobs)
+        shared_pool = _verification_pool(2)
+        assert find_first_invalid_signature(batch_jobs, workers=2, batch_size=3, min_parallel=0) == 7 and _verification_pool(2) is shared_pool, \
+            "Parallel verification did not reuse the shared pool."
+        print("Batch verification finds the first invalid signature and checks every signature.")
+
+        key_cache.invalidate()
+        for _ in range(3):
+            assert verify_signature(pub_key, message_data, signature)
+        cache_stats = key_cache.stats()
+        assert cache_stats['misses'] == 1 and cache_stats['hits'] == 2, f"Unexpected key cache stats: {cache_stats}"
+        key_cache.resize(1)
+        verify_signature(pub_key2, message_data, signature)
+        assert key_cache.stats()['size'] == 1, "Key cache exceeded its size limit."
+        key_cache.invalidate(pub_key2)
+        assert key_cache.stats()['size'] == 0
+        key_cache.resize(DEFAULT_KEY_CACHE_SIZE)
+        print(f"Key cache behaves as an LRU: {key_cache.stats()}")
+
         print("\nCrypto utils self-tests passed!")
     except Exception as e:
         print(f"\nError during self-test: {e}")
\ No newline at end of file
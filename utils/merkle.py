@@ -0,0 +1,88 @@
+# utils/merkle.py
+
+import hashlib
+import json
+
+# Root used for a block without transactions (there are no leaves to combine).
+EMPTY_MERKLE_ROOT = "0" * 64
+
+def hash_transaction(tx_dict: dict) -> str:
+    """
+    Returns the SHA-256 hex digest of a transaction dictionary, serialized the same
+    way blocks serialize their content (json.dumps with sort_keys=True).
+    """
+    tx_string = json.dumps(tx_dict, sort_keys=True).encode('utf-8')
+    return hashlib.sha256(tx_string).hexdigest()
+
+def _hash_pair(left_hex: str, right_hex: str) -> str:
+    return hashlib.sha256(bytes.fromhex(left_hex) + bytes.fromhex(right_hex)).hexdigest()
+
+def _next_level(level: list[str]) -> list[str]:
+    """Combines one tree level into the next; an odd last node is paired with itself."""
+    if len(level) % 2 == 1:
+        level = level + [level[-1]]
+    return [_hash_pair(level[i], level[i + 1]) for i in range(0, len(level), 2)]
+
+def compute_merkle_root(tx_hashes: list[str]) -> str:
+    """
+    Computes the Merkle root over a list of transaction hashes (hex strings). Lists that differ only by
+    repeating their last hashes share a root (see _next_level), so callers must reject repeated leaves.
+    """
+    if not tx_hashes:
+        return EMPTY_MERKLE_ROOT
+    level = list(tx_hashes)
+    while len(level) > 1:
+        level = _next_level(level)
+    return level[0]
+
+def build_merkle_proof(tx_hashes: list[str], position: int) -> list[tuple[str, str]]:
+    """
+    Builds an inclusion proof for the transaction at `position`.
+
+    Returns:
+        list[tuple[str, str]]: (sibling_hash, side) pairs from leaf to root, where side
+                               is 'left' or 'right' depending on where the sibling sits.
+    """
+    if not 0 <= position < len(tx_hashes):
+        raise IndexError(f"Transaction position {position} out of range for {len(tx_hashes)} transactions.")
+    proof = []
+    level = list(tx_hashes)
+    while len(level) > 1:
+        if len(level) % 2 == 1:
+            level = level + [level[-1]]
+        if position % 2 == 0:
+            proof.append((level[position + 1], 'right'))
+        else:
+            proof.append((level[position - 1], 'left'))
+        level = _next_level(level)
+        position //= 2
+    return proof
+
+def verify_merkle_proof(tx_hash: str, proof: list[tuple[str, str]], merkle_root: str) -> bool:
+    """Checks that tx_hash is included under merkle_root according to the given proof."""
+    current = tx_hash
+    for sibling_hash, side in proof:
+        if side == 'left':
+            current = _hash_pair(sibling_hash, current)
+        elif side == 'right':
+            current = _hash_pair(current, sibling_hash)
+        else:
+            return False
+    return current == merkle_root
+
+
+if __name__ == '__main__':
+    print("--- Testing Merkle Utilities ---")
+    sample_tx_dicts = [{'sender_public_key': f'S{i}', 'recipient_public_key': f'R{i}', 'amount': float(i), 'signature': None}
+                       for i in range(7)]
+    leaves = [hash_transaction(tx) for tx in sample_tx_dicts]
+    root = compute_merkle_root(leaves)
+    print(f"Merkle root of {len(leaves)} transactions: {root}")
+
+    for pos in range(len(leaves)):
+        assert verify_merkle_proof(leaves[pos], build_merkle_proof(leaves, pos), root), f"Proof failed for position {pos}."
+    assert not verify_merkle_proof(hash_transaction({'tx': 'forged'}), build_merkle_proof(leaves, 0), root)
+    assert compute_merkle_root([leaves[0]]) == leaves[0]
+    assert compute_merkle_root([]) == EMPTY_MERKLE_ROOT
+
+    print("\nAll Merkle self-tests passed!")
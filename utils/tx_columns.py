@@ -0,0 +1,161 @@
+# utils/tx_columns.py
+#
+# Columnar (struct-of-arrays) in-memory store for the transactions of one block. A chain of
+# plain transaction dicts costs several hundred bytes per transaction: the dict itself, an int
+# object, and separate copies of the same address strings in every block. Here each column is
+# one compact container:
+#
+#   senders, recipients   lists of interned strings (every party string is stored once)
+#   amounts               array('q') of base units (a plain list for legacy float amounts)
+#   signatures            raw bytes of all hex signatures in one blob + array of end offsets
+#   fees                  array('q') of base units, 0 = no 'fee' key (None if no transaction has a fee)
+#   nonces                array('q'), -1 = no 'nonce' key (None if no transaction has a nonce)
+#
+# Items are rebuilt on access as dicts equal to the ones stored, so hashes, txids, Merkle
+# leaves and JSON output do not change.
+
+import sys
+from array import array
+from collections.abc import Sequence
+
+from utils.binary_codec import TX_KEYS
+
+_TX_KEY_SET = frozenset(TX_KEYS)
+_TX_KEY_SETS = (_TX_KEY_SET, _TX_KEY_SET | {'fee'}, _TX_KEY_SET | {'nonce'}, _TX_KEY_SET | {'fee', 'nonce'})
+_INT64_RANGE = range(-2**63, 2**63)
+
+class TransactionColumns(Sequence):
+    """
+    Read-only sequence of transaction dicts stored column by column.
+    Build one with from_dicts(), which returns None for transactions the columns cannot reproduce
+    exactly (unexpected keys, non-string parties, signatures that are not lowercase hex);
+    callers keep those as a plain list.
+    """
+    __slots__ = ('_senders', '_recipients', '_amounts', '_signatures', '_signature_ends', '_fees', '_nonces')
+
+    def __init__(self, senders: list[str], recipients: list[str], amounts, signatures: bytes, signature_ends: array,
+                 fees: array | None = None, nonces: array | None = None):
+        self._senders = senders
+        self._recipients = recipients
+        self._amounts = amounts
+        self._signatures = signatures
+        self._signature_ends = signature_ends # Zero-length slice = no signature (None)
+        self._fees = fees
+        self._nonces = nonces
+
+    @classmethod
+    def from_dicts(cls, tx_dicts) -> 'TransactionColumns | None':
+        senders, recipients, amounts, fees, nonces = [], [], [], array('q'), array('q')
+        signatures, signature_ends = bytearray(), array('L')
+        for tx_dict in tx_dicts:
+            if not isinstance(tx_dict, dict) or tx_dict.keys() not in _TX_KEY_SETS:
+                return None
+            fee, nonce = tx_dict.get('fee'), tx_dict.get('nonce')
+            if fee is not None and (type(fee) is not int or not 0 < fee < 2**63): # A zero fee would come back without its key
+                return None
+            if nonce is not None and (type(nonce) is not int or not 0 <= nonce < 2**63):
+                return None
+            sender, recipient, signature = tx_dict['sender_public_key'], tx_dict['recipient_public_key'], tx_dict['signature']
+            if type(sender) is not str or type(recipient) is not str:
+                return None
+            if signature is not None:
+                if type(signature) is not str or not signature:
+                    return None
+                try:
+                    raw = bytes.fromhex(signature)
+                except ValueError:
+                    return None
+                if raw.hex() != signature: # Uppercase or spaced hex would not come back the same
+                    return None
+                signatures += raw
+            senders.append(sys.intern(sender))
+            recipients.append(sys.intern(recipient))
+            amounts.append(tx_dict['amount'])
+            fees.append(fee or 0)
+            nonces.append(-1 if nonce is None else nonce)
+            signature_ends.append(len(signatures))
+        if all(type(amount) is int and amount in _INT64_RANGE for amount in amounts):
+            amounts = array('q', amounts)
+        return cls(senders, recipients, amounts, bytes(signatures), signature_ends, fees if any(fees) else None,
+                   nonces if any(nonce >= 0 for nonce in nonces) else None)
+
+    def transfer_columns(self) -> tuple[list[str], list[str], Sequence, array | None]:
+        """Returns the (senders, recipients, amounts, fees) columns as stored, without rebuilding any dicts; fees is None if no transaction has one."""
+        return self._senders, self._recipients, self._amounts, self._fees
+
+    def _signature(self, position: int) -> str | None:
+        start = self._signature_ends[position - 1] if position else 0
+        end = self._signature_ends[position]
+        return self._signatures[start:end].hex() if end > start else None
+
+    def _item(self, position: int) -> dict:
+        tx_dict = {'sender_public_key': self._senders[position], 'recipient_public_key': self._recipients[position],
+                   'amount': self._amounts[position], 'signature': self._signature(position)}
+        if self._fees is not None and self._fees[position]:
+            tx_dict['fee'] = self._fees[position]
+        if self._nonces is not None and self._nonces[position] >= 0:
+            tx_dict['nonce'] = self._nonces[position]
+        return tx_dict
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self._item(i) for i in range(*position.indices(len(self)))]
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError("transaction index out of range")
+        return self._item(position)
+
+    def __iter__(self):
+        for position in range(len(self)):
+            yield self._item(position)
+
+    def __len__(self) -> int:
+        return len(self._senders)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (TransactionColumns, list)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return f"TransactionColumns(transactions={len(self)}, signature_bytes={len(self._signatures)})"
+
+
+if __name__ == '__main__':
+    import json
+
+    print("--- Testing TransactionColumns ---")
+    tx_dicts = [
+        {'sender_public_key': 'network', 'recipient_public_key': 'ab' * 20, 'amount': 100 * 10**8, 'signature': None},
+        {'sender_public_key': 'ab' * 20, 'recipient_public_key': 'cd' * 20, 'amount': 12_345, 'signature': '3045' + '0f' * 68},
+        {'recipient_public_key': 'cd' * 20, 'sender_public_key': 'ab' * 20, 'amount': 1, 'signature': '00'}, # Any key order
+    ]
+    columns = TransactionColumns.from_dicts(tx_dicts)
+    assert columns is not None and len(columns) == 3
+    assert list(columns) == tx_dicts and columns == tx_dicts and columns[-1] == tx_dicts[-1] and columns[1:] == tx_dicts[1:]
+    assert [json.dumps(tx, sort_keys=True) for tx in columns] == [json.dumps(tx, sort_keys=True) for tx in tx_dicts]
+    assert columns[0]['recipient_public_key'] is columns[1]['sender_public_key'], "Parties should be interned."
+    assert len(TransactionColumns.from_dicts([])) == 0
+    senders, recipients, amounts, fees = columns.transfer_columns()
+    assert list(amounts) == [tx['amount'] for tx in tx_dicts] and senders[0] == 'network' and fees is None
+
+    with_fee = [tx_dicts[0], {**tx_dicts[1], 'fee': 2_500}]
+    fee_columns = TransactionColumns.from_dicts(with_fee)
+    assert list(fee_columns) == with_fee and list(fee_columns.transfer_columns()[3]) == [0, 2_500]
+
+    with_nonce = [{**tx_dicts[0], 'nonce': 0}, {**tx_dicts[1], 'fee': 2_500, 'nonce': 2**62}, tx_dicts[2]]
+    assert list(TransactionColumns.from_dicts(with_nonce)) == with_nonce
+
+    legacy = [{**tx_dicts[0], 'amount': 100.0}, {**tx_dicts[1], 'amount': 0.5}]
+    assert list(TransactionColumns.from_dicts(legacy)) == legacy, "Float amounts must come back as floats."
+    assert list(TransactionColumns.from_dicts([{**tx_dicts[1], 'amount': 2**64}])) == [{**tx_dicts[1], 'amount': 2**64}]
+
+    for unsupported in ({**tx_dicts[1], 'signature': 'sig123'}, {**tx_dicts[1], 'signature': 'ABCD'},
+                        {**tx_dicts[1], 'signature': ''}, {**tx_dicts[1], 'memo': 'x'}, {**tx_dicts[1], 'sender_public_key': None},
+                        {**tx_dicts[1], 'fee': 0}, {**tx_dicts[1], 'fee': 1.5}, {**tx_dicts[1], 'nonce': -1},
+                        {**tx_dicts[1], 'nonce': '7'}):
+        assert TransactionColumns.from_dicts([tx_dicts[0], unsupported]) is None, unsupported
+    print("\nAll TransactionColumns self-tests passed!")